@@ -1,13 +1,24 @@
 import numpy as np
-import math
+
+from envs.game_elements import DX, DY
+from agents.features import BOX, nearest_enemy_features
+
+DIRECTIONS = list(zip(DX.tolist(), DY.tolist()))
 
 
 class QTable:
-    def __init__(self, num_distances_manhattan,action_space_size,num_orientations_kronecker=2):
+    # trace_decay > 0: update_batch does Watkins Q(lambda), with one eligibility trace table per
+    # row of the batch (row i = environment i of a vector env, transitions in time order);
+    # traces are cut after an exploratory action and at the end of an episode.
+    # With trace_decay = 0 (default) update_batch is one-step Q-learning on any set of
+    # transitions (e.g. a replay sample).
+    def __init__(self, num_distances_manhattan,action_space_size,num_orientations_kronecker=2, trace_decay=0.0):
         self.state_space_dimension_a = num_distances_manhattan
         self.state_space_dimension_b = num_orientations_kronecker
         self.action_space_size = action_space_size
         self.q_table = np.zeros((num_distances_manhattan, num_orientations_kronecker, action_space_size))
+        self.trace_decay = trace_decay
+        self.traces = None # (num_envs, distances, orientations, actions), allocated at the first update
 
     def get_q_value(self, distance, orientation, action):
         return self.q_table[distance, orientation, action]
@@ -32,77 +43,87 @@ class QTable:
         new_q_value = current_q_value + learning_rate * (reward + discount_factor * max_future_q_value - current_q_value)
         self.set_q_value(distance, orientation, action, new_q_value)
 
+    ##################### batched versions #####################
+
+    def choose_actions(self, distances, orientations, epsilon):
+        # epsilon-greedy for a whole vector of states, one action per row
+        distances = np.asarray(distances)
+        orientations = np.asarray(orientations)
+        n = len(distances)
+        actions = np.argmax(self.q_table[distances, orientations], axis=-1)
+        explore = np.random.rand(n) < epsilon
+        if explore.any():
+            actions[explore] = np.random.randint(self.action_space_size, size=int(explore.sum()))
+        return actions
+
+    def update_batch(self, distances, orientations, actions, learning_rate, rewards, discount_factor,
+                     next_distances, next_orientations, dones=None, discounts=None):
+        # TD updates for arrays of transitions, returns the TD errors.
+        # All the errors are computed from the table before the update, and transitions sharing a
+        # (state, action) all add their own correction (np.add.at), as if applied one after the other
+        # with the same starting values.
+        # dones: no bootstrap after a terminal transition (default: always bootstrap, like update_q_value)
+        # discounts: per transition discount (e.g. the n-step discounts of a replay sample),
+        # replaces discount_factor
+        distances = np.asarray(distances)
+        orientations = np.asarray(orientations)
+        actions = np.asarray(actions)
+        gamma = discount_factor if discounts is None else np.asarray(discounts)
+        max_future = self.q_table[next_distances, next_orientations].max(axis=-1)
+        if dones is not None:
+            max_future = np.where(dones, 0, max_future)
+        q_values = self.q_table[distances, orientations]
+        current = q_values[np.arange(len(actions)), actions]
+        td_errors = np.asarray(rewards) + gamma * max_future - current
+
+        if self.trace_decay > 0:
+            self._update_traces(distances, orientations, actions, q_values, current, learning_rate, gamma, td_errors, dones)
+        else:
+            np.add.at(self.q_table, (distances, orientations, actions), learning_rate * td_errors)
+        return td_errors
+
+    def _update_traces(self, distances, orientations, actions, q_values, current, learning_rate, gamma, td_errors, dones):
+        n = len(actions)
+        if self.traces is None or len(self.traces) != n:
+            self.traces = np.zeros((n,) + self.q_table.shape)
+        rows = np.arange(n)
+        # decay of the previous steps, cut if this action was exploratory (Watkins)
+        greedy = current == q_values.max(axis=-1)
+        decay = np.where(greedy, np.broadcast_to(gamma * self.trace_decay, (n,)), 0)
+        self.traces *= decay[:, None, None, None]
+        self.traces[rows, distances, orientations, actions] = 1 # replacing traces
+        self.q_table += learning_rate * np.tensordot(td_errors, self.traces, axes=1)
+        if dones is not None:
+            self.traces[np.asarray(dones, dtype=bool)] = 0
+
+    def reset_traces(self):
+        self.traces = None
+
 def manhattan_distance(x1, y1, x2, y2):
     return abs(x1 - x2) + abs(y1 - y2)
 
 
-
-def calculer_vecteur_directeur_normalise(x1, y1, x2, y2):
-    """
-    Calcule et normalise le vecteur directeur entre les points (x1, y1) et (x2, y2).
-    """
-    # Calcul du vecteur directeur
-    dx = x2 - x1
-    dy = y2 - y1
-    
-    # Calcul de la norme du vecteur
-    norme = math.sqrt(dx**2 + dy**2)
-    
-    # Normalisation du vecteur
-    if norme == 0:
-        return  (0, 0)  # Gestion du cas où les deux points sont les mêmes
-    else:
-        vecteur_directeur = (dx, dy)
-        vecteur_directeur_normalise = (dx / norme, dy / norme)
-        return vecteur_directeur_normalise
-
-def scalar_product(vector1, vector2):
-    # Ensure vectors have the same dimension
-    if len(vector1) != len(vector2):
-        raise ValueError("Vectors must have the same dimension")
-    
-    # Calculate the scalar product
-    product = sum(x * y for x, y in zip(vector1, vector2))
-    
-    return product
-
-
 def grab_distance_and_kronecker(state):   #takes state as decribed in tan_env.py and returns distance between player and closest enemy
-    Tank_player=state['player']
-    x_player,y_player,direction_player,label=Tank_player.info()
-    list_enemies=list(state['enemies'])
-
-    if len(list_enemies)>0:
-        closest_enemy=list_enemies[0]
-        x_enemy,y_enemy,direction_enemy,label_enemy=closest_enemy.info()
-        d_min=manhattan_distance(x_player,x_enemy,y_player,y_enemy)
-
-        for enemy in list_enemies:
-            x_enemy,y_enemy,direction_enemy,label_enemy=enemy.info()
-            if manhattan_distance(x_player,x_enemy,y_player,y_enemy)<d_min:
-                d_min=manhattan_distance(x_player,x_enemy,y_player,y_enemy)
-                closest_enemy=enemy
-
-        x_enemy,y_enemy,direction_enemy,label_enemy=closest_enemy.info()
-        boxe= [(enemy.x + i, enemy.y + j) for i in range(-2, 3) for j in range(-2, 3)]
-
-        if np.argmax(direction_player)==0:
-            orientation_vector=(0,1)
-        if np.argmax(direction_player)==1:
-            orientation_vector=(1,0)
-        if np.argmax(direction_player)==2:
-            orientation_vector=(0,-1)
-        if np.argmax(direction_player)==3:
-            orientation_vector=(-1,0)
-        
-        list_scalar_product=[0]
-        for pos_x,pos_y in boxe:
-            direction_vector=calculer_vecteur_directeur_normalise(x_player, y_player, pos_x, pos_y)  #calculate director vector to get direction player_enemy for each pixel of enemy
-            list_scalar_product.append(scalar_product(orientation_vector,direction_vector))
-        
-        kronecker=0
-        if 1 in list_scalar_product:
-            kronecker=1
-        return d_min,kronecker
-    else:
-        return 0,0
\ No newline at end of file
+    # (distance, kronecker): Manhattan distance to the closest enemy, and 1 if that enemy is in the
+    # line of fire of the player (see agents/features.py, batched version: nearest_enemy_features)
+    player = state['player']
+    if isinstance(player, np.ndarray):
+        # observation dict (obs_mode='array')
+        distance, aligned = nearest_enemy_features(player, state['enemies'], state['enemies_mask'])
+        return int(distance), int(aligned)
+
+    enemies = state['enemies']
+    indices = enemies.indices()
+    if len(indices) == 0:
+        return 0, 0
+    x_player, y_player, direction_player, _ = player.info()
+    d_min, dx_min, dy_min = None, 0, 0
+    for x_enemy, y_enemy in zip(enemies.x[indices].tolist(), enemies.y[indices].tolist()):
+        d = manhattan_distance(x_player, y_player, x_enemy, y_enemy)
+        if d_min is None or d < d_min:
+            d_min, dx_min, dy_min = d, x_enemy - x_player, y_enemy - y_player
+    dx, dy = DIRECTIONS[direction_player]
+    forward = dx_min * dx + dy_min * dy
+    lateral = dx_min * dy - dy_min * dx
+    kronecker = int(abs(lateral) <= BOX and forward + BOX >= 1)
+    return d_min, kronecker
@@ -0,0 +1,88 @@
+import numpy as np
+
+from envs.game_elements import DX, DY
+
+# an enemy is in the line of fire when one cell of its 5x5 box (center +- 2, the box used for hits)
+# lies on the half-line in front of the player
+BOX = 2
+
+
+def _closest(player, enemies, mask):
+    # distance and offset (dx, dy) of the closest valid enemy (first one by slot on ties), whether
+    # there is one, and its row in enemies
+    player = np.asarray(player)
+    enemies = np.asarray(enemies)
+    mask = np.asarray(mask, dtype=bool)
+    batch = player.shape[:-1]
+    if enemies.shape[-2] == 0:
+        zeros = np.zeros(batch, dtype=np.int64)
+        return zeros, zeros, zeros, np.zeros(batch, dtype=bool), zeros
+    dx = enemies[..., 0] - player[..., None, 0]
+    dy = enemies[..., 1] - player[..., None, 1]
+    # invalid rows never win
+    distances = np.where(mask, np.abs(dx) + np.abs(dy), np.iinfo(dx.dtype).max)
+    closest = np.argmin(distances, axis=-1)[..., None]
+    any_enemy = mask.any(axis=-1)
+    distance = np.where(any_enemy, np.take_along_axis(distances, closest, axis=-1)[..., 0], 0)
+    dx = np.take_along_axis(dx, closest, axis=-1)[..., 0]
+    dy = np.take_along_axis(dy, closest, axis=-1)[..., 0]
+    return distance, dx, dy, any_enemy, closest[..., 0]
+
+
+def nearest_enemy_features(player, enemies, mask):
+    # player (..., 3): x, y, direction, enemies (..., E, 3), mask (..., E): valid enemies
+    # (the fields of an observation, or of a batch of observations from VecTankEnv).
+    # Returns (distance, aligned), int arrays of shape (...):
+    #   distance: Manhattan distance to the closest enemy (first one by slot on ties), 0 without enemy
+    #   aligned: 1 if the closest enemy is in the line of fire of the player
+    # integer arithmetic only, all the enemies of all the environments at once
+    distance, dx, dy, any_enemy, _ = _closest(player, enemies, mask)
+    direction = np.asarray(player)[..., 2]
+    # offset in the frame of the player: forward component and lateral one
+    forward = dx * DX[direction] + dy * DY[direction]
+    lateral = dx * DY[direction] - dy * DX[direction]
+    aligned = any_enemy & (np.abs(lateral) <= BOX) & (forward + BOX >= 1)
+    return distance, aligned.astype(distance.dtype)
+
+
+class FeatureTable:
+    # nearest_enemy_features with the line-of-fire test read from a table indexed by
+    # (direction, dx, dy) of the closest enemy, precomputed for every offset of the grid
+    def __init__(self, max_x, max_y):
+        self.max_x = max_x
+        self.max_y = max_y
+        dx = np.arange(-max_x, max_x + 1)[:, None]
+        dy = np.arange(-max_y, max_y + 1)[None, :]
+        self.aligned = np.zeros((4, 2 * max_x + 1, 2 * max_y + 1), dtype=np.uint8)
+        for direction in range(4):
+            forward = dx * DX[direction] + dy * DY[direction]
+            lateral = dx * DY[direction] - dy * DX[direction]
+            self.aligned[direction] = (np.abs(lateral) <= BOX) & (forward + BOX >= 1)
+
+    def features(self, player, enemies, mask):
+        # same results as nearest_enemy_features
+        distance, dx, dy, any_enemy, _ = _closest(player, enemies, mask)
+        aligned = self.aligned[np.asarray(player)[..., 2], dx + self.max_x, dy + self.max_y]
+        return distance, np.where(any_enemy, aligned, 0).astype(distance.dtype)
+
+
+def state_arrays(state):
+    # (player, enemies, mask) arrays of a TankEnv state dict (or of an observation dict)
+    player = state['player']
+    if isinstance(player, np.ndarray):
+        return player, state['enemies'], state['enemies_mask']
+    pool = state['enemies']
+    indices = pool.indices()
+    enemies = np.stack([pool.x[indices], pool.y[indices], pool.direction[indices]], axis=-1)
+    return np.array([player.x, player.y, player.direction]), enemies, np.ones(len(indices), dtype=bool)
+
+
+def projectile_arrays(state):
+    # (projectiles, mask) arrays of a TankEnv state dict (or of an observation dict):
+    # projectiles (..., P, 4): x, y, direction, label
+    pool = state['projectiles']
+    if isinstance(pool, np.ndarray):
+        return pool, state['projectiles_mask']
+    indices = pool.indices()
+    projectiles = np.stack([pool.x[indices], pool.y[indices], pool.direction[indices], pool.label[indices]], axis=-1)
+    return projectiles, np.ones(len(indices), dtype=bool)
@@ -0,0 +1,395 @@
+import numpy as np
+
+from envs.game_elements import DX, DY
+from agents.features import BOX, _closest, nearest_enemy_features, projectile_arrays, state_arrays
+
+# Tabular Q-learning on a configurable state: a Discretizer turns states into tuples of bounded
+# integer features, flattened into one index (mixed radix, no collision), and the Q-values live
+# either in a dense array (all the states) or in a sparse hash table (only the states seen).
+#
+#   discretizer = Discretizer([nearest_distance(40), nearest_aligned()]) # the state of QTable
+#   discretizer = Discretizer([nearest_distance(40), nearest_aligned(), nearest_heading(),
+#                              incoming_projectile(4), wall_distance(20, 20, 4)])
+#   agent = TabularQ(discretizer, 6, storage='sparse')
+#   states = discretizer.encode_batch(obs)  # VecTankEnv observations, or encode(env.state)
+#   actions = agent.choose_actions(states, epsilon)
+
+
+##################### features #####################
+
+class Feature:
+    # bounded feature: function(obs) -> integers in [0, size), obs being a dict of arrays
+    # (player, enemies, enemies_mask, projectiles, projectiles_mask), batched or not
+    def __init__(self, name, size, function):
+        self.name = name
+        self.size = size
+        self.function = function
+
+    def __call__(self, obs):
+        return np.clip(self.function(obs), 0, self.size - 1)
+
+    def __repr__(self):
+        return f'Feature({self.name!r}, {self.size})'
+
+
+def _nearest(obs):
+    # distance, dx, dy, any enemy and row of the closest enemy, computed once per encode
+    if '_nearest' not in obs:
+        obs['_nearest'] = _closest(obs['player'], obs['enemies'], obs['enemies_mask'])
+    return obs['_nearest']
+
+
+def nearest_distance(max_distance):
+    # Manhattan distance to the closest enemy, max_distance and more in the last value
+    return Feature(f'nearest_distance{max_distance}', max_distance + 1, lambda obs: _nearest(obs)[0])
+
+
+def nearest_aligned():
+    # 1 if the closest enemy is in the line of fire (grab_distance_and_kronecker)
+    def aligned(obs):
+        return nearest_enemy_features(obs['player'], obs['enemies'], obs['enemies_mask'])[1]
+    return Feature('nearest_aligned', 2, aligned)
+
+
+def nearest_bearing():
+    # where the closest enemy is, in the frame of the player: 0 no enemy, 1 front, 2 right, 3 back, 4 left
+    # (largest component of the offset, front/back on ties)
+    def bearing(obs):
+        _, dx, dy, any_enemy, _ = _nearest(obs)
+        direction = np.asarray(obs['player'])[..., 2]
+        forward = dx * DX[direction] + dy * DY[direction]
+        lateral = dx * DY[direction] - dy * DX[direction] # > 0: left of the player
+        side = np.where(np.abs(forward) >= np.abs(lateral), np.where(forward >= 0, 1, 3), np.where(lateral > 0, 4, 2))
+        return np.where(any_enemy, side, 0)
+    return Feature('nearest_bearing', 5, bearing)
+
+
+def nearest_heading():
+    # direction of the closest enemy relative to the player's: 0 no enemy, 1 same, 2 right, 3 opposite, 4 left
+    def heading(obs):
+        _, _, _, any_enemy, closest = _nearest(obs)
+        enemies = np.asarray(obs['enemies'])
+        if enemies.shape[-2] == 0:
+            return np.zeros(any_enemy.shape, dtype=np.int64)
+        player = np.asarray(obs['player'])
+        direction = np.take_along_axis(enemies[..., 2], closest[..., None], axis=-1)[..., 0]
+        return np.where(any_enemy, 1 + (direction - player[..., 2]) % 4, 0)
+    return Feature('nearest_heading', 5, heading)
+
+
+def player_direction():
+    return Feature('player_direction', 4, lambda obs: np.asarray(obs['player'])[..., 2])
+
+
+def incoming_projectile(horizon):
+    # steps before the first enemy projectile heading for the player enters its 5x5 box
+    # (1..horizon), 0 if none within horizon steps
+    def incoming(obs):
+        player = np.asarray(obs['player'])
+        projectiles = np.asarray(obs['projectiles'])
+        if projectiles.shape[-2] == 0:
+            return np.zeros(player.shape[:-1], dtype=np.int64)
+        direction = projectiles[..., 2]
+        rx = projectiles[..., 0] - player[..., None, 0]
+        ry = projectiles[..., 1] - player[..., None, 1]
+        # position along the motion (towards the player: negative) and across it
+        along = rx * DX[direction] + ry * DY[direction]
+        across = rx * DY[direction] - ry * DX[direction]
+        steps = np.maximum(1, -BOX - along)
+        hits = (np.asarray(obs['projectiles_mask'], dtype=bool) & (projectiles[..., 3] == 1)
+                & (np.abs(across) <= BOX) & (along + steps <= BOX) & (steps <= horizon))
+        return np.where(hits, steps, horizon + 1).min(axis=-1) % (horizon + 1)
+    return Feature(f'incoming_projectile{horizon}', horizon + 1, incoming)
+
+
+def wall_distance(max_x, max_y, max_distance):
+    # free cells between the player and the border in front of it, max_distance and more in the last value
+    def wall(obs):
+        player = np.asarray(obs['player'])
+        x, y, direction = player[..., 0], player[..., 1], player[..., 2]
+        room = np.stack([y, max_x - 1 - x, max_y - 1 - y, x], axis=-1)
+        return np.take_along_axis(room, direction[..., None], axis=-1)[..., 0]
+    return Feature(f'wall_distance{max_distance}', max_distance + 1, wall)
+
+
+class Discretizer:
+    # tuple of bounded features -> one integer index in [0, num_states), the features being the
+    # digits of a mixed-radix number (first feature = most significant)
+    def __init__(self, features):
+        self.features = list(features)
+        self.sizes = np.array([f.size for f in self.features], dtype=np.int64)
+        num_states = 1
+        for size in self.sizes.tolist():
+            num_states *= size
+        if num_states >= 2 ** 63:
+            raise ValueError(f"{num_states} states do not fit in an int64 index")
+        self.num_states = num_states
+        # weight of each digit
+        self.strides = np.append(np.cumprod(self.sizes[:0:-1])[::-1], 1).astype(np.int64)
+
+    @property
+    def names(self):
+        return [f.name for f in self.features]
+
+    def features_of(self, obs):
+        # (..., num_features) array of feature values
+        obs = dict(obs) # the features share cached intermediate results in it
+        return np.stack([np.asarray(f(obs), dtype=np.int64) for f in self.features], axis=-1)
+
+    def encode_batch(self, obs):
+        # observation dict with batch dimensions (VecTankEnv, or stacked obs_mode='array' observations)
+        return self.features_of(obs) @ self.strides
+
+    def encode(self, state):
+        # one TankEnv state ('state' mode) or observation dict ('array' mode)
+        player, enemies, mask = state_arrays(state)
+        projectiles, projectiles_mask = projectile_arrays(state)
+        obs = {'player': player, 'enemies': enemies, 'enemies_mask': mask,
+               'projectiles': projectiles, 'projectiles_mask': projectiles_mask}
+        return int(self.features_of(obs) @ self.strides)
+
+    def decode(self, states):
+        # feature values of state indices, (..., num_features)
+        states = np.asarray(states, dtype=np.int64)
+        return states[..., None] // self.strides % self.sizes
+
+
+##################### storage #####################
+
+class DenseQStorage:
+    # one row of Q-values per state, allocated at once
+    def __init__(self, num_states, num_actions, initial_value=0.0, dtype=np.float64):
+        self.num_actions = num_actions
+        self.initial_value = initial_value
+        self.values = np.full((num_states, num_actions), initial_value, dtype=dtype)
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def get(self, states):
+        return self.values[states]
+
+    def add(self, states, actions, deltas):
+        np.add.at(self.values, (states, actions), deltas)
+
+    def set(self, states, values):
+        self.values[states] = values
+
+    def items(self):
+        # the states whose values differ from the initial one
+        states = np.flatnonzero((self.values != self.initial_value).any(axis=1))
+        return states, self.values[states]
+
+
+EMPTY = -1
+GOLDEN = np.uint64(0x9E3779B97F4A7C15) # Fibonacci hashing
+
+
+class SparseQStorage:
+    # Q-values of the states seen so far: an open-addressing hash table (linear probing, load
+    # factor at most 1/2) maps each state to a row of a growing values array. Lookups and
+    # insertions work on whole batches, one numpy pass per probe step.
+    # States never updated read initial_value without being inserted.
+    def __init__(self, num_actions, capacity=1024, initial_value=0.0, dtype=np.float64):
+        self.num_actions = num_actions
+        self.initial_value = initial_value
+        self.size = 0
+        self.values = np.full((capacity, num_actions), initial_value, dtype=dtype)
+        self.states = np.zeros(capacity, dtype=np.int64) # state of each row
+        self._allocate_table(2 * capacity)
+
+    def _allocate_table(self, slots):
+        bits = max(4, int(np.ceil(np.log2(slots))))
+        self._shift = np.uint64(64 - bits)
+        self._mask = (1 << bits) - 1
+        self.keys = np.full(1 << bits, EMPTY, dtype=np.int64) # state in each slot
+        self.rows = np.zeros(1 << bits, dtype=np.int64) # its row in values
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.states.nbytes + self.keys.nbytes + self.rows.nbytes
+
+    def _hash(self, states):
+        return ((states.astype(np.uint64) * GOLDEN) >> self._shift).astype(np.int64)
+
+    def _find(self, states):
+        # slot of each state, -1 if absent
+        slots = self._hash(states)
+        found = np.full(len(states), -1, dtype=np.int64)
+        pending = np.arange(len(states))
+        while len(pending):
+            s = slots[pending]
+            keys = self.keys[s]
+            hit = keys == states[pending]
+            found[pending[hit]] = s[hit]
+            pending = pending[(keys != EMPTY) & ~hit]
+            slots[pending] = (slots[pending] + 1) & self._mask
+        return found
+
+    def _place(self, states, rows):
+        # puts new (absent, distinct) states in the table: one winner per free slot at each probe
+        # step, the others go on probing
+        slots = self._hash(states)
+        pending = np.arange(len(states))
+        while len(pending):
+            s = slots[pending]
+            free = self.keys[s] == EMPTY
+            taken, first = np.unique(s[free], return_index=True)
+            winners = pending[free][first]
+            self.keys[taken] = states[winners]
+            self.rows[taken] = rows[winners]
+            placed = np.zeros(len(states), dtype=bool)
+            placed[winners] = True
+            pending = pending[~placed[pending]]
+            slots[pending] = (slots[pending] + 1) & self._mask
+
+    def _grow(self, size):
+        capacity = len(self.values)
+        while capacity < size:
+            capacity *= 2
+        if capacity != len(self.values):
+            values = np.full((capacity, self.num_actions), self.initial_value, dtype=self.values.dtype)
+            values[:self.size] = self.values[:self.size]
+            self.values = values
+            states = np.zeros(capacity, dtype=np.int64)
+            states[:self.size] = self.states[:self.size]
+            self.states = states
+        if 2 * size > len(self.keys):
+            self._allocate_table(2 * capacity)
+            self._place(self.states[:self.size], np.arange(self.size))
+
+    def _rows(self, states, insert):
+        # row of each state; absent states get a new row (insert) or -1
+        states = np.asarray(states, dtype=np.int64).ravel()
+        found = self._find(states)
+        missing = found < 0
+        if insert and missing.any():
+            new = np.unique(states[missing])
+            self._grow(self.size + len(new))
+            rows = self.size + np.arange(len(new))
+            self.states[rows] = new
+            self._place(new, rows)
+            self.size += len(new)
+            # _grow may have rebuilt the table: slots found before it are stale
+            found = self._find(states)
+            missing[:] = False
+        rows = self.rows[found]
+        rows[missing] = -1
+        return rows
+
+    def get(self, states):
+        shape = np.shape(states)
+        rows = self._rows(states, insert=False)
+        values = self.values[rows]
+        values[rows < 0] = self.initial_value
+        return values.reshape(shape + (self.num_actions,))
+
+    def add(self, states, actions, deltas):
+        rows = self._rows(states, insert=True) # may reallocate values
+        np.add.at(self.values, (rows, np.ravel(actions)), np.ravel(deltas))
+
+    def set(self, states, values):
+        rows = self._rows(states, insert=True)
+        self.values[rows] = values
+
+    def items(self):
+        return self.states[:self.size].copy(), self.values[:self.size].copy()
+
+
+##################### agent #####################
+
+class TabularQ:
+    # Q-learning on the indices of a Discretizer, same update rules as QTable.update_batch.
+    # storage: 'dense', 'sparse', or 'auto' (dense if the full table takes at most dense_limit bytes)
+    def __init__(self, discretizer, num_actions, storage='auto', initial_value=0.0, dtype=np.float64,
+                 dense_limit=256 * 2 ** 20, seed=None):
+        self.discretizer = discretizer
+        self.num_actions = num_actions
+        self.dense_nbytes = discretizer.num_states * num_actions * np.dtype(dtype).itemsize
+        if storage == 'auto':
+            storage = 'dense' if self.dense_nbytes <= dense_limit else 'sparse'
+        if storage == 'dense':
+            if self.dense_nbytes > dense_limit:
+                raise ValueError(f"a dense table of {discretizer.num_states} states takes {self.dense_nbytes} bytes "
+                                 f"(dense_limit {dense_limit}), use storage='sparse'")
+            self.storage = DenseQStorage(discretizer.num_states, num_actions, initial_value, dtype)
+        elif storage == 'sparse':
+            self.storage = SparseQStorage(num_actions, initial_value=initial_value, dtype=dtype)
+        else:
+            raise ValueError(f"unknown storage {storage!r}")
+        self.storage_kind = storage
+        self.rng = np.random.default_rng(seed)
+
+    def q_values(self, states):
+        # (..., num_actions) Q-values of state indices
+        return self.storage.get(np.asarray(states, dtype=np.int64))
+
+    def choose_actions(self, states, epsilon):
+        # epsilon-greedy, one action per state index
+        states = np.asarray(states, dtype=np.int64)
+        actions = np.argmax(self.q_values(states), axis=-1)
+        explore = self.rng.random(actions.shape) < epsilon
+        if explore.any():
+            actions[explore] = self.rng.integers(0, self.num_actions, size=int(explore.sum()))
+        return actions
+
+    def choose_action(self, state, epsilon):
+        return int(self.choose_actions(np.array([state]), epsilon)[0])
+
+    def update_batch(self, states, actions, learning_rate, rewards, discount_factor, next_states,
+                     dones=None, discounts=None):
+        # TD updates from the values before the update (np.add.at for repeated pairs), returns the TD errors
+        states = np.asarray(states, dtype=np.int64)
+        actions = np.asarray(actions)
+        gamma = discount_factor if discounts is None else np.asarray(discounts)
+        max_future = self.q_values(next_states).max(axis=-1)
+        if dones is not None:
+            max_future = np.where(dones, 0, max_future)
+        current = np.take_along_axis(self.q_values(states), actions[..., None], axis=-1)[..., 0]
+        td_errors = np.asarray(rewards) + gamma * max_future - current
+        self.storage.add(states, actions, learning_rate * td_errors)
+        return td_errors
+
+    def update(self, state, action, learning_rate, reward, discount_factor, next_state, done=False):
+        return float(self.update_batch(np.array([state]), np.array([action]), learning_rate, np.array([reward]),
+                                       discount_factor, np.array([next_state]), np.array([done]))[0])
+
+    def memory(self):
+        # memory accounting of the Q storage
+        stored = len(self.storage)
+        return {
+            'storage': self.storage_kind,
+            'num_states': self.discretizer.num_states,
+            'stored_states': stored,
+            'nbytes': self.storage.nbytes,
+            'bytes_per_stored_state': self.storage.nbytes / max(stored, 1),
+            'dense_nbytes': self.dense_nbytes,
+        }
+
+    ##################### save / load #####################
+
+    def save(self, path):
+        # compressed .npz with only the states whose values were set, and the layout of the
+        # discretizer (feature names and sizes) to check it at load time
+        states, values = self.storage.items()
+        np.savez_compressed(path, states=states, values=values, names=np.array(self.discretizer.names),
+                            sizes=self.discretizer.sizes, num_actions=self.num_actions,
+                            initial_value=self.storage.initial_value)
+
+    @classmethod
+    def load(cls, path, discretizer, storage='auto', **kwargs):
+        with np.load(path) as data:
+            if list(data['names']) != discretizer.names or not np.array_equal(data['sizes'], discretizer.sizes):
+                raise ValueError(f"{path} was saved with features {list(data['names'])} of sizes "
+                                 f"{data['sizes'].tolist()}, not {discretizer.names} {discretizer.sizes.tolist()}")
+            agent = cls(discretizer, int(data['num_actions']), storage=storage, dtype=data['values'].dtype,
+                        initial_value=float(data['initial_value']), **kwargs)
+            agent.storage.set(data['states'], data['values'])
+        return agent
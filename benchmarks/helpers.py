@@ -0,0 +1,19 @@
+# helpers shared by the benchmark scripts: start an episode with more enemies / projectiles than a reset gives
+
+
+def fill_enemies(env, count):
+    while len(env.state['enemies']) < count and env.spawn_enemy() is not None:
+        pass
+
+
+def fill_projectiles(env, rng, count):
+    # projectiles scattered on the grid, none close enough to the player to end the episode
+    player = env.state['player']
+    projectiles = env.state['projectiles']
+    projectiles.clear()
+    while len(projectiles) < count:
+        x = rng.randint(0, env.max_x + 1)
+        y = rng.randint(0, env.max_y + 1)
+        if abs(x - player.x) <= 2 and abs(y - player.y) <= 2:
+            continue
+        projectiles.spawn(x, y, rng.randint(0, 4), rng.randint(0, 2))
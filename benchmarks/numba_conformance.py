@@ -0,0 +1,99 @@
+"""Conformance and speed of the compiled backend of TankEnv (backend='numba').
+
+Plays the same seeds and actions on a NumPy TankEnv and a Numba one and checks
+that every step gives the same reward, done flag, info and full state
+(get_state() bytes: player, enemies, projectiles, RNG). Some episodes start
+with many enemies and projectiles to exercise cancellations, swaps and kills.
+Then prints steps/s of both backends.
+
+    python benchmarks/numba_conformance.py
+    python benchmarks/numba_conformance.py --episodes 500 --skip-timing
+    NUMBA_DISABLE_JIT=1 python benchmarks/numba_conformance.py --skip-timing  # kernels as plain Python
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from envs import TankEnv
+from envs.kernels import HAVE_NUMBA
+from helpers import fill_enemies, fill_projectiles
+
+# (max_x, max_y, max_enemies_on_screen, projectiles at reset)
+CONFIGS = [(20, 20, 5, 0), (20, 20, 12, 60), (40, 40, 20, 400), (12, 12, 3, 40)]
+
+
+def reset_pair(reference, compiled, seed, enemies, projectiles):
+    # same start on both: reset, then extra enemies / projectiles copied through get_state()
+    reference.reset(seed=seed)
+    fill_enemies(reference, enemies)
+    fill_projectiles(reference, np.random.RandomState(seed), projectiles)
+    compiled.set_state(reference.get_state())
+
+
+def check(episodes, max_steps, seed):
+    for max_x, max_y, enemies, projectiles in CONFIGS:
+        reference = TankEnv(max_x, max_y, enemies, max(20, enemies), verbose=False)
+        compiled = TankEnv(max_x, max_y, enemies, max(20, enemies), verbose=False, backend='numba')
+        rng = np.random.default_rng(seed)
+        steps = 0
+        for episode in range(episodes):
+            reset_pair(reference, compiled, seed + episode, enemies, projectiles)
+            for action in rng.integers(0, 6, size=max_steps).tolist():
+                _, r1, d1, i1 = reference.step(action)
+                _, r2, d2, i2 = compiled.step(action)
+                steps += 1
+                if (r1, d1, i1) != (r2, d2, i2) or reference.get_state() != compiled.get_state():
+                    raise AssertionError(f"backends differ: grid {max_x}x{max_y}, enemies {enemies}, "
+                                         f"projectiles {projectiles}, episode {episode}, step {steps}")
+                if d1:
+                    break
+        print(f"grid {max_x}x{max_y}  enemies {enemies:2d}  projectiles {projectiles:3d}: "
+              f"{episodes} episodes, {steps} identical steps")
+
+
+def steps_per_second(backend, max_x, max_y, enemies, projectiles, steps, seed):
+    env = TankEnv(max_x, max_y, enemies, max(20, enemies), verbose=False, backend=backend)
+    other = TankEnv(max_x, max_y, enemies, max(20, enemies), verbose=False)
+    rng = np.random.default_rng(seed)
+    total, count, episode = 0.0, 0, 0
+    while count < steps:
+        reset_pair(other, env, seed + episode, enemies, projectiles)
+        episode += 1
+        start = time.perf_counter()
+        for action in rng.integers(0, 6, size=50).tolist():
+            count += 1
+            if env.step(action)[2]:
+                break
+        total += time.perf_counter() - start
+    return count / total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--episodes', type=int, default=100, help="episodes per configuration")
+    parser.add_argument('--max-steps', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-timing', action='store_true')
+    args = parser.parse_args()
+    if not HAVE_NUMBA:
+        print("numba is not installed: the 'numba' backend falls back to NumPy, nothing to compare")
+        return
+
+    check(args.episodes, args.max_steps, args.seed)
+    if args.skip_timing:
+        return
+    steps_per_second('numba', 20, 20, 5, 0, 100, args.seed) # compilation (or cache load)
+    print(f"{'configuration':>32}  {'numpy':>9}  {'numba':>9}  steps/s")
+    for max_x, max_y, enemies, projectiles in CONFIGS:
+        numpy_rate = steps_per_second('numpy', max_x, max_y, enemies, projectiles, 5000, args.seed)
+        numba_rate = steps_per_second('numba', max_x, max_y, enemies, projectiles, 5000, args.seed)
+        name = f'{max_x}x{max_y} e{enemies} p{projectiles}'
+        print(f"{name:>32}  {numpy_rate:9.0f}  {numba_rate:9.0f}  x{numba_rate / numpy_rate:.2f}")
+
+
+if __name__ == '__main__':
+    main()
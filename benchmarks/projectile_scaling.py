@@ -0,0 +1,56 @@
+"""Step time of TankEnv against the number of live projectiles.
+
+Hits are read from the occupancy grid once there are more than DENSE_HITS
+(player shots, enemies) pairs: the shots are stamped on their cells, then each
+enemy looks at the 25 cells of its 5x5 box (OccupancyGrid.first_shots), so the
+lookup does not depend on the number of projectiles in the boxes. The 'kills'
+column still grows with the number of enemies actually killed. Cancellation
+and movement make one pass over the projectile arrays, so the whole step keeps
+a small cost per projectile.
+
+    python benchmarks/projectile_scaling.py
+"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from envs import StepProfiler, TankEnv
+from helpers import fill_enemies, fill_projectiles
+
+
+def time_step(env, rng, enemies, count, repeats):
+    total, kills, killed = 0, [], []
+
+    def record_kills(record):
+        kills.append(record['time_kills'])
+        killed.append(record['kills'])
+    env.profiler.subscribe('step', record_kills)
+    for _ in range(repeats):
+        env.reset()
+        fill_enemies(env, enemies)
+        fill_projectiles(env, rng, count)
+        start = time.perf_counter()
+        env.step(4)
+        total += time.perf_counter() - start
+    env.profiler.unsubscribe('step', record_kills)
+    return total / repeats, sum(kills) / repeats, sum(killed) / repeats
+
+
+def main(max_x=40, max_y=40, enemies=20, repeats=200, seed=0):
+    rng = np.random.RandomState(seed)
+    env = TankEnv(max_x=max_x, max_y=max_y, max_enemies_on_screen=enemies, total_ennemies_to_kill=enemies,
+                  verbose=False, profiler=StepProfiler())
+    env.seed(seed)
+    print(f"grid {max_x}x{max_y}, {enemies} enemies, max_projectiles = {env.max_projectiles}")
+    print("projectiles  us/step  us/step/projectile  us kills  enemies killed")
+    for count in (0, 25, 50, 100, 200, 400, 800):
+        t, kills, killed = time_step(env, rng, enemies, count, repeats)
+        per_projectile = t / count * 1e6 if count else float('nan')
+        print(f"{count:11d}  {t * 1e6:7.1f}  {per_projectile:18.2f}  {kills * 1e6:8.1f}  {killed:14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Where the time of TankEnv.step goes, phase by phase (StepProfiler).
+
+Plays random-action episodes with a profiler attached, prints the time per
+phase and the counters, and optionally writes the per-episode CSV, the JSON
+summary and a cProfile of a range of episodes.
+
+    python benchmarks/step_profile.py --episodes 200
+    python benchmarks/step_profile.py --csv episodes.csv --json summary.json
+    python benchmarks/step_profile.py --cprofile 10 20 --cprofile-output step.prof
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from envs import TankEnv, StepProfiler
+
+
+def run(env, episodes, max_steps, seed):
+    rng = np.random.default_rng(seed)
+    env.seed(seed)
+    for _ in range(episodes):
+        env.reset()
+        for action in rng.integers(0, env.action_space.n, size=max_steps).tolist():
+            _, _, done, _ = env.step(action)
+            if done:
+                break
+    env.profiler.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--episodes', type=int, default=200)
+    parser.add_argument('--max-steps', type=int, default=1000, help="step limit per episode")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-x', type=int, default=20)
+    parser.add_argument('--max-y', type=int, default=20)
+    parser.add_argument('--max-enemies', type=int, default=5, help="max_enemies_on_screen of TankEnv")
+    parser.add_argument('--csv', default=None, help="per-episode CSV")
+    parser.add_argument('--json', default=None, help="JSON summary (with the episodes)")
+    parser.add_argument('--cprofile', type=int, nargs=2, metavar=('FIRST', 'STOP'), default=None,
+                        help="run cProfile over episodes FIRST..STOP-1")
+    parser.add_argument('--cprofile-output', default=None, help="where to dump the cProfile stats")
+    args = parser.parse_args()
+
+    cprofile_episodes = range(*args.cprofile) if args.cprofile else None
+    profiler = StepProfiler(cprofile_episodes=cprofile_episodes)
+    env = TankEnv(max_x=args.max_x, max_y=args.max_y, max_enemies_on_screen=args.max_enemies,
+                  verbose=False, profiler=profiler)
+    run(env, args.episodes, args.max_steps, args.seed)
+
+    print(profiler.report())
+    if args.csv:
+        profiler.to_csv(args.csv)
+    if args.json:
+        profiler.to_json(args.json)
+    if args.cprofile:
+        if args.cprofile_output:
+            profiler.dump_cprofile(args.cprofile_output)
+        else:
+            profiler.print_cprofile()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,340 @@
+"""Benchmark suite: environment (also large maps), rendering, features and Q-table throughput.
+
+Every benchmark runs headless with fixed seeds and keeps the best of a few
+repeats (the least disturbed one). Results are written as JSON (one entry per
+benchmark: value, unit, higher_is_better) and can be compared against a
+stored baseline; the script exits with status 1 if a benchmark got worse by
+more than the tolerance.
+
+    python benchmarks/suite.py --output baseline.json
+    python benchmarks/suite.py --baseline baseline.json --tolerance 0.2
+    python benchmarks/suite.py --quick --only env_step render
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+# pas de fenêtre: backend matplotlib sans affichage, pygame (si importé) sans écran
+os.environ.setdefault('MPLBACKEND', 'Agg')
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from envs import LargeTankEnv, TankEnv, VecTankEnv
+from agents.Q_table_agent import QTable, grab_distance_and_kronecker
+from agents.features import nearest_enemy_features
+from helpers import fill_enemies, fill_projectiles
+
+SEED = 0
+GRIDS = [(20, 20), (40, 40)]
+ENEMIES = [5, 20]
+DENSITIES = [0.0, 0.05, 0.25] # projectiles par case au début de chaque bloc de steps
+
+
+def best_time(run, repeats):
+    # run() renvoie le temps mesuré d'une répétition, on garde la plus rapide
+    return min(run() for _ in range(repeats))
+
+
+def make_env(max_x, max_y, enemies, **kwargs):
+    env = TankEnv(max_x=max_x, max_y=max_y, max_enemies_on_screen=enemies,
+                  total_ennemies_to_kill=max(20, enemies), verbose=False, **kwargs)
+    env.seed(SEED)
+    return env
+
+
+##################### benchmarks #####################
+# chaque benchmark renvoie une liste de (nom, valeur, unité, plus grand = mieux)
+
+def bench_env_step(quick, repeats):
+    # steps/s par blocs de 50 steps (actions aléatoires) qui commencent avec max_enemies ennemis
+    # et density * cases projectiles; seuls les steps sont chronométrés
+    block, blocks = 50, (10 if quick else 40)
+    results = []
+    for max_x, max_y in GRIDS:
+        for enemies in ENEMIES:
+            for density in DENSITIES:
+                env = make_env(max_x, max_y, enemies)
+
+                def run():
+                    env.seed(SEED)
+                    rng = np.random.RandomState(SEED)
+                    actions = np.random.default_rng(SEED).integers(0, 6, size=(blocks, block)).tolist()
+                    total, steps = 0.0, 0
+                    for row in actions:
+                        env.reset()
+                        fill_enemies(env, enemies)
+                        fill_projectiles(env, rng, int(density * max_x * max_y))
+                        start = time.perf_counter()
+                        for action in row:
+                            steps += 1
+                            if env.step(action)[2]:
+                                break
+                        total += time.perf_counter() - start
+                    return total / steps
+
+                name = f'env_step/{max_x}x{max_y}/enemies{enemies}/density{density:g}'
+                results.append((name, 1 / best_time(run, repeats), 'steps/s', True))
+    return results
+
+
+def bench_large_env_step(quick, repeats):
+    # LargeTankEnv: steps/s et mémoire avec le même nombre d'ennemis sur des cartes de plus en plus
+    # grandes (doivent rester à peu près constants), fenêtre égocentrique comme observation
+    steps, enemies = (100 if quick else 400), 200
+    results = []
+    for side in (200, 1000, 4000):
+        tracemalloc.start()
+        env = LargeTankEnv(side, side, enemies, 10 * enemies, verbose=False)
+        env.reset(seed=SEED)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        def run():
+            env.reset(seed=SEED)
+            total = 0.0
+            for action in np.random.default_rng(SEED).integers(0, 6, size=steps).tolist():
+                fill_enemies(env, enemies)
+                start = time.perf_counter()
+                done = env.step(action)[2]
+                total += time.perf_counter() - start
+                if done:
+                    env.reset()
+            return total / steps
+
+        results.append((f'large_env_step/{side}x{side}/enemies{enemies}', 1 / best_time(run, repeats), 'steps/s', True))
+        results.append((f'memory/LargeTankEnv/{side}x{side}', size, 'bytes/env', False))
+    return results
+
+
+def bench_env_reset(quick, repeats):
+    count = 500 if quick else 2000
+    results = []
+    for max_x, max_y in GRIDS:
+        env = make_env(max_x, max_y, 5)
+
+        def run():
+            env.seed(SEED)
+            start = time.perf_counter()
+            for _ in range(count):
+                env.reset()
+            return (time.perf_counter() - start) / count
+
+        results.append((f'env_reset/{max_x}x{max_y}', 1 / best_time(run, repeats), 'resets/s', True))
+    return results
+
+
+def bench_vec_env_step(quick, repeats):
+    num_envs, steps = 64, (100 if quick else 400)
+    env = VecTankEnv(num_envs, seeds=list(range(num_envs)))
+    actions = np.random.default_rng(SEED).integers(0, 6, size=(steps, num_envs))
+
+    def run():
+        env.seed(list(range(num_envs)))
+        env.reset()
+        start = time.perf_counter()
+        for row in actions:
+            env.step(row)
+        return (time.perf_counter() - start) / (steps * num_envs)
+
+    return [(f'vec_env_step/20x20/envs{num_envs}', 1 / best_time(run, repeats), 'env-steps/s', True)]
+
+
+def bench_render(quick, repeats):
+    # frames/s de render() pendant un jeu aléatoire (rendu incrémental, une frame par step)
+    steps = 200 if quick else 1000
+    results = []
+    for max_x, max_y in GRIDS:
+        env = make_env(max_x, max_y, 5)
+
+        def run():
+            env.seed(SEED)
+            env.reset()
+            total = 0.0
+            for action in np.random.default_rng(SEED).integers(0, 6, size=steps).tolist():
+                if env.step(action)[2]:
+                    env.reset()
+                start = time.perf_counter()
+                env.render()
+                total += time.perf_counter() - start
+            return total / steps
+
+        results.append((f'render/{max_x}x{max_y}', 1 / best_time(run, repeats), 'frames/s', True))
+    return results
+
+
+def bench_features(quick, repeats):
+    count = 5000 if quick else 20000
+    results = []
+    env = make_env(20, 20, 5)
+    env.reset()
+    fill_enemies(env, 5)
+    for mode in ('state', 'array'):
+        env.obs_mode = mode
+        state = env.observe()
+
+        def run():
+            start = time.perf_counter()
+            for _ in range(count):
+                grab_distance_and_kronecker(state)
+            return (time.perf_counter() - start) / count
+
+        results.append((f'grab_distance_and_kronecker/{mode}', 1 / best_time(run, repeats), 'calls/s', True))
+
+    # version en bloc, sur les observations d'un VecTankEnv
+    num_envs = 256
+    vec = VecTankEnv(num_envs, seeds=list(range(num_envs)))
+    obs = vec.reset()
+    calls = count // 50
+
+    def run():
+        start = time.perf_counter()
+        for _ in range(calls):
+            nearest_enemy_features(obs['player'], obs['enemies'], obs['enemies_mask'])
+        return (time.perf_counter() - start) / (calls * num_envs)
+
+    results.append((f'nearest_enemy_features/batch{num_envs}', 1 / best_time(run, repeats), 'rows/s', True))
+    return results
+
+
+def bench_q_table(quick, repeats):
+    count, batch = (5000 if quick else 20000), 256
+    rng = np.random.default_rng(SEED)
+    distances = rng.integers(0, 41, size=count)
+    orientations = rng.integers(0, 2, size=count)
+    actions = rng.integers(0, 6, size=count)
+    rewards = rng.normal(size=count)
+    next_distances = rng.integers(0, 41, size=count)
+    next_orientations = rng.integers(0, 2, size=count)
+    columns = [a.tolist() for a in (distances, orientations, actions, rewards, next_distances, next_orientations)]
+    results = []
+
+    def run():
+        agent = QTable(41, 6)
+        start = time.perf_counter()
+        for d, o, a, r, nd, no in zip(*columns):
+            agent.update_q_value(d, o, a, 0.1, r, 0.99, nd, no)
+        return (time.perf_counter() - start) / count
+
+    results.append(('q_table/update_q_value', 1 / best_time(run, repeats), 'updates/s', True))
+
+    def run():
+        agent = QTable(41, 6)
+        start = time.perf_counter()
+        for i in range(0, count - batch + 1, batch):
+            s = slice(i, i + batch)
+            agent.update_batch(distances[s], orientations[s], actions[s], 0.1, rewards[s], 0.99,
+                               next_distances[s], next_orientations[s])
+        return (time.perf_counter() - start) / (count // batch * batch)
+
+    results.append((f'q_table/update_batch{batch}', 1 / best_time(run, repeats), 'updates/s', True))
+    return results
+
+
+def bench_memory(quick, repeats):
+    # octets alloués (tracemalloc, numpy compris) pour construire et remettre à zéro un environnement
+    results = []
+    for max_x, max_y in GRIDS:
+        tracemalloc.start()
+        env = make_env(max_x, max_y, 5)
+        env.reset()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del env
+        results.append((f'memory/TankEnv/{max_x}x{max_y}', size, 'bytes/env', False))
+    num_envs = 64
+    tracemalloc.start()
+    vec = VecTankEnv(num_envs, seeds=list(range(num_envs)))
+    vec.reset()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del vec
+    results.append((f'memory/VecTankEnv/20x20/envs{num_envs}', size / num_envs, 'bytes/env', False))
+    return results
+
+
+BENCHMARKS = {
+    'env_step': bench_env_step,
+    'large_env_step': bench_large_env_step,
+    'env_reset': bench_env_reset,
+    'vec_env_step': bench_vec_env_step,
+    'render': bench_render,
+    'features': bench_features,
+    'q_table': bench_q_table,
+    'memory': bench_memory,
+}
+
+
+##################### results #####################
+
+def run_suite(quick=False, repeats=3, only=None):
+    results = {}
+    for group, benchmark in BENCHMARKS.items():
+        if only and group not in only:
+            continue
+        for name, value, unit, higher_is_better in benchmark(quick, repeats):
+            results[name] = {'value': float(value), 'unit': unit, 'higher_is_better': higher_is_better}
+            print(f"{name:50s} {value:14.1f} {unit}")
+    return results
+
+
+def machine_info():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def compare(results, baseline, tolerance):
+    # renvoie les noms des benchmarks en régression (plus de tolerance d'écart dans le mauvais sens)
+    regressions = []
+    print(f"\n{'benchmark':50s} {'baseline':>14s} {'current':>14s} {'change':>8s}")
+    for name, current in results.items():
+        if name not in baseline:
+            continue
+        reference = baseline[name]['value']
+        change = current['value'] / reference - 1 if reference else 0.0
+        worse = -change if current['higher_is_better'] else change
+        flag = ''
+        if worse > tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:50s} {reference:14.1f} {current['value']:14.1f} {100 * change:+7.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default=None, help="where to write the results (JSON)")
+    parser.add_argument('--baseline', default=None, help="results (JSON) to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="relative change counted as a regression")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--quick', action='store_true', help="fewer steps per benchmark")
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=None, help="benchmark groups to run")
+    args = parser.parse_args()
+
+    results = run_suite(quick=args.quick, repeats=args.repeats, only=args.only)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'machine': machine_info(), 'quick': args.quick, 'results': results}, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {100 * args.tolerance:.0f}%")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
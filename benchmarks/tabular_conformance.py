@@ -0,0 +1,96 @@
+"""Conformance of the sparse Q storage of TabularQ (storage='sparse') with the dense one.
+
+Applies the same batches (repeated states, new and known states mixed) to a
+DenseQStorage and to a SparseQStorage started with a tiny capacity, so that
+its hash table is rebuilt many times, and checks every value after each batch.
+Then trains two TabularQ agents on the same VecTankEnv games, one dense and
+one sparse, and checks that the TD errors and the Q-values stay identical.
+
+    python benchmarks/tabular_conformance.py
+    python benchmarks/tabular_conformance.py --batches 2000 --steps 2000
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from envs import VecTankEnv
+from agents.tabular import (DenseQStorage, Discretizer, SparseQStorage, TabularQ, incoming_projectile,
+                            nearest_aligned, nearest_bearing, nearest_distance, nearest_heading, wall_distance)
+
+NUM_ACTIONS = 6
+
+
+def check_storage(batches, num_states, seed):
+    rng = np.random.default_rng(seed)
+    dense = DenseQStorage(num_states, NUM_ACTIONS)
+    sparse = SparseQStorage(NUM_ACTIONS, capacity=4)
+    tables = 1
+    for batch in range(batches):
+        # a few known states (and repeats) with new ones, from a range that widens over time
+        size = int(rng.integers(1, 64))
+        states = rng.integers(0, min(num_states, 8 * (batch + 1)), size=size)
+        actions = rng.integers(0, NUM_ACTIONS, size=size)
+        keys = sparse.keys
+        if rng.random() < 0.2:
+            values = rng.normal(size=(size, NUM_ACTIONS))
+            dense.set(states, values)
+            sparse.set(states, values)
+        else:
+            deltas = rng.normal(size=size)
+            dense.add(states, actions, deltas)
+            sparse.add(states, actions, deltas)
+        tables += sparse.keys is not keys
+        probe = rng.integers(0, num_states, size=256)
+        if not np.array_equal(dense.get(probe), sparse.get(probe)):
+            raise AssertionError(f"storages differ after batch {batch} ({len(sparse)} states stored)")
+    states, values = sparse.items()
+    if not np.array_equal(dense.get(states), values):
+        raise AssertionError("storages differ on the stored states")
+    print(f"storage: {batches} batches, {len(sparse)} states stored, {tables} hash tables, identical values")
+
+
+def check_agents(num_envs, steps, seed):
+    env = VecTankEnv(num_envs, seeds=list(range(seed, seed + num_envs)))
+    discretizer = Discretizer([nearest_distance(env.max_x + env.max_y), nearest_aligned(), nearest_bearing(),
+                               nearest_heading(), incoming_projectile(4), wall_distance(env.max_x, env.max_y, 4)])
+    dense = TabularQ(discretizer, NUM_ACTIONS, storage='dense', seed=seed)
+    sparse = TabularQ(discretizer, NUM_ACTIONS, storage='sparse', seed=seed)
+    sparse.storage = SparseQStorage(NUM_ACTIONS, capacity=4) # grows during the run
+    states = discretizer.encode_batch(env.reset())
+    for step in range(steps):
+        actions = dense.choose_actions(states, 0.3)
+        if not np.array_equal(actions, sparse.choose_actions(states, 0.3)):
+            raise AssertionError(f"agents choose different actions at step {step}")
+        obs, rewards, dones, infos = env.step(actions)
+        next_states = discretizer.encode_batch(obs)
+        if dones.any():
+            next_states[dones] = discretizer.encode_batch(infos['final_observation'])[dones]
+        td_dense = dense.update_batch(states, actions, 0.1, rewards, 0.99, next_states, dones)
+        td_sparse = sparse.update_batch(states, actions, 0.1, rewards, 0.99, next_states, dones)
+        if not np.array_equal(td_dense, td_sparse):
+            raise AssertionError(f"TD errors differ at step {step}")
+        states = discretizer.encode_batch(obs)
+    stored, values = sparse.storage.items()
+    if not np.array_equal(dense.q_values(stored), values):
+        raise AssertionError("Q-values differ at the end of the run")
+    print(f"agents: {num_envs} games, {steps} steps, {len(stored)} states stored, identical TD errors and Q-values")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batches', type=int, default=500)
+    parser.add_argument('--num-states', type=int, default=5000)
+    parser.add_argument('--envs', type=int, default=32)
+    parser.add_argument('--steps', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    check_storage(args.batches, args.num_states, args.seed)
+    check_agents(args.envs, args.steps, args.seed)
+
+
+if __name__ == '__main__':
+    main()
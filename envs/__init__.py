@@ -1,2 +1,5 @@
 from .tank_env import TankEnv
-from .game_elements import Tank, Projectile
\ No newline at end of file
+from .vec_tank_env import VecTankEnv
+from .large_tank_env import LargeTankEnv
+from .game_elements import Tank, Projectile
+from .profiler import StepProfiler
\ No newline at end of file
@@ -0,0 +1,123 @@
+import numpy as np
+
+from envs.occupancy_grid import PAD
+
+# Large maps (LargeTankEnv): the map is cut into chunks of chunk_size x chunk_size cells and
+# interactions (5x5 boxes) are only looked for in the 3x3 chunks around a position, so the cost
+# depends on the number of entities and not on the area of the map.
+#   ChunkIndex        entities grouped by chunk (sorted arrays), rebuilt when they move
+#   ChunkedOccupancy  tank layer of OccupancyGrid (same methods), tank centers stored per chunk
+DEFAULT_CHUNK_SIZE = 16
+
+# rows of the 3x3 chunks around a chunk (the 3 chunks of a row have consecutive keys)
+_NEIGHBOUR_ROWS = np.arange(-1, 2)
+
+
+class ChunkIndex:
+    # positions (x, y) grouped by chunk, like a CSR matrix: keys sorted, `order` gives the
+    # positions of each chunk (in increasing index order, so slot order is kept inside a chunk).
+    # Projectiles can be up to 3 cells off the map: chunk coordinates start at -1, -2 with the
+    # neighbours (keys shifted).
+    def __init__(self, max_x, max_y, chunk_size=DEFAULT_CHUNK_SIZE):
+        assert chunk_size > PAD
+        self.chunk_size = chunk_size
+        self.width = max_x // chunk_size + 5 # chunks -2 .. (max_x + 2) // chunk_size + 1
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.order = np.zeros(0, dtype=np.int64)
+
+    def _keys(self, cx, cy):
+        return (cy + 2) * self.width + cx + 2
+
+    def build(self, x, y):
+        size = self.chunk_size
+        keys = self._keys(np.asarray(x, dtype=np.int64) // size, np.asarray(y, dtype=np.int64) // size)
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+        return self
+
+    def candidates(self, qx, qy):
+        # (query, item) pairs of every item in the 3x3 chunks around each query position,
+        # grouped by query; items are indices in the arrays given to build()
+        size = self.chunk_size
+        qx = np.asarray(qx, dtype=np.int64)
+        qy = np.asarray(qy, dtype=np.int64)
+        first = self._keys(qx[:, None] // size - 1, qy[:, None] // size + _NEIGHBOUR_ROWS).ravel()
+        low = np.searchsorted(self.keys, first, side='left')
+        counts = np.searchsorted(self.keys, first + 2, side='right') - low
+        total = int(counts.sum())
+        queries = np.repeat(np.arange(len(qx)).repeat(len(_NEIGHBOUR_ROWS)), counts)
+        # position inside each range: 0, 1, .. counts - 1
+        within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        return queries, self.order[np.repeat(low, counts) + within]
+
+    def near(self, qx, qy, x, y, radius=PAD):
+        # (query, item) pairs with the item in the (2 * radius + 1)^2 box around the query,
+        # sorted by query then item; x, y: the arrays given to build()
+        assert radius <= self.chunk_size
+        queries, items = self.candidates(qx, qy)
+        close = (np.abs(np.asarray(x)[items] - np.asarray(qx)[queries]) <= radius) & \
+                (np.abs(np.asarray(y)[items] - np.asarray(qy)[queries]) <= radius)
+        queries, items = queries[close], items[close]
+        order = np.lexsort((items, queries))
+        return queries[order], items[order]
+
+
+class ChunkedOccupancy:
+    # same tank interface as OccupancyGrid (add_tank, remove_tank, is_blocked, set_tanks,
+    # move_tanks, clear) without any array of the size of the map: {chunk: [tank centers]}.
+    # is_blocked looks at the (at most 4) chunks overlapping the 5x5 box.
+    def __init__(self, max_x, max_y, chunk_size=DEFAULT_CHUNK_SIZE):
+        assert chunk_size > PAD
+        self.max_x = max_x
+        self.max_y = max_y
+        self.chunk_size = chunk_size
+        self.chunks = {}
+
+    def __len__(self):
+        return sum(len(centers) for centers in self.chunks.values())
+
+    def clear(self):
+        self.chunks.clear()
+
+    def add_tank(self, x, y):
+        x, y = int(x), int(y)
+        self.chunks.setdefault((x // self.chunk_size, y // self.chunk_size), []).append((x, y))
+
+    def remove_tank(self, x, y):
+        x, y = int(x), int(y)
+        key = (x // self.chunk_size, y // self.chunk_size)
+        centers = self.chunks[key]
+        centers.remove((x, y))
+        if not centers:
+            del self.chunks[key]
+
+    def set_tanks(self, xs, ys):
+        self.chunks.clear()
+        for x, y in zip(np.asarray(xs).tolist(), np.asarray(ys).tolist()):
+            self.add_tank(x, y)
+
+    def move_tanks(self, old_x, old_y, new_x, new_y):
+        # remove_tank + add_tank, a tank that stays in its chunk is only replaced in its list
+        size, chunks = self.chunk_size, self.chunks
+        for x, y, nx, ny in zip(np.asarray(old_x).tolist(), np.asarray(old_y).tolist(),
+                                np.asarray(new_x).tolist(), np.asarray(new_y).tolist()):
+            key, new_key = (x // size, y // size), (nx // size, ny // size)
+            centers = chunks[key]
+            if key == new_key:
+                centers[centers.index((x, y))] = (nx, ny)
+                continue
+            centers.remove((x, y))
+            if not centers:
+                del chunks[key]
+            chunks.setdefault(new_key, []).append((nx, ny))
+
+    def is_blocked(self, x, y):
+        # True if a tank center is in the 5x5 box around (x, y)
+        x, y = int(x), int(y)
+        size = self.chunk_size
+        for cy in range((y - PAD) // size, (y + PAD) // size + 1):
+            for cx in range((x - PAD) // size, (x + PAD) // size + 1):
+                for tx, ty in self.chunks.get((cx, cy), ()):
+                    if abs(tx - x) <= PAD and abs(ty - y) <= PAD:
+                        return True
+        return False
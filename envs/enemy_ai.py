@@ -0,0 +1,131 @@
+import numpy as np
+
+from envs.game_elements import DX, DY
+from envs.occupancy_grid import PAD
+from envs.chunks import ChunkIndex
+
+# Tank.update_strategic, for all the enemies of an environment at once
+CHASE_PROBABILITY = 0.1 # strategy 2: go to the player
+FOLLOW_PROBABILITY = 0.7 # strategy 1: keep going in the same direction
+NUM_ACTIONS = 6
+
+
+# action bringing a tank closer to the player, by sign of (player_x - x) + 1, sign of (player_y - y) + 1:
+# x first, then y, stay if on it
+CHASE_ACTIONS = np.array([[3, 3, 3],
+                          [0, 4, 2],
+                          [1, 1, 1]])
+
+
+def chase_actions(x, y, player_x, player_y):
+    return CHASE_ACTIONS[np.sign(player_x - x) + 1, np.sign(player_y - y) + 1]
+
+
+def enemy_actions(x, y, direction, player_x, player_y, rng, strategy=2):
+    # actions of the enemies (arrays in slot order), with one bulk draw rng.random((3, n))
+    return actions_from_draws(rng.random((3, len(x))), x, y, direction, player_x, player_y, strategy)
+
+
+def actions_from_draws(draws, x, y, direction, player_x, player_y, strategy=2):
+    # draws (3, ...) uniform in [0, 1), same shape as x, y, direction after the first axis
+    # (e.g. (3, num_envs, max_enemies) for VecTankEnv): row 0 decides chasing (strategy 2),
+    # row 1 following the direction (strategies 1 and 2), row 2 gives the random action (strategy 0)
+    actions = (draws[2] * NUM_ACTIONS).astype(np.int64)
+    if strategy >= 1:
+        actions = np.where(draws[1] < FOLLOW_PROBABILITY, direction, actions)
+    if strategy == 2:
+        chase = draws[0] < CHASE_PROBABILITY
+        if chase.any():
+            actions = np.where(chase, chase_actions(x, y, player_x, player_y), actions)
+    return actions
+
+
+# strict lower / upper triangles by size: tanks before / after each tank in slot order
+_triangles = {}
+
+
+def _order(n):
+    if n not in _triangles:
+        before = np.tri(n, k=-1, dtype=bool)
+        _triangles[n] = (before, before.T.copy())
+    return _triangles[n]
+
+
+def move_tanks(x, y, direction, actions, max_x, max_y, others_x=(), others_y=(), chunk_size=None):
+    # Tank.update (without the shots) for tanks moving one after the other in slot order:
+    # a tank moves forward if its direction is the action, otherwise it turns; the move is
+    # blocked outside the map or if a tank center (others, or a tank of the batch at its position
+    # at that time: new if it moved before, old otherwise) is in the 5x5 box around the target.
+    # Returns (x, y, direction, moved).
+    # Whether an earlier tank moved only matters if it blocks the target from one of its two
+    # positions and not from the other: only those tanks are resolved one by one.
+    # chunk_size: same result from the pairs of tanks in neighbouring chunks (ChunkIndex) instead
+    # of n x n matrices, for the many enemies of a large map (LargeTankEnv)
+    n = len(x)
+    new_direction = np.where(actions < 4, actions, direction)
+    nx = x + DX[direction]
+    ny = y + DY[direction]
+    forward = (direction == actions) & (np.minimum(nx, ny) >= 0) & (nx < max_x) & (ny < max_y)
+    if not forward.any():
+        return x, y, new_direction, forward
+    if chunk_size is not None:
+        moved = _moved_chunked(x, y, nx, ny, forward, others_x, others_y, max_x, max_y, chunk_size)
+        return np.where(moved, nx, x), np.where(moved, ny, y), new_direction, moved
+
+    # target of each tank against the old centers, the targets and the other tanks
+    all_x = np.concatenate((x, nx, others_x))
+    all_y = np.concatenate((y, ny, others_y))
+    near = (np.abs(nx[:, None] - all_x) <= PAD) & (np.abs(ny[:, None] - all_y) <= PAD)
+    near_old, near_new = near[:, :n], near[:, n:2 * n]
+    before, after = _order(n)
+    # blocked whatever the order: other tanks, tanks that do not move, later tanks (not moved yet),
+    # earlier movers close to the target from both positions
+    blocked = near[:, 2 * n:].any(axis=1)
+    blocked |= (near_old & (after | ~forward)).any(axis=1)
+    earlier_movers = before & forward
+    blocked |= (near_old & near_new & earlier_movers).any(axis=1)
+    moved = forward & ~blocked
+    depends = (near_old != near_new) & earlier_movers
+    for k in np.flatnonzero(moved & depends.any(axis=1)).tolist():
+        j = depends[k]
+        moved[k] = not np.where(moved[j], near_new[k, j], near_old[k, j]).any()
+    return np.where(moved, nx, x), np.where(moved, ny, y), new_direction, moved
+
+
+def _moved_chunked(x, y, nx, ny, forward, others_x, others_y, max_x, max_y, chunk_size):
+    # move_tanks with sparse (tank k, tank j) pairs: j close to the target of k from its old
+    # position (near_old) or from its target (near_new), found in the chunks around the target
+    n = len(x)
+    index = ChunkIndex(max_x, max_y, chunk_size)
+    blocked = np.zeros(n, dtype=bool)
+    if len(others_x): # a few tanks (the player): directly
+        blocked = ((np.abs(nx[:, None] - np.asarray(others_x)) <= PAD)
+                   & (np.abs(ny[:, None] - np.asarray(others_y)) <= PAD)).any(axis=1)
+    k, j = index.build(x, y).near(nx, ny, x, y)
+    keep = k != j
+    old = k[keep] * n + j[keep]
+    k, j = index.build(nx, ny).near(nx, ny, nx, ny)
+    keep = k != j
+    new = k[keep] * n + j[keep]
+
+    # blocked whatever the order (see move_tanks)
+    k, j = np.divmod(old, n)
+    blocked[k[(j > k) | ~forward[j]]] = True
+    k, j = np.divmod(np.intersect1d(old, new, assume_unique=True), n)
+    blocked[k[(j < k) & forward[j]]] = True
+    moved = forward & ~blocked
+
+    # earlier movers close to the target from one of their positions only: one by one, in order
+    one = np.setxor1d(old, new, assume_unique=True)
+    k, j = np.divmod(one, n)
+    earlier = (j < k) & forward[j]
+    one, k, j = one[earlier], k[earlier], j[earlier]
+    if len(one) == 0:
+        return moved
+    from_new = np.isin(one, new, assume_unique=True)
+    starts = np.searchsorted(k, np.arange(n + 1))
+    for t in np.unique(k).tolist():
+        if moved[t]:
+            rows = slice(starts[t], starts[t + 1])
+            moved[t] = not (moved[j[rows]] == from_new[rows]).any()
+    return moved
@@ -1,71 +1,234 @@
+import heapq
+import struct
+
 import numpy as np
 
-class Tank:
+# Direction: 0 = up, 1 = right, 2 = down, 3 = left
+DX = np.array([0, 1, 0, -1]) # right - left
+DY = np.array([-1, 0, 1, 0]) # down - up
+
+
+class EntityPool:
+    # fixed-capacity storage for tanks or projectiles: one array per field, one preallocated
+    # handle per slot and a free-list, so spawning and removing entities never allocates.
+    # free slots are reused lowest index first and iteration goes by slot index,
+    # which makes the update order deterministic.
+    # growable=True: a full pool doubles its capacity instead of raising (new slots come after
+    # the old ones, the order is kept), e.g. the projectiles of a large map (LargeTankEnv)
+    def __init__(self, capacity, entity_class, growable=False):
+        self.capacity = capacity
+        self.entity_class = entity_class
+        self.growable = growable
+        self.x = np.zeros(capacity, dtype=np.int32)
+        self.y = np.zeros(capacity, dtype=np.int32)
+        self.direction = np.zeros(capacity, dtype=np.int8)
+        self.label = np.zeros(capacity, dtype=np.int8)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.count = 0
+
+        self.entities = [entity_class.__new__(entity_class) for _ in range(capacity)]
+        for index, entity in enumerate(self.entities):
+            entity.pool = self
+            entity.index = index
+        self.free = list(range(capacity)) # heap of free slots
+
+    def grow(self, capacity):
+        # more slots, the live entities keep their slots
+        old = self.capacity
+        assert capacity >= old
+        for name in ('x', 'y', 'direction', 'label', 'alive'):
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:old] = array
+            setattr(self, name, grown)
+        for index in range(old, capacity):
+            entity = self.entity_class.__new__(self.entity_class)
+            entity.pool = self
+            entity.index = index
+            self.entities.append(entity)
+        self.free.extend(range(old, capacity)) # larger than every free slot: still a heap
+        self.capacity = capacity
+
+    def spawn(self, x, y, direction, label):
+        if not self.free:
+            if not self.growable:
+                raise RuntimeError(f"EntityPool is full (capacity {self.capacity})")
+            self.grow(2 * self.capacity)
+        index = heapq.heappop(self.free)
+        self.x[index] = x
+        self.y[index] = y
+        self.direction[index] = direction
+        self.label[index] = label
+        self.alive[index] = True
+        self.count += 1
+        return self.entities[index]
+
+    def remove(self, entity):
+        if entity.pool is not self or not self.alive[entity.index]:
+            raise ValueError("entity is not in this pool")
+        self.alive[entity.index] = False
+        heapq.heappush(self.free, entity.index)
+        self.count -= 1
+
+    def remove_indices(self, indices):
+        # remove the entities of these (live) slots
+        indices = np.asarray(indices)
+        if len(indices) == 0:
+            return
+        self.alive[indices] = False
+        for index in indices.tolist():
+            heapq.heappush(self.free, index)
+        self.count -= len(indices)
+
+    def clear(self):
+        self.alive[:] = False
+        self.free = list(range(self.capacity))
+        self.count = 0
+
+    def indices(self):
+        return self.alive.nonzero()[0]
+
+    def snapshot(self):
+        # slots up to the last live one (lowest free slots are reused first, so few dead slots):
+        # count, then x, y (int32), direction, label (int8), alive
+        indices = self.alive.nonzero()[0]
+        high = int(indices[-1]) + 1 if len(indices) else 0
+        return b''.join((struct.pack('<i', high), self.x[:high].tobytes(), self.y[:high].tobytes(),
+                         self.direction[:high].tobytes(), self.label[:high].tobytes(), self.alive[:high].tobytes()))
+
+    def restore(self, data, offset=0):
+        # inverse of snapshot(), reads from data[offset:] and returns the offset after the pool
+        (high,) = struct.unpack_from('<i', data, offset)
+        offset += 4
+        if high > self.capacity and self.growable:
+            self.grow(high)
+        for array in (self.x, self.y, self.direction, self.label, self.alive):
+            array[:high] = np.frombuffer(data, dtype=array.dtype, count=high, offset=offset)
+            offset += high * array.itemsize
+        self.alive[high:] = False
+        free = (~self.alive).nonzero()[0]
+        self.free = free.tolist() # sorted: already a heap
+        self.count = self.capacity - len(free)
+        return offset
+
+    def __iter__(self):
+        # snapshot of the live slots: entities can be removed while iterating
+        entities = self.entities
+        return iter([entities[i] for i in self.alive.nonzero()[0].tolist()])
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, entity):
+        return entity.pool is self and self.alive[entity.index]
+
+
+class Entity:
+    # handle on one slot of an EntityPool
+    __slots__ = ('pool', 'index')
+
+    def __init__(self, x, y, direction, label):
+        # standalone entity, backed by its own one-slot pool
+        pool = EntityPool(1, type(self))
+        pool.entities[0] = self
+        self.pool = pool
+        self.index = 0
+        pool.spawn(x, y, direction, label)
+
+    @property
+    def x(self):
+        return self.pool.x[self.index]
+
+    @x.setter
+    def x(self, value):
+        self.pool.x[self.index] = value
+
+    @property
+    def y(self):
+        return self.pool.y[self.index]
+
+    @y.setter
+    def y(self, value):
+        self.pool.y[self.index] = value
+
+    @property
+    def direction(self):
+        return self.pool.direction[self.index]
+
+    @direction.setter
+    def direction(self, value):
+        self.pool.direction[self.index] = value
+
+    @property
+    def label(self):
+        return self.pool.label[self.index]
+
+    def info(self):
+        i = self.index
+        return (int(self.pool.x[i]), int(self.pool.y[i]), int(self.pool.direction[i]), int(self.pool.label[i]))
+
+
+class Tank(Entity):
+    __slots__ = ()
+
     def __init__(self, x, y, direction, label=1):
         # defined by the center (a tank = 3x3 in display)
         # Direction: 0 = up, 1 = right, 2 = down, 3 = left
         # label: 0 = player, 1 = enemy
-        self.x = x
-        self.y = y
-        self.direction = direction
-        self.label = label
-    
-    def info(self):
-        return (self.x, self.y, np.argmax(self.direction), self.label)
-    
+        super().__init__(x, y, direction, label)
+
     def copy(self):
-        direction_copy = self.direction.copy()
-        return Tank(self.x, self.y, direction_copy, self.label)
+        return Tank(self.x, self.y, self.direction, self.label)
 
-    def update(self, action, state, occupied_positions, bondaries):
+    def update(self, action, state, grid, bondaries):
         # action: 0: up, 1: right, 2: down, 3: left, 4: stay, 5: shoot
-        occupied_positions.remove((self.x, self.y))
+        # grid: OccupancyGrid shared with the environment
         if not (action == 4 or action == 5):
             #if it matches, move forward
-            if self.direction[action] == 1:
-                x = self.x + self.direction[1] - self.direction[3] # right - left
-                y = self.y + self.direction[2] - self.direction[0] # down - up
+            if self.direction == action:
+                x = self.x + DX[action]
+                y = self.y + DY[action]
                 if x < 0 or x >= bondaries['max_x'] or y < 0 or y >= bondaries['max_y']:
-                    occupied_positions.add((self.x, self.y))
                     return
                 # check collision with other tanks
-                # check if the 9 squares are arround the tank are occupied
-                boxes = [(x + i, y + j) for i in range(-2, 3) for j in range(-2, 3)]
-                if any(box in occupied_positions for box in boxes):
-                    occupied_positions.add((self.x, self.y))
+                # the grid must not see the tank itself when checking the 5x5 box around the new position
+                grid.remove_tank(self.x, self.y)
+                if grid.is_blocked(x, y):
+                    grid.add_tank(self.x, self.y)
                     return
                 self.x = x
                 self.y = y
+                grid.add_tank(x, y)
 
             #if it doesn't, rotate
             else:
-                self.direction = [0,0,0,0]
-                self.direction[action] = 1
+                self.direction = action
 
-        occupied_positions.add((self.x, self.y))
         if action == 5:
             self.shoot(state)
         
     
-    def update_strategic(self, state, occupied_positions, bondaries, strategy=0):
+    def update_strategic(self, state, grid, bondaries, rng, strategy=0):
+        # rng: np.random.Generator of the environment (TankEnv.np_random), so that a seed gives
+        # the same episode (TankEnv moves all its enemies at once with envs/enemy_ai.py, same policies)
         if strategy == 0:
             # random strategy
-            action = np.random.randint(0, 6) # TODO: change 5 to 6 after
-            self.update(action, state, occupied_positions, bondaries)
+            action = rng.integers(0, 6) # TODO: change 5 to 6 after
+            self.update(action, state, grid, bondaries)
         
         if strategy == 1:
             # follow more its direction with a probability of prob
             prob = 0.7
-            if np.random.rand() < prob:
-                action = np.argmax(self.direction)
-                self.update(action, state, occupied_positions, bondaries)
+            if rng.random() < prob:
+                action = self.direction
+                self.update(action, state, grid, bondaries)
             else:
-                return self.update_strategic(state, occupied_positions, bondaries, strategy=0)
+                return self.update_strategic(state, grid, bondaries, strategy=0, rng=rng)
 
         if strategy == 2:
             # go to the player with a probability of prob
             prob = 0.1
-            if np.random.rand() < prob:
+            if rng.random() < prob:
                 # go to the player
                 if self.x < state['player'].x:
                     action = 1
@@ -77,37 +240,18 @@ class Tank:
                     action = 0
                 else:
                     action = 4
-                self.update(action, state, occupied_positions, bondaries)
+                self.update(action, state, grid, bondaries)
             else:
-                return self.update_strategic(state, occupied_positions, bondaries, strategy=1)
+                return self.update_strategic(state, grid, bondaries, strategy=1, rng=rng)
             
 
     def shoot(self, state):
         # create a new projectile
         # to be called after the updating of the projectiles
-        p = Projectile(
-            self.x + 2*(self.direction[1] - self.direction[3]),
-            self.y + 2*(self.direction[2] - self.direction[0]),
-            self.direction,
-            label=self.label
-        )
-        state['projectiles'].add(p)
-
-class Projectile:
-    def __init__(self, x, y, direction, label):
-        self.x = x
-        self.y = y
-        self.direction = direction
-        self.label = label
+        d = self.direction
+        state['projectiles'].spawn(self.x + 2*DX[d], self.y + 2*DY[d], d, self.label)
 
-    def info(self):
-        return (self.x, self.y, np.argmax(self.direction), self.label)
 
-    def update(self, state, bondaries):
-        # move
-        self.x += self.direction[1] - self.direction[3] # right - left
-        self.y += self.direction[2] - self.direction[0] # down - up
-        
-        # check if it's out of bondaries
-        if self.x <= -1 or self.x > bondaries['max_x'] or self.y <= -1 or self.y > bondaries['max_y']: # add + or - 1 because of padding
-            state['projectiles'].remove(self)
+class Projectile(Entity):
+    # moved, cancelled and removed in bulk on the arrays of the pool (TankEnv.move_projectiles)
+    __slots__ = ()
@@ -0,0 +1,210 @@
+import numpy as np
+
+from envs.occupancy_grid import PAD
+
+# Compiled kernels of TankEnv.step (backend='numba'): plain loops over the arrays of the pools and
+# of the occupancy grid, same rules and same order as the NumPy code of TankEnv (slot order), so
+# both backends give the same episodes. Without numba the functions are left as plain Python
+# (only useful to debug them, NUMBA_DISABLE_JIT=1 does the same) and TankEnv falls back to NumPy.
+try:
+    import numba
+except ImportError:
+    numba = None
+
+HAVE_NUMBA = numba is not None
+
+
+def _jit(function):
+    if numba is None:
+        return function
+    return numba.njit(cache=True, nogil=True)(function)
+
+
+@_jit
+def _step_x(direction):
+    return (0, 1, 0, -1)[direction]
+
+
+@_jit
+def _step_y(direction):
+    return (-1, 0, 1, 0)[direction]
+
+
+@_jit
+def _cell(x, y, width):
+    # key of envs.projectiles.cell_keys (same wrap-around for the projectiles off the grid, so the
+    # same pairs as the NumPy code) shifted by two rows: projectiles spawn up to 2 cells off the grid
+    # (tank + 2 * direction) and go one more cell out before being removed
+    return (y + 3) * width + x + 1
+
+
+def cells_size(max_x, max_y):
+    # size of the head buffer of cancel_projectiles / move_projectiles
+    return (max_y + 6) * (max_x + 3)
+
+
+@_jit
+def cancel_projectiles(px, py, label, alive, max_x, max_y, head):
+    # same-cell cancellation, rule of TankEnv.cancel_projectiles: in each cell, in slot order, a
+    # projectile still there cancels itself and the first later projectile of the other label.
+    # head: int array of cells_size(max_x, max_y) cells filled with -1 (left as found).
+    # Clears alive and returns the slots removed.
+    width = max_x + 3
+    n = len(alive)
+    following = np.full(n, -1, np.int64) # next projectile of the same cell
+    tail = np.full(n, -1, np.int64) # last projectile of the cell of a head
+    cells = np.empty(n, np.int64)
+    count = 0
+    for i in range(n):
+        if not alive[i]:
+            continue
+        cell = _cell(px[i], py[i], width)
+        first = head[cell]
+        if first < 0:
+            head[cell] = i
+            tail[i] = i
+            cells[count] = cell
+            count += 1
+        else:
+            following[tail[first]] = i
+            tail[first] = i
+
+    gone = np.zeros(n, np.bool_)
+    for c in range(count):
+        first = head[cells[c]]
+        head[cells[c]] = -1
+        if following[first] < 0:
+            continue
+        i = first
+        while i >= 0:
+            if not gone[i]:
+                j = following[i]
+                while j >= 0 and label[j] == label[i]:
+                    j = following[j]
+                if j >= 0:
+                    gone[i] = True
+                    gone[j] = True
+            i = following[i]
+    removed = np.empty(n, np.int64)
+    k = 0
+    for i in range(n):
+        if gone[i]:
+            alive[i] = False
+            removed[k] = i
+            k += 1
+    return removed[:k]
+
+
+@_jit
+def kill_enemies(ex, ey, enemy_alive, px, py, label, alive):
+    # rule of TankEnv.kill_enemies: each enemy (slot order) is destroyed by the first player
+    # projectile (slot order, not used yet) in its 5x5 box. Clears the alive flags and returns
+    # (killed enemy slots, used projectile slots)
+    killed = np.empty(len(enemy_alive), np.int64)
+    used = np.empty(len(enemy_alive), np.int64)
+    k = 0
+    for e in range(len(enemy_alive)):
+        if not enemy_alive[e]:
+            continue
+        for p in range(len(alive)):
+            if alive[p] and label[p] == 0 and abs(px[p] - ex[e]) <= PAD and abs(py[p] - ey[e]) <= PAD:
+                alive[p] = False
+                enemy_alive[e] = False
+                killed[k] = e
+                used[k] = p
+                k += 1
+                break
+    return killed[:k], used[:k]
+
+
+@_jit
+def player_hit(px, py, label, alive, x, y):
+    for p in range(len(alive)):
+        if alive[p] and label[p] == 1 and abs(px[p] - x) <= PAD and abs(py[p] - y) <= PAD:
+            return True
+    return False
+
+
+@_jit
+def move_projectiles(px, py, direction, label, alive, max_x, max_y, head):
+    # rule of TankEnv.move_projectiles: one cell forward; a player projectile going a -> b and an
+    # enemy one going b -> a cancel (k-th with k-th in slot order), then the ones out of the grid
+    # go. head: as in cancel_projectiles. Returns the slots removed.
+    width = max_x + 3
+    n = len(alive)
+    following = np.full(n, -1, np.int64) # enemy projectiles by cell before the move, slot order
+    tail = np.full(n, -1, np.int64)
+    cells = np.empty(n, np.int64)
+    count = 0
+    for i in range(n):
+        if alive[i] and label[i] == 1:
+            cell = _cell(px[i], py[i], width)
+            first = head[cell]
+            if first < 0:
+                head[cell] = i
+                tail[i] = i
+                cells[count] = cell
+                count += 1
+            else:
+                following[tail[first]] = i
+                tail[first] = i
+
+    gone = np.zeros(n, np.bool_)
+    if count > 0:
+        for i in range(n):
+            if not (alive[i] and label[i] == 0):
+                continue
+            d = direction[i]
+            # enemy projectiles on the target cell, coming the opposite way, not matched yet
+            j = head[_cell(px[i] + _step_x(d), py[i] + _step_y(d), width)]
+            while j >= 0 and (gone[j] or direction[j] != (d + 2) % 4):
+                j = following[j]
+            if j >= 0:
+                gone[i] = True
+                gone[j] = True
+        for c in range(count):
+            head[cells[c]] = -1
+
+    removed = np.empty(n, np.int64)
+    k = 0
+    for i in range(n):
+        if not alive[i]:
+            continue
+        x = px[i] + _step_x(direction[i])
+        y = py[i] + _step_y(direction[i])
+        px[i] = x
+        py[i] = y
+        if gone[i] or x <= -1 or x > max_x or y <= -1 or y > max_y:
+            alive[i] = False
+            removed[k] = i
+            k += 1
+    return removed[:k]
+
+
+@_jit
+def move_tanks(x, y, direction, slots, actions, tanks, max_x, max_y):
+    # Tank.update for the tanks of these slots, one after the other, on the tank layer of the
+    # occupancy grid (5x5 stamps). Returns the slots of the tanks that shoot (action 5), in order.
+    shooters = np.empty(len(slots), np.int64)
+    k = 0
+    for s in range(len(slots)):
+        i = slots[s]
+        action = actions[s]
+        if action < 4:
+            if direction[i] == action:
+                nx = x[i] + _step_x(action)
+                ny = y[i] + _step_y(action)
+                if 0 <= nx < max_x and 0 <= ny < max_y:
+                    tanks[y[i]:y[i] + 2 * PAD + 1, x[i]:x[i] + 2 * PAD + 1] -= 1
+                    if tanks[ny + PAD, nx + PAD] > 0:
+                        tanks[y[i]:y[i] + 2 * PAD + 1, x[i]:x[i] + 2 * PAD + 1] += 1
+                    else:
+                        x[i] = nx
+                        y[i] = ny
+                        tanks[ny:ny + 2 * PAD + 1, nx:nx + 2 * PAD + 1] += 1
+            else:
+                direction[i] = action
+        elif action == 5:
+            shooters[k] = i
+            k += 1
+    return shooters[:k]
@@ -0,0 +1,123 @@
+from envs.tank_env import TankEnv
+from envs.game_elements import Tank, Projectile, EntityPool
+from envs.chunks import ChunkIndex, ChunkedOccupancy, DEFAULT_CHUNK_SIZE
+from envs.observation import WindowEncoder
+from envs.renderer import TankRenderer
+
+from gym import spaces
+
+import numpy as np
+
+# tirages d'une position libre pour faire apparaître un ennemi
+SPAWN_TRIES = 32
+
+
+class LargeTankEnv(TankEnv):
+    """TankEnv pour les grandes cartes (plusieurs centaines de cases de côté, beaucoup d'ennemis).
+
+    Mêmes règles et même boucle step() que TankEnv, mais rien n'a la taille de la carte:
+    - tanks rangés par chunks de chunk_size x chunk_size cases (chunks.ChunkedOccupancy), les
+      collisions (déplacements, destructions) ne cherchent que dans les chunks voisins;
+    - pool de projectiles qui grandit à la demande (max_projectiles: capacité de départ)
+      au lieu de max_x * max_y slots;
+    - observation égocentrique (obs_mode='window'): les (2 * window_radius + 1)^2 cases autour
+      du joueur (observation.WindowEncoder), render() dessine la même fenêtre;
+    - apparition des ennemis par tirages au hasard d'une position libre (SPAWN_TRIES essais)
+      au lieu d'un tirage parmi tous les centres libres.
+    La mémoire et le temps d'un step dépendent du nombre d'entités, pas de la surface.
+    Les épisodes ne sont pas ceux d'un TankEnv de même seed (apparitions), mais
+    get_state() / set_state() et les EpisodeRecorder marchent de la même façon.
+    Backend NumPy seulement (les noyaux numba travaillent sur des tableaux de la taille de la carte).
+    """
+
+    obs_modes = ('state', 'window')
+
+    def __init__(self, max_x = 256, max_y = 256, max_enemies_on_screen = 64, total_ennemies_to_kill = 1000, obs_mode = 'window', window_radius = 10, chunk_size = DEFAULT_CHUNK_SIZE, max_projectiles = None, verbose = True, profiler = None, recorder = None):
+        self.window_radius = window_radius
+        self.chunk_size = chunk_size
+        self._initial_projectiles = max_projectiles # None: 8 tirs par tank
+        super(LargeTankEnv, self).__init__(max_x, max_y, max_enemies_on_screen, total_ennemies_to_kill, obs_mode, verbose, profiler, 'numpy', recorder)
+
+    def _build_state(self):
+        # pool de projectiles qui grandit à la demande, tanks rangés par chunks
+        self.max_projectiles = self._initial_projectiles if self._initial_projectiles is not None else 8 * (self.max_enemies_on_screen + 1)
+        self.state = {
+            'player': Tank(0, 0, 0, label=0),
+            'enemies': EntityPool(self.max_enemies_on_screen, Tank),
+            'projectiles': EntityPool(self.max_projectiles, Projectile, growable=True),
+        }
+        self.grid = ChunkedOccupancy(self.max_x, self.max_y, self.chunk_size)
+
+    def _build_observation(self):
+        self.encoder = WindowEncoder(self.window_radius, self.max_x, self.max_y)
+        self.observation_space = spaces.Dict({
+            'player': spaces.Box(low=np.array([0, 0, 0]), high=np.array([self.max_x, self.max_y, 4]), dtype=np.int32), # x, y, direction
+            'window': spaces.Box(low=0, high=4, shape=self.encoder.shapes['window'], dtype=np.int8), # cf. WindowEncoder
+        })
+        size = self.encoder.size
+        self.renderer = TankRenderer(size, size) # fenêtre autour du joueur
+
+    def spawn_enemy(self):
+        # un ennemi sur une position tirée au hasard parmi toute la carte, retirée si un tank est
+        # dans sa boite 5x5; None si SPAWN_TRIES tirages n'ont pas trouvé de place
+        if self.profiler is not None:
+            self.profiler.count('spawn_attempts')
+        rng = self.np_random
+        for _ in range(SPAWN_TRIES):
+            x = int(rng.integers(0, self.max_x))
+            y = int(rng.integers(0, self.max_y))
+            if not self.grid.is_blocked(x, y):
+                direction = rng.integers(0, 4)
+                enemy = self.state['enemies'].spawn(x, y, direction, label=1)
+                self.grid.add_tank(x, y)
+                return enemy
+        if self.profiler is not None:
+            self.profiler.count('spawn_no_room')
+        return None
+
+    def kill_enemies(self):
+        # même règle que TankEnv.kill_enemies, les paires (ennemi, tir du joueur) proches sont
+        # cherchées dans les chunks voisins au lieu de la matrice ennemis x tirs
+        enemies = self.state['enemies']
+        projectiles = self.state['projectiles']
+        shots = projectiles.indices()
+        shots = shots[projectiles.label[shots] == 0]
+        targets = enemies.indices()
+        if len(shots) == 0 or len(targets) == 0:
+            return 0
+        ex, ey = enemies.x[targets], enemies.y[targets]
+        sx, sy = projectiles.x[shots], projectiles.y[shots]
+        index = ChunkIndex(self.max_x, self.max_y, self.chunk_size).build(sx, sy)
+        hits, by = index.near(ex, ey, sx, sy) # triés par ennemi puis par tir
+        if self.profiler is not None:
+            self.profiler.count('collision_checks', len(hits))
+        if len(hits) == 0:
+            return 0
+        starts = np.searchsorted(hits, np.arange(len(targets) + 1))
+        kills = []
+        used = np.zeros(len(shots), dtype=bool)
+        for k in np.unique(hits).tolist():
+            candidates = by[starts[k]:starts[k + 1]]
+            candidates = candidates[~used[candidates]]
+            if len(candidates):
+                used[candidates[0]] = True
+                kills.append(k)
+        if kills:
+            enemies.remove_indices(targets[kills])
+            for k in kills:
+                self.grid.remove_tank(ex[k], ey[k])
+            projectiles.remove_indices(shots[used])
+            if self.profiler is not None:
+                self.profiler.count('kills', len(kills))
+        return len(kills)
+
+    def observe(self):
+        if self.obs_mode == 'state':
+            return self.state
+        return self.encoder.encode(self.state)
+
+    def render(self, mode='human'):
+        # fenêtre de l'observation autour du joueur (même padding d'une case que TankEnv.render)
+        player = self.state['player']
+        origin = (int(player.x) - self.window_radius, int(player.y) - self.window_radius)
+        return self.renderer.render(self.state, origin)
@@ -0,0 +1,147 @@
+import numpy as np
+
+
+class ObservationEncoder:
+    # writes the state of a TankEnv into preallocated int32 buffers, in place, with the shapes
+    # declared in TankEnv.observation_space:
+    #   player (3,)                x, y, direction
+    #   enemies (E, 3)             x, y, direction, rows [0, count) are valid, the rest is zero
+    #   enemies_mask (E,)          1 for valid rows
+    #   enemies_count (1,)
+    #   projectiles (P, 4)         x, y, direction, label
+    #   projectiles_mask (P,)
+    #   projectiles_count (1,)
+    # encode() returns read-only views on these buffers: they are overwritten by the next call,
+    # copy them to keep an observation.
+    # With packed=True all the fields are views on one flat buffer (self.packed), which can be
+    # stored as is in a replay buffer and split back into fields with unpack().
+    def __init__(self, max_enemies, max_projectiles, packed=False):
+        self.max_enemies = max_enemies
+        self.max_projectiles = max_projectiles
+        self.shapes = {
+            'player': (3,),
+            'enemies': (max_enemies, 3),
+            'enemies_mask': (max_enemies,),
+            'enemies_count': (1,),
+            'projectiles': (max_projectiles, 4),
+            'projectiles_mask': (max_projectiles,),
+            'projectiles_count': (1,),
+        }
+        # offsets of the fields in the packed layout
+        self.offsets = {}
+        size = 0
+        for key, shape in self.shapes.items():
+            self.offsets[key] = (size, size + int(np.prod(shape)))
+            size += int(np.prod(shape))
+        self.size = size
+
+        if packed:
+            self._packed = np.zeros(size, dtype=np.int32)
+            self._buffers = self.unpack(self._packed)
+            self.packed = self._packed.view()
+            self.packed.flags.writeable = False
+        else:
+            self._packed = None
+            self._buffers = {key: np.zeros(shape, dtype=np.int32) for key, shape in self.shapes.items()}
+            self.packed = None
+
+        self.observation = {}
+        for key, buffer in self._buffers.items():
+            view = buffer.view()
+            view.flags.writeable = False
+            self.observation[key] = view
+
+        # number of valid rows written by the previous call, to only clear what changed
+        self._enemies_count = 0
+        self._projectiles_count = 0
+
+    def unpack(self, flat):
+        # split a packed observation (or a batch of them, shape (..., size)) into fields, without copy
+        batch = flat.shape[:-1]
+        return {key: flat[..., start:end].reshape(batch + self.shapes[key])
+                for key, (start, end) in self.offsets.items()}
+
+    def _fill(self, pool, rows, mask, count, previous, fields):
+        indices = pool.indices()
+        n = len(indices)
+        for column, field in enumerate(fields):
+            rows[:n, column] = field[indices]
+        if previous > n:
+            # rows that were valid at the previous call
+            rows[n:previous] = 0
+            mask[n:previous] = 0
+        else:
+            mask[previous:n] = 1
+        count[0] = n
+        return n
+
+    def encode(self, state):
+        buffers = self._buffers
+        player = state['player']
+        buffers['player'][:] = (player.x, player.y, player.direction)
+
+        enemies = state['enemies']
+        self._enemies_count = self._fill(enemies, buffers['enemies'], buffers['enemies_mask'],
+                                         buffers['enemies_count'], self._enemies_count,
+                                         (enemies.x, enemies.y, enemies.direction))
+        projectiles = state['projectiles']
+        self._projectiles_count = self._fill(projectiles, buffers['projectiles'], buffers['projectiles_mask'],
+                                             buffers['projectiles_count'], self._projectiles_count,
+                                             (projectiles.x, projectiles.y, projectiles.direction, projectiles.label))
+        # new dict (cheap), same read-only views
+        return dict(self.observation)
+
+
+class WindowEncoder:
+    # egocentric observation of a large map (LargeTankEnv obs_mode='window'): the
+    # (2 * radius + 1)^2 cells around the player, one int8 layer per channel, the player at the center:
+    #   outside            1 outside the map
+    #   enemies            direction + 1 on the enemy tank centers, 0 elsewhere
+    #   player_projectiles direction + 1 on the cells with a player projectile
+    #   enemy_projectiles  direction + 1 on the cells with an enemy projectile
+    # plus player (3,): x, y, direction on the map. Same size whatever the map: only the entities
+    # in the window are written. Read-only views, overwritten by the next call.
+    CHANNELS = ('outside', 'enemies', 'player_projectiles', 'enemy_projectiles')
+
+    def __init__(self, radius, max_x, max_y):
+        self.radius = radius
+        self.size = 2 * radius + 1
+        self.max_x = max_x
+        self.max_y = max_y
+        self.shapes = {'player': (3,), 'window': (len(self.CHANNELS), self.size, self.size)}
+        self._player = np.zeros(3, dtype=np.int32)
+        self._window = np.zeros(self.shapes['window'], dtype=np.int8)
+        self.observation = {}
+        for key, buffer in (('player', self._player), ('window', self._window)):
+            view = buffer.view()
+            view.flags.writeable = False
+            self.observation[key] = view
+
+    def _mark(self, layer, x, y, direction, left, top):
+        # direction + 1 on the cells of the window
+        column, row = x - left, y - top
+        inside = (column >= 0) & (column < self.size) & (row >= 0) & (row < self.size)
+        layer[row[inside], column[inside]] = direction[inside] + 1
+
+    def encode(self, state):
+        player = state['player']
+        px, py = int(player.x), int(player.y)
+        self._player[:] = (px, py, player.direction)
+        left, top = px - self.radius, py - self.radius
+        window = self._window
+        window.fill(0)
+        columns = np.arange(left, left + self.size)
+        rows = np.arange(top, top + self.size)
+        window[0] = ((rows < 0) | (rows >= self.max_y))[:, None] | ((columns < 0) | (columns >= self.max_x))[None, :]
+
+        enemies = state['enemies']
+        indices = enemies.indices()
+        self._mark(window[1], enemies.x[indices], enemies.y[indices], enemies.direction[indices], left, top)
+        projectiles = state['projectiles']
+        indices = projectiles.indices()
+        label = projectiles.label[indices]
+        for channel, side in ((2, 0), (3, 1)):
+            mine = indices[label == side]
+            self._mark(window[channel], projectiles.x[mine], projectiles.y[mine], projectiles.direction[mine],
+                       left, top)
+        return dict(self.observation)
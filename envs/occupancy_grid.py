@@ -0,0 +1,80 @@
+import numpy as np
+
+PAD = 2 # half size of the 5x5 box around a tank center
+NO_SHOT = np.iinfo(np.int64).max # empty cell of the shot layer
+
+
+class OccupancyGrid:
+    def __init__(self, max_x, max_y):
+        # tanks: each tank stamps +1 on the 5x5 box around its center,
+        # so "is there a tank center in the 5x5 box around (x, y)" is a single lookup
+        self.max_x = max_x
+        self.max_y = max_y
+        self.tanks = np.zeros((max_y + 2 * PAD, max_x + 2 * PAD), dtype=np.int16)
+        # flat offsets of the 5x5 box from its top-left corner (move_tanks)
+        box = np.arange(2 * PAD + 1)
+        self._box_offsets = (box[:, None] * self.tanks.shape[1] + box).ravel()
+        # shots: same cells as the tank layer, stamped with the first (lowest index) shot of each cell
+        # by first_shots and emptied before it returns (projectiles live in the arrays of their pool)
+        self.shots = np.full(self.tanks.shape, NO_SHOT, dtype=np.int64)
+
+    def clear(self):
+        self.tanks.fill(0)
+
+    ##################### tanks #####################
+
+    def add_tank(self, x, y):
+        self.tanks[y:y + 2 * PAD + 1, x:x + 2 * PAD + 1] += 1
+
+    def remove_tank(self, x, y):
+        self.tanks[y:y + 2 * PAD + 1, x:x + 2 * PAD + 1] -= 1
+
+    def set_tanks(self, xs, ys):
+        # rebuild the tank layer from the centers of all the tanks
+        centers = np.asarray(ys) * self.tanks.shape[1] + xs
+        cells = (centers[:, None] + self._box_offsets).ravel()
+        self.tanks[...] = np.bincount(cells, minlength=self.tanks.size).reshape(self.tanks.shape)
+
+    def move_tanks(self, old_x, old_y, new_x, new_y):
+        # remove_tank on the old centers and add_tank on the new ones, for arrays of tanks at once
+        if len(old_x) <= 2:
+            # a few tanks: slices are cheaper
+            for x, y, nx, ny in zip(old_x, old_y, new_x, new_y):
+                self.remove_tank(x, y)
+                self.add_tank(nx, ny)
+            return
+        width = self.tanks.shape[1]
+        centers = np.concatenate((np.asarray(old_y) * width + old_x, np.asarray(new_y) * width + new_x))
+        cells = (centers[:, None] + self._box_offsets).ravel()
+        signs = np.repeat([-1.0, 1.0], len(old_x) * self._box_offsets.size)
+        change = np.bincount(cells, weights=signs, minlength=self.tanks.size)
+        self.tanks += change.reshape(self.tanks.shape).astype(self.tanks.dtype)
+
+    def is_blocked(self, x, y):
+        # True if a tank center is in the 5x5 box around (x, y)
+        return self.tanks[y + PAD, x + PAD] > 0
+
+    def free_centers(self):
+        # flat indices (y * max_x + x, row-major) of the centers where a tank fits
+        return np.flatnonzero(self.tanks[PAD:PAD + self.max_y, PAD:PAD + self.max_x] == 0)
+
+    ##################### shots #####################
+
+    def first_shots(self, shot_x, shot_y, xs, ys):
+        # for each tank center (xs, ys): index in shot_x / shot_y of the first shot in its 5x5 box,
+        # NO_SHOT if there is none. Shots are stamped on their cell once, then each box is 25 lookups,
+        # so the cost does not depend on the number of shots in the boxes.
+        shot_x = np.asarray(shot_x)
+        shot_y = np.asarray(shot_y)
+        height, width = self.shots.shape
+        # only the shots of the layer can be in the box of a tank of the grid
+        keep = np.flatnonzero((shot_x >= -PAD) & (shot_x < width - PAD) & (shot_y >= -PAD) & (shot_y < height - PAD))
+        if len(keep) == 0:
+            return np.full(len(xs), NO_SHOT, dtype=np.int64)
+        cells = (shot_y[keep] + PAD) * width + shot_x[keep] + PAD
+        flat = self.shots.ravel()
+        np.minimum.at(flat, cells, keep)
+        centers = np.asarray(ys) * width + xs
+        first = flat[centers[:, None] + self._box_offsets].min(axis=1)
+        flat[cells] = NO_SHOT
+        return first
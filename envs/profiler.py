@@ -0,0 +1,186 @@
+import cProfile
+import csv
+import json
+import pstats
+import time
+
+# phases of TankEnv.step, in order
+PHASES = ('cancel', 'spawn', 'kills', 'death', 'player', 'enemies', 'projectiles', 'observe')
+
+# counters summed over a step:
+#   spawn_attempts / spawn_no_room: enemy spawns tried / failed for lack of room
+#   kills: enemies destroyed
+#   cancel_checked: projectiles grouped by cell for the same-cell cancellation
+#   collision_checks: (enemy, player shot) pairs tested for kills, projectiles tested against the player
+#   swap_checked: projectiles tested for head-on swaps during the move
+COUNTERS = ('spawn_attempts', 'spawn_no_room', 'kills', 'cancel_checked', 'collision_checks', 'swap_checked')
+
+
+class StepProfiler:
+    # opt-in instrumentation of TankEnv: env = TankEnv(..., profiler=StepProfiler()) or
+    # env.profiler = StepProfiler(). Without a profiler, step() only pays a few `is not None` tests.
+    #
+    # Per step: time of every phase (perf_counter), the counters above, live enemies / projectiles.
+    # Per episode (from one reset to the next, or to finish()): sums of all that, steps, reward,
+    # peaks of live entities. Hooks: subscribe('step', f) calls f(record) after every step,
+    # subscribe('episode', f) calls f(summary) when an episode is closed; records are plain dicts.
+    #
+    # cprofile_episodes=range(a, b): cProfile runs over episodes a..b-1 (counted from 0),
+    # see print_cprofile() / dump_cprofile(). keep_steps=True keeps every step record (to_csv(steps=True)).
+    def __init__(self, cprofile_episodes=None, keep_steps=False):
+        self.cprofile_episodes = cprofile_episodes if cprofile_episodes is not None else range(0)
+        self.cprofile = None
+        self.keep_steps = keep_steps
+        self.hooks = {'step': [], 'episode': []}
+
+        self.episode = -1 # index of the current episode, -1 before the first reset
+        self.episodes = [] # summaries of the closed episodes
+        self.steps = [] # step records (keep_steps)
+
+        self._phases = dict.fromkeys(PHASES, 0.0) # current step
+        self._counters = dict.fromkeys(COUNTERS, 0)
+        self._last = 0.0
+        self._summary = None # current episode
+
+    def subscribe(self, event, callback):
+        self.hooks[event].append(callback)
+        return callback
+
+    def unsubscribe(self, event, callback):
+        self.hooks[event].remove(callback)
+
+    ##################### called by TankEnv #####################
+
+    def start_episode(self):
+        self.finish()
+        self.episode += 1
+        self._summary = {'episode': self.episode, 'steps': 0, 'reward': 0.0, 'seconds': 0.0}
+        self._summary.update((f'time_{phase}', 0.0) for phase in PHASES)
+        self._summary.update((name, 0) for name in COUNTERS)
+        self._summary.update(max_enemies=0, max_projectiles=0, sum_enemies=0, sum_projectiles=0)
+        if self.episode in self.cprofile_episodes:
+            if self.cprofile is None:
+                self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def start_step(self):
+        if self._summary is None:
+            self.start_episode() # step() without reset() through the profiler
+        for phase in PHASES:
+            self._phases[phase] = 0.0
+        for name in COUNTERS:
+            self._counters[name] = 0
+        self._last = time.perf_counter()
+
+    def lap(self, phase):
+        # closes a phase: time since the previous lap (or start_step)
+        now = time.perf_counter()
+        self._phases[phase] += now - self._last
+        self._last = now
+
+    def count(self, name, n=1):
+        self._counters[name] += n
+
+    def end_step(self, env, reward, done):
+        enemies = len(env.state['enemies'])
+        projectiles = len(env.state['projectiles'])
+        summary = self._summary
+        summary['steps'] += 1
+        summary['reward'] += reward
+        for phase, seconds in self._phases.items():
+            summary[f'time_{phase}'] += seconds
+            summary['seconds'] += seconds
+        for name, n in self._counters.items():
+            summary[name] += n
+        summary['max_enemies'] = max(summary['max_enemies'], enemies)
+        summary['max_projectiles'] = max(summary['max_projectiles'], projectiles)
+        summary['sum_enemies'] += enemies
+        summary['sum_projectiles'] += projectiles
+
+        if self.keep_steps or self.hooks['step']:
+            record = {'episode': self.episode, 'step': summary['steps'] - 1, 'reward': reward, 'done': done,
+                      'enemies': enemies, 'projectiles': projectiles}
+            record.update((f'time_{phase}', seconds) for phase, seconds in self._phases.items())
+            record.update(self._counters)
+            if self.keep_steps:
+                self.steps.append(record)
+            for callback in self.hooks['step']:
+                callback(record)
+
+    def finish(self):
+        # closes the current episode (done at the next reset, call it after the last one)
+        summary = self._summary
+        if summary is None:
+            return
+        self._summary = None
+        if self.cprofile is not None and self.episode in self.cprofile_episodes:
+            self.cprofile.disable()
+        steps = max(summary['steps'], 1)
+        summary['mean_enemies'] = summary.pop('sum_enemies') / steps
+        summary['mean_projectiles'] = summary.pop('sum_projectiles') / steps
+        self.episodes.append(summary)
+        for callback in self.hooks['episode']:
+            callback(summary)
+
+    ##################### results #####################
+
+    def summary(self):
+        # totals over the closed episodes: time per phase (total, microseconds per step, share) and counters
+        steps = sum(e['steps'] for e in self.episodes)
+        seconds = sum(e['seconds'] for e in self.episodes)
+        per_step = max(steps, 1)
+        phases = {}
+        for phase in PHASES:
+            total = sum(e[f'time_{phase}'] for e in self.episodes)
+            phases[phase] = {'seconds': total, 'us_per_step': 1e6 * total / per_step,
+                             'share': total / seconds if seconds else 0.0}
+        counters = {}
+        for name in COUNTERS:
+            total = sum(e[name] for e in self.episodes)
+            counters[name] = {'total': total, 'per_step': total / per_step}
+        return {
+            'episodes': len(self.episodes),
+            'steps': steps,
+            'seconds': seconds,
+            'steps_per_second': steps / seconds if seconds else 0.0,
+            'phases': phases,
+            'counters': counters,
+        }
+
+    def report(self):
+        summary = self.summary()
+        lines = [f"{summary['episodes']} episodes, {summary['steps']} steps, "
+                 f"{summary['steps_per_second']:.0f} steps/s (phases only)",
+                 f"{'phase':>12}  {'us/step':>8}  {'share':>6}"]
+        for phase, values in summary['phases'].items():
+            lines.append(f"{phase:>12}  {values['us_per_step']:8.2f}  {100 * values['share']:5.1f}%")
+        lines.append(f"{'counter':>16}  {'total':>10}  {'per step':>9}")
+        for name, values in summary['counters'].items():
+            lines.append(f"{name:>16}  {values['total']:10d}  {values['per_step']:9.3f}")
+        return '\n'.join(lines)
+
+    def to_json(self, path):
+        with open(path, 'w') as f:
+            json.dump({'summary': self.summary(), 'episodes': self.episodes}, f, indent=1)
+
+    def to_csv(self, path, steps=False):
+        # one row per episode (or per step with steps=True, needs keep_steps)
+        rows = self.steps if steps else self.episodes
+        if not rows:
+            return
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def print_cprofile(self, limit=25, sort='cumulative'):
+        if self.cprofile is None:
+            print("no cProfile data (cprofile_episodes)")
+            return
+        pstats.Stats(self.cprofile).sort_stats(sort).print_stats(limit)
+
+    def dump_cprofile(self, path):
+        # readable with pstats / snakeviz
+        if self.cprofile is None:
+            raise ValueError("no cProfile data to dump: no episode was run within cprofile_episodes")
+        self.cprofile.dump_stats(path)
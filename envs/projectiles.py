@@ -0,0 +1,99 @@
+import numpy as np
+
+# Cancellation of projectiles of different labels (0: player, 1: enemy), on arrays of live
+# projectiles given in priority order (slot order, environment by environment for VecTankEnv).
+# Cells are grouped by hashing: a key per cell, a stable sort, one reduceat per group.
+
+
+def cell_keys(x, y, max_x, max_y, env=None):
+    # one integer per cell; projectiles can be one cell outside [0, max_x] x [0, max_y] after a move
+    width, height = max_x + 3, max_y + 3
+    keys = (np.asarray(y, dtype=np.int64) + 1) * width + x + 1
+    if env is not None:
+        keys += np.asarray(env, dtype=np.int64) * (width * height)
+    return keys
+
+
+def _changes(values):
+    # True where a sorted array starts a new value
+    changes = np.empty(len(values), dtype=bool)
+    changes[0] = True
+    np.not_equal(values[1:], values[:-1], out=changes[1:])
+    return changes
+
+
+def _shared(keys, player):
+    # does a key appear for both labels (hash sets, cheaper than sorting for the usual few projectiles)
+    return not set(keys[player].tolist()).isdisjoint(keys[~player].tolist())
+
+
+def same_cell_cancellations(keys, labels):
+    # projectiles removed by the pair rule of TankEnv, applied cell by cell: going through the
+    # projectiles of the cell in order, one still there cancels itself and the first later projectile
+    # of the other label (even if already cancelled).
+    # In runs of same-label projectiles: everything before the last run goes, only the first
+    # projectile of a run can be cancelled before its turn (by the run before, if one projectile of
+    # that run is still there). So the last run survives, except its first projectile when it is
+    # "picked": always after a run of 2 or more, and the status flips along runs of one projectile.
+    removed = np.zeros(len(keys), dtype=bool)
+    if len(keys) < 2:
+        return removed
+    if not _shared(keys, labels == 0):
+        return removed
+    order = np.argsort(keys, kind='stable')
+    keys, labels = keys[order], labels[order]
+    new_cell = _changes(keys)
+    run_starts = np.flatnonzero(new_cell | _changes(labels))
+    run_sizes = np.diff(run_starts, append=len(keys))
+    runs = np.arange(len(run_starts))
+    first_run = new_cell[run_starts] # first run of its cell
+    cell_first_run = np.maximum.accumulate(np.where(first_run, runs, 0))
+    last_run = np.append(first_run[1:], True)
+    mixed = last_run & ~first_run # last run of a cell with both labels
+    if not mixed.any():
+        return removed
+
+    # number of consecutive runs of one projectile ending at each run, within the cell
+    reset = np.where(run_sizes > 1, runs, np.where(first_run, runs - 1, -1))
+    streak = runs - np.maximum.accumulate(reset)
+    m = runs[mixed]
+    t = streak[m - 1]
+    picked = (m - t != cell_first_run[m]) ^ (t % 2 == 1)
+
+    # removed: runs before the last one of a mixed cell, and the first of the last run if picked
+    mixed_cell = np.zeros(len(runs), dtype=bool)
+    mixed_cell[cell_first_run[m]] = True
+    element_removed = np.repeat(mixed_cell[cell_first_run] & ~last_run, run_sizes)
+    element_removed[run_starts[m[picked]]] = True
+    removed[order] = element_removed
+    return removed
+
+
+def swap_cancellations(old_keys, new_keys, labels):
+    # projectiles of different labels that exchanged their cells during the move (head-on shots on
+    # neighbouring cells never share a cell): the k-th of one label cancels the k-th of the other,
+    # in order, for each pair of cells
+    removed = np.zeros(len(labels), dtype=bool)
+    if len(labels) < 2:
+        return removed
+    span = max(old_keys.max(), new_keys.max()) + 1
+    # same segment key for a -> b (label 0) and b -> a (label 1)
+    player = labels == 0
+    segments = np.where(player, old_keys * span + new_keys, new_keys * span + old_keys)
+    if not _shared(segments, player):
+        return removed
+    order = np.lexsort((labels, segments)) # by segment, label, then input order
+    segments, sorted_labels = segments[order], labels[order]
+    starts = np.flatnonzero(_changes(segments) | _changes(sorted_labels))
+    sizes = np.diff(starts, append=len(segments))
+    # (segment, label) runs: a run of label 0 followed by a run of label 1 on the same segment
+    pairs = np.flatnonzero((segments[starts[1:]] == segments[starts[:-1]]))
+    if len(pairs) == 0:
+        return removed
+    count = np.minimum(sizes[pairs], sizes[pairs + 1])
+    rank = np.arange(len(segments)) - np.repeat(starts, sizes)
+    limit = np.zeros(len(starts), dtype=np.int64)
+    limit[pairs] = count
+    limit[pairs + 1] = count
+    removed[order] = rank < np.repeat(limit, sizes)
+    return removed
@@ -0,0 +1,169 @@
+import numpy as np
+
+BACKGROUND = 240
+PLAYER_COLOR = (92, 184, 92)
+ENEMY_COLOR = (240, 173, 78)
+PROJECTILE_COLORS = ((217, 100, 79), (217, 83, 79)) # by label: 0 = player, 1 = enemy
+
+# 3x3 tank sprites, one boolean mask per direction (0 = up, 1 = right, 2 = down, 3 = left)
+SPRITES = np.array([
+    [[0, 1, 0],
+     [1, 1, 1],
+     [1, 0, 1]], # up
+    [[1, 1, 0],
+     [0, 1, 1],
+     [1, 1, 0]], # right
+    [[1, 0, 1],
+     [1, 1, 1],
+     [0, 1, 0]], # down
+    [[0, 1, 1],
+     [1, 1, 0],
+     [0, 1, 1]], # left
+], dtype=bool)
+
+
+class TankRenderer:
+    # draws the state of a TankEnv into a persistent RGB frame (1 cell of padding on each side).
+    # Only what changed since the previous call is redrawn: the rectangles of entities that
+    # disappeared are cleared, then new entities, and old ones overlapping a cleared or redrawn
+    # rectangle, are drawn again. The returned frames are read-only views on internal buffers.
+    def __init__(self, max_x, max_y):
+        self.rows = max_y + 2
+        self.cols = max_x + 2
+        self._frame = np.full((self.rows, self.cols, 3), BACKGROUND, dtype=np.uint8)
+        self.frame = self._frame.view()
+        self.frame.flags.writeable = False
+
+        # items drawn in the current frame: key -> (y0, x0) top-left corner in the frame
+        # tanks: ('tank', x, y, direction, label), projectile cells: ('cell', x, y, color)
+        self._items = {}
+        # rectangles (y0, x0, y1, x1) changed by the last call
+        self.dirty = [(0, 0, self.rows, self.cols)]
+
+        # upscaled copies of the frame by scale, with the rectangles changed since their last update
+        self._scaled = {}
+        self._pending = {}
+        self._surfaces = {}
+
+    def _items_of(self, state, origin=(0, 0)):
+        # items of the cells seen by the frame, cell (origin) at the top-left corner inside the padding
+        ox, oy = origin
+        items = {}
+        player, enemies = state['player'], state['enemies']
+        indices = enemies.indices()
+        xs = np.append(player.x, enemies.x[indices]) - ox
+        ys = np.append(player.y, enemies.y[indices]) - oy
+        directions = np.append(player.direction, enemies.direction[indices])
+        labels = np.append(player.label, enemies.label[indices])
+        seen = (xs > -3) & (xs < self.cols) & (ys > -3) & (ys < self.rows)
+        for x, y, direction, label in zip(xs[seen].tolist(), ys[seen].tolist(), directions[seen].tolist(),
+                                          labels[seen].tolist()):
+            items[('tank', x, y, direction, label)] = (y, x) # 3x3 box centered on (x + 1, y + 1)
+        # one item per projectile cell, the last projectile drawn on a cell gives its color
+        projectiles = state['projectiles']
+        indices = projectiles.indices()
+        xs, ys = projectiles.x[indices] - ox, projectiles.y[indices] - oy
+        seen = (xs >= -1) & (xs < self.cols - 1) & (ys >= -1) & (ys < self.rows - 1)
+        cells = {}
+        for x, y, label in zip(xs[seen].tolist(), ys[seen].tolist(), projectiles.label[indices][seen].tolist()):
+            cells[(x, y)] = label
+        for (x, y), label in cells.items():
+            items[('cell', x, y, label)] = (y + 1, x + 1)
+        return items
+
+    def _rect(self, key, corner):
+        # clipped to the frame (tanks on the border of a window)
+        y0, x0 = corner
+        size = 3 if key[0] == 'tank' else 1
+        return (max(y0, 0), max(x0, 0), min(y0 + size, self.rows), min(x0 + size, self.cols))
+
+    @staticmethod
+    def _overlaps(rect, rects):
+        y0, x0, y1, x1 = rect
+        return any(y0 < b1 and b0 < y1 and x0 < c1 and c0 < x1 for b0, c0, b1, c1 in rects)
+
+    def _draw(self, key, corner):
+        y0, x0 = corner
+        if key[0] == 'tank':
+            color = PLAYER_COLOR if key[4] == 0 else ENEMY_COLOR
+            top, left, bottom, right = self._rect(key, corner)
+            sprite = SPRITES[key[3]][top - y0:bottom - y0, left - x0:right - x0]
+            self._frame[top:bottom, left:right][sprite] = color
+        else:
+            self._frame[y0, x0] = PROJECTILE_COLORS[key[3]]
+
+    def render(self, state, origin=(0, 0)):
+        # origin: map cell drawn at the top-left corner inside the padding, to draw a window of a
+        # larger map (LargeTankEnv)
+        items = self._items_of(state, origin)
+        old = self._items
+        removed = [self._rect(key, corner) for key, corner in old.items() if key not in items]
+        added = [key for key in items if key not in old]
+        self.dirty = list(removed)
+        if not removed and not added:
+            return self.frame # nothing moved: cached frame
+
+        for y0, x0, y1, x1 in removed:
+            self._frame[y0:y1, x0:x1] = BACKGROUND
+
+        # tanks first, then projectiles on top, like the original render
+        for kind in ('tank', 'cell'):
+            for key, corner in items.items():
+                if key[0] != kind:
+                    continue
+                rect = self._rect(key, corner)
+                if key not in old or self._overlaps(rect, self.dirty):
+                    self._draw(key, corner)
+                    self.dirty.append(rect)
+
+        self._items = items
+        for pending in self._pending.values():
+            pending.extend(self.dirty)
+        return self.frame
+
+    def clear(self):
+        self._frame[...] = BACKGROUND
+        self._items = {}
+        self.dirty = [(0, 0, self.rows, self.cols)]
+        for pending in self._pending.values():
+            pending.extend(self.dirty)
+
+    ##################### upscaled output #####################
+
+    def scaled(self, scale):
+        # frame upscaled by an integer factor (same result as np.repeat on both axes),
+        # only the rectangles changed since the last call with this scale are copied
+        if scale not in self._scaled:
+            buffer = np.empty((self.rows * scale, self.cols * scale, 3), dtype=np.uint8)
+            # (rows, scale, cols, scale, 3) view: each frame cell broadcasts to a scale x scale block
+            blocks = buffer.reshape(self.rows, scale, self.cols, scale, 3)
+            view = buffer.view()
+            view.flags.writeable = False
+            self._scaled[scale] = (blocks, view)
+            self._pending[scale] = [(0, 0, self.rows, self.cols)]
+        blocks, view = self._scaled[scale]
+        for y0, x0, y1, x1 in self._pending[scale]:
+            blocks[y0:y1, :, x0:x1, :] = self._frame[y0:y1, None, x0:x1, None]
+        self._pending[scale] = []
+        return view
+
+    def blit(self, screen, scale, position=(0, 0)):
+        # draws the upscaled frame on a pygame surface through a cached surface, where only the
+        # rectangles changed since the previous blit are written
+        # (same orientation as pygame.surfarray.make_surface(frame): frame rows are the x axis)
+        import pygame
+
+        key = ('surface', scale)
+        if key not in self._surfaces:
+            # same pixel format as the target: the final blit is a plain copy
+            self._surfaces[key] = pygame.Surface((self.rows * scale, self.cols * scale), 0, screen)
+            self._pending[key] = [(0, 0, self.rows, self.cols)]
+        surface = self._surfaces[key]
+        if self._pending[key]:
+            pixels = pygame.surfarray.pixels3d(surface) # locks the surface until deleted
+            for y0, x0, y1, x1 in self._pending[key]:
+                block = self._frame[y0:y1, x0:x1]
+                pixels[y0 * scale:y1 * scale, x0 * scale:x1 * scale] = block.repeat(scale, axis=0).repeat(scale, axis=1)
+            del pixels
+            self._pending[key] = []
+        screen.blit(surface, position)
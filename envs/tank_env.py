@@ -1,25 +1,64 @@
 from envs.game_elements import *
+from envs.occupancy_grid import OccupancyGrid, PAD, NO_SHOT
+from envs.observation import ObservationEncoder
+from envs.renderer import TankRenderer
+from envs.enemy_ai import enemy_actions, move_tanks
+from envs.projectiles import cell_keys, same_cell_cancellations, swap_cancellations
+from envs import kernels
 
 import gym
 from gym import spaces
 
 import matplotlib.pyplot as plt
 import numpy as np
+import struct
+import warnings
+
+# au-delà de ce nombre d'ennemis, déplacements vectorisés (enemy_ai.move_tanks)
+SCALAR_ENEMIES = 8
+# au-delà de ce nombre de paires (tirs du joueur x ennemis), impacts lus sur la grille d'occupation
+DENSE_HITS = 1024
+
+# get_state(): joueur (x, y, direction), done, état du PCG64 (state, inc, has_uint32, uinteger)
+SNAPSHOT_HEADER = struct.Struct('<iib?16s16s?I')
+
+
+def array_observation_space(max_x, max_y, max_enemies, max_projectiles):
+    # observations obs_mode='array' (cf. ObservationEncoder), aussi single_observation_space de VecTankEnv
+    dtypes = np.dtype('int32')
+    return spaces.Dict({
+        'player': spaces.Box(low=np.array([0, 0, 0]), high=np.array([max_x, max_y, 4]), dtype=dtypes),  # x, y, direction
+        'enemies': spaces.Box(low=np.zeros((max_enemies, 3), dtype=dtypes), high=np.array([max_x, max_y, 4] * max_enemies).reshape(max_enemies, 3), dtype=dtypes),
+        'projectiles': spaces.Box(low=np.zeros((max_projectiles, 4), dtype=dtypes), high=np.array([max_x, max_y, 4, 1] * max_projectiles).reshape(max_projectiles, 4), dtype=dtypes),  # x, y, direction, from (0: player, 1: enemy)
+        'enemies_mask': spaces.Box(low=0, high=1, shape=(max_enemies,), dtype=dtypes), # 1: ligne valide, 0: padding
+        'enemies_count': spaces.Box(low=0, high=max_enemies, shape=(1,), dtype=dtypes),
+        'projectiles_mask': spaces.Box(low=0, high=1, shape=(max_projectiles,), dtype=dtypes),
+        'projectiles_count': spaces.Box(low=0, high=max_projectiles, shape=(1,), dtype=dtypes),
+    })
+
 
 # Création de l'environnement
 class TankEnv(gym.Env):
     metadata = {'render.modes': ['human']}
-
-    def __init__(self, max_x = 20, max_y = 20, max_enemies_on_screen = 5, total_ennemies_to_kill = 20):
+    chunk_size = None # LargeTankEnv: déplacements des ennemis par chunks voisins (enemy_ai.move_tanks)
+    obs_modes = ('state', 'array', 'packed')
+
+    # règles du jeu (mêmes valeurs pour VecTankEnv et LargeTankEnv)
+    initial_ennemies = 2
+    probability_new_enemy = 0.01
+    reward_enemy_killed = 1
+    reward_player_dead = -10
+    reward_used_projectile = -0.1
+    reward_nothing = -0.1
+    timestep = -0.01
+
+    def __init__(self, max_x = 20, max_y = 20, max_enemies_on_screen = 5, total_ennemies_to_kill = 20, obs_mode = 'state', verbose = True, profiler = None, backend = 'numpy', recorder = None):
         super(TankEnv, self).__init__()
         
         self.max_x = max_x # Largeur de la grille
         self.max_y = max_y # Hauteur de la grille
         self.max_enemies_on_screen = max_enemies_on_screen
-        self.max_projectiles = max_x * max_y
-
         self.total_ennemies_to_kill = total_ennemies_to_kill
-        self.initial_ennemies = 2
 
         # assertions
         assert max_x > 0
@@ -27,136 +66,167 @@ class TankEnv(gym.Env):
         assert max_enemies_on_screen > 0
         assert max_enemies_on_screen <= total_ennemies_to_kill
         assert (max_enemies_on_screen + 1) * 9 * 2 <= max_x * max_y 
+        assert obs_mode in self.obs_modes
+        assert backend in ('numpy', 'numba')
 
         # Define action space
         self.action_space = spaces.Discrete(6)  # 0: up, 1: right, 2: down, 3: left, 4: stay, 5: shoot
-        
-        # Define observation space
-        dtypes = np.dtype('int32')
-        self.observation_space = spaces.Dict({
-            'player': spaces.Box(low=np.array([0, 0, 0]), high=np.array([self.max_x, self.max_y, 4]), dtype=dtypes),  # x, y, direction
-            'enemies': spaces.Box(low=np.zeros((self.max_enemies_on_screen, 3), dtype=dtypes), high=np.array([self.max_x, self.max_y, 4] * self.max_enemies_on_screen).reshape(self.max_enemies_on_screen, 3), dtype=dtypes),
-            'projectiles': spaces.Box(low=np.zeros((self.max_projectiles, 4), dtype=dtypes), high=np.array([self.max_x, self.max_y, 4, 1] * self.max_projectiles).reshape(self.max_projectiles, 4), dtype=dtypes)  # x, y, direction, from (0: player, 1: enemy)
-        })
 
+        # état (pools, grille d'occupation, renderer) puis observations, cf. LargeTankEnv pour les grandes cartes
+        self.obs_mode = obs_mode
+        self._build_state()
+        self._build_observation()
+
+        self.verbose = verbose # False: pas de message à chaque reset (entraînement)
+        self.done = False
+        self.info = {}
+
+        # instrumentation optionnelle (StepProfiler): temps par phase de step, compteurs, hooks
+        self.profiler = profiler
+        # enregistrement optionnel des épisodes (utils.episode_recorder.EpisodeRecorder): actions,
+        # récompenses et instantanés get_state() réguliers, pour rejouer n'importe quel step
+        self.recorder = recorder
+
+        # backend='numba': projectiles, collisions et déplacements des ennemis par les noyaux compilés
+        # de envs/kernels.py (mêmes épisodes); sans numba, retour à NumPy avec un avertissement
+        if backend == 'numba' and not kernels.HAVE_NUMBA:
+            warnings.warn("numba is not installed, TankEnv falls back to the NumPy backend")
+            backend = 'numpy'
+        self.backend = backend
+        self._cells = None # tampon des noyaux
+        if backend == 'numba':
+            self._cells = np.full(kernels.cells_size(self.max_x, self.max_y), -1, dtype=np.int64)
+
+        # Générateur aléatoire propre à l'environnement (apparitions, ennemis), cf. seed()
+        self.seed()
+
+    def _build_state(self):
         # Define state
+        # les ennemis et projectiles sont stockés dans des EntityPool de capacité fixe:
+        # pas d'allocation à l'apparition/disparition, et un ordre de mise à jour déterministe
+        # (par slot), donc un même seed donne toujours le même épisode (cf. VecTankEnv)
+        self.max_projectiles = self.max_x * self.max_y
         self.state = {
-            'player': set(),
-            'enemies': set(), # (Tank(0, 0, np.array([0, 0, 1, 0])), Tank(0, 0, np.array([0, 0, 1, 0])), ...)
-            'projectiles': set() # (Projectile(0, 0, np.array([0, 0, 1, 0]), label=0), Projectile(0, 0, np.array([0, 0, 1, 0]), label=1), ...)
+            'player': Tank(0, 0, 0, label=0),
+            'enemies': EntityPool(self.max_enemies_on_screen, Tank), # Tank(x, y, direction, label=1), ...
+            'projectiles': EntityPool(self.max_projectiles, Projectile) # Projectile(x, y, direction, label), ...
         }
-        
-
-        # Set of all positions occupied by tanks
-        self.occupied_positions = set()
 
-        self.probability_new_enemy = 0.01
+        # Grille d'occupation des tanks (boite 5x5)
+        self.grid = OccupancyGrid(self.max_x, self.max_y)
+        self.renderer = TankRenderer(self.max_x, self.max_y)
 
-        self.reward_enemy_killed = 1
-        self.reward_player_dead = -10
-        self.reward_used_projectile = -0.1
-        self.reward_nothing = -0.1
-        self.timestep = -0.01
-
-        self.done = False
-        self.info = {}
-        
-    def reset(self):
-        self.occupied_positions = set()
+    def _build_observation(self):
+        # Define observation space
+        dtypes = np.dtype('int32')
+        self.observation_space = array_observation_space(self.max_x, self.max_y, self.max_enemies_on_screen, self.max_projectiles)
+
+        # Observations renvoyées par reset/step
+        ## 'state': le dictionnaire self.state (objets Tank / Projectile)
+        ## 'array': tableaux int32 de observation_space, vues en lecture seule réécrites à chaque step
+        ## 'packed': les mêmes champs dans un seul tableau int32 (cf. ObservationEncoder.unpack)
+        self.encoder = ObservationEncoder(self.max_enemies_on_screen, self.max_projectiles, packed=(self.obs_mode == 'packed'))
+        if self.obs_mode == 'packed':
+            low = np.zeros(self.encoder.size, dtype=dtypes)
+            high = np.zeros(self.encoder.size, dtype=dtypes)
+            for key, (start, end) in self.encoder.offsets.items():
+                low[start:end] = np.broadcast_to(self.observation_space[key].low, self.encoder.shapes[key]).ravel()
+                high[start:end] = np.broadcast_to(self.observation_space[key].high, self.encoder.shapes[key]).ravel()
+            self.observation_space = spaces.Box(low=low, high=high, dtype=dtypes)
+
+    def seed(self, seed=None):
+        # même seed => même suite d'épisodes pour les mêmes actions
+        self.np_random = np.random.default_rng(seed)
+        return [seed]
+
+    def spawn_enemy(self):
+        # un ennemi sur un centre libre (aucun tank dans sa boite 5x5) tiré uniformément, en un seul
+        # tirage parmi les centres libres de la grille d'occupation; None s'il n'y a plus de place
+        free = self.grid.free_centers()
+        if self.profiler is not None:
+            self.profiler.count('spawn_attempts')
+            if len(free) == 0:
+                self.profiler.count('spawn_no_room')
+        if len(free) == 0:
+            return None
+        y, x = divmod(int(free[self.np_random.integers(0, len(free))]), self.max_x)
+        direction = self.np_random.integers(0, 4)
+        enemy = self.state['enemies'].spawn(x, y, direction, label=1)
+        self.grid.add_tank(x, y)
+        return enemy
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.seed(seed)
+        if self.profiler is not None:
+            self.profiler.start_episode()
+        self.grid.clear()
+        self.state['enemies'].clear()
+        self.state['projectiles'].clear()
         self.done = False
 
         # placer le joueur
         ## strat: de manière aléatoire
-        x = np.random.randint(0, self.max_x)
-        y = np.random.randint(0, self.max_y)
-
-        direction = np.zeros(4, dtype=int)
-        direction[np.random.randint(0, 4)] = 1 # une direction aléatoire
+        rng = self.np_random
+        x = rng.integers(0, self.max_x)
+        y = rng.integers(0, self.max_y)
 
-        player = Tank(x, y, direction, label=0)
-        self.state['player'] = player
+        player = self.state['player']
+        player.x = x
+        player.y = y
+        player.direction = rng.integers(0, 4) # une direction aléatoire
 
-        self.occupied_positions.add((x, y))
+        self.grid.add_tank(x, y)
 
         # placer les ennemis, attention aux collisions
         ## strat: self.initial_ennemies ennemis de manière aléatoire
-        ennemies = set()
         for i in range(self.initial_ennemies):
-            placed = False
-            while not placed:
-                x = np.random.randint(0, self.max_x)
-                y = np.random.randint(0, self.max_y)
-
-                boxes = [(x + i, y + j) for i in range(-2, 3) for j in range(-2, 3)]
-                if any(box in self.occupied_positions for box in boxes):
-                    continue
-                
-                direction = np.zeros(4, dtype=int)
-                direction[np.random.randint(0, 4)] = 1
-
-                ennemies.add(Tank(x, y, direction, label=1))
-                self.occupied_positions.add((x, y))
-                placed = True
-
-        self.state['enemies'] = ennemies
-
-        print("#### environnement reset successfully ####")
+            if self.spawn_enemy() is None:
+                raise RuntimeError(f"no room left to place {self.initial_ennemies} enemies on a {self.max_x}x{self.max_y} grid")
+
+        if self.recorder is not None:
+            self.recorder.start_episode(self, seed)
+        if self.verbose:
+            print("#### environnement reset successfully ####")
+        return self.observe()
         
         
     def step(self, action):
         reward = self.timestep
+        profiler = self.profiler # None: pas d'instrumentation
+        if profiler is not None:
+            profiler.start_step()
 
         ## annulation des projectiles qui se touchent si necessaire
-        projectiles = list(self.state['projectiles'])
-        for i in range(len(projectiles)):
-            for j in range(i+1, len(projectiles)):
-                if projectiles[i].x == projectiles[j].x and projectiles[i].y == projectiles[j].y and projectiles[i].label != projectiles[j].label:
-                    # same position, different players
-                    try:
-                        self.state['projectiles'].remove(projectiles[i])
-                        self.state['projectiles'].remove(projectiles[j])
-                    except:
-                        pass
+        ## (projectiles des deux camps sur une même case, regroupés par case)
+        self.cancel_projectiles()
+        if profiler is not None:
+            profiler.lap('cancel')
 
         # Rajouter 1 ennemi si le nombre d'ennemis actifs est inférieur à max_enemies
         ## strat: de manière aléatoire avec une probabilité de self.probability_new_enemy
-        if (len(self.state['enemies']) < self.max_enemies_on_screen and np.random.rand() < self.probability_new_enemy) or len(self.state['enemies']) == 0:
-            placed = False
-            while not placed:
-                x = np.random.randint(0, self.max_x)
-                y = np.random.randint(0, self.max_y)
-
-                boxes = [(x + i, y + j) for i in range(-2, 3) for j in range(-2, 3)]
-                if any(box in self.occupied_positions for box in boxes):
-                    continue
-                
-                direction = np.zeros(4, dtype=int)
-                direction[np.random.randint(0, 4)] = 1
-
-                self.state['enemies'].add(Tank(x, y, direction, label=1))
-                self.occupied_positions.add((x, y))
-                placed = True
+        ## s'il n'y a plus de place, pas d'apparition: info['no_room'] = True
+        info = {}
+        if (len(self.state['enemies']) < self.max_enemies_on_screen and self.np_random.random() < self.probability_new_enemy) or len(self.state['enemies']) == 0:
+            if self.spawn_enemy() is None:
+                info['no_room'] = True
+        if profiler is not None:
+            profiler.lap('spawn')
 
         # Nettoyer les ennemis tombés, les projectiles utilisés
         ## reward_ennemy_killed pour chaque ennemi tombé
-        for enemy in list(self.state['enemies']):
-            boxes = [(enemy.x + i, enemy.y + j) for i in range(-2, 3) for j in range(-2, 3)]
-            for projectile in list(self.state['projectiles']):
-                if (projectile.x, projectile.y) in boxes and projectile.label == 0:
-                    self.state['enemies'].remove(enemy)
-                    self.occupied_positions.remove((enemy.x, enemy.y))
-                    self.state['projectiles'].remove(projectile)
-                    reward += self.reward_enemy_killed
-                    break
+        reward += self.reward_enemy_killed * self.kill_enemies()
+        if profiler is not None:
+            profiler.lap('kills')
 
         # Verifier si le joueur est mort
         ## le joueur est mort: done = True, reward = reward_player_dead
         ## le joueur n'est pas mort: done = False
-        boxes = [(self.state['player'].x + i, self.state['player'].y + j) for i in range(-2, 3) for j in range(-2, 3)]
-        ennemies_projectiles_positions = [(projectile.x, projectile.y) for projectile in self.state['projectiles'] if projectile.label == 1]
-        if any(pos in boxes for pos in ennemies_projectiles_positions):
+        if self.player_hit():
             self.done = True
             reward += self.reward_player_dead
+        if profiler is not None:
+            profiler.lap('death')
 
         ##################### update #####################
             
@@ -167,72 +237,236 @@ class TankEnv(gym.Env):
             'max_x': self.max_x,
             'max_y': self.max_y,
         }
-        self.state['player'].update(action, self.state, self.occupied_positions, bondaries)
+        self.state['player'].update(action, self.state, self.grid, bondaries)
         if action == 4:
             reward += self.reward_nothing
         elif action == 5:
             reward += self.reward_used_projectile
+        if profiler is not None:
+            profiler.lap('player')
 
         # Mettre à jour l'état des ennemis
-        ## strat: de maniere aleatoire
-        for enemy in self.state['enemies']:
-            enemy.update_strategic(self.state, self.occupied_positions, bondaries, strategy=2)
+        ## strat: de maniere aleatoire (Tank.update_strategic(strategy=2), tous les ennemis en une passe)
+        self.update_enemies(strategy=2)
+        if profiler is not None:
+            profiler.lap('enemies')
 
         # Mettre à jour l'état des projectiles
-        ## position
-        for projectile in list(self.state['projectiles']): # list() pour éviter les modifications en cours de parcours
-            projectile.update(self.state, bondaries)
+        ## position, tirs croisés, sortie de la grille
+        self.move_projectiles()
+        if profiler is not None:
+            profiler.lap('projectiles')
         
         ##################### update done #####################
-            
-        return self.state, reward, self.done, {}
+
+        observation = self.observe()
+        if profiler is not None:
+            profiler.lap('observe')
+            profiler.end_step(self, reward, self.done)
+        if self.recorder is not None:
+            self.recorder.record_step(self, action, reward, self.done)
+        return observation, reward, self.done, info
+
+    ##################### projectiles #####################
+    # les projectiles sont traités en bloc, sur les tableaux du pool (ordre des slots)
+
+    def cancel_projectiles(self):
+        pool = self.state['projectiles']
+        if self.backend == 'numba':
+            pool.remove_indices(kernels.cancel_projectiles(pool.x, pool.y, pool.label, pool.alive,
+                                                           self.max_x, self.max_y, self._cells))
+            return
+        indices = pool.indices()
+        if len(indices) < 2:
+            return
+        labels = pool.label[indices]
+        if labels.min() == labels.max():
+            return # un seul camp
+        if self.profiler is not None:
+            self.profiler.count('cancel_checked', len(indices))
+        keys = cell_keys(pool.x[indices], pool.y[indices], self.max_x, self.max_y)
+        pool.remove_indices(indices[same_cell_cancellations(keys, labels)])
+
+    def kill_enemies(self):
+        # chaque ennemi (ordre des slots) est détruit par le premier projectile du joueur (ordre des
+        # slots, pas encore utilisé) dans sa boite 5x5; renvoie le nombre d'ennemis détruits
+        enemies = self.state['enemies']
+        projectiles = self.state['projectiles']
+        if self.backend == 'numba':
+            killed, used = kernels.kill_enemies(enemies.x, enemies.y, enemies.alive, projectiles.x, projectiles.y,
+                                                projectiles.label, projectiles.alive)
+            if len(killed):
+                enemies.remove_indices(killed)
+                projectiles.remove_indices(used)
+                for k in killed.tolist():
+                    self.grid.remove_tank(enemies.x[k], enemies.y[k])
+                if self.profiler is not None:
+                    self.profiler.count('kills', len(killed))
+            return len(killed)
+        shots = projectiles.indices()
+        shots = shots[projectiles.label[shots] == 0]
+        targets = enemies.indices()
+        if len(shots) == 0 or len(targets) == 0:
+            return 0
+        ex, ey = enemies.x[targets], enemies.y[targets]
+        sx, sy = projectiles.x[shots], projectiles.y[shots]
+        # premier tir de chaque boite 5x5: toutes les paires s'il y en a peu, sinon lu sur la grille
+        # (OccupancyGrid.first_shots, coût indépendant du nombre de projectiles dans les boites)
+        if len(shots) * len(targets) <= DENSE_HITS:
+            if self.profiler is not None:
+                self.profiler.count('collision_checks', len(shots) * len(targets))
+            hit = (np.abs(sx - ex[:, None]) <= PAD) & (np.abs(sy - ey[:, None]) <= PAD)
+            first = np.where(hit.any(axis=1), np.argmax(hit, axis=1), NO_SHOT)
+        else:
+            if self.profiler is not None:
+                self.profiler.count('collision_checks', len(targets) * (2 * PAD + 1) ** 2)
+            first = self.grid.first_shots(sx, sy, ex, ey)
+        kills = []
+        used = np.zeros(len(shots), dtype=bool)
+        for k in np.flatnonzero(first != NO_SHOT).tolist():
+            j = int(first[k])
+            if used[j]:
+                # déjà pris par un ennemi précédent (boites qui se chevauchent): tir suivant de la boite
+                candidates = ~used & (np.abs(sx - ex[k]) <= PAD) & (np.abs(sy - ey[k]) <= PAD)
+                if not candidates.any():
+                    continue
+                j = np.argmax(candidates)
+            used[j] = True
+            kills.append(k)
+        if kills:
+            enemies.remove_indices(targets[kills])
+            for k in kills:
+                self.grid.remove_tank(ex[k], ey[k])
+            projectiles.remove_indices(shots[used])
+            if self.profiler is not None:
+                self.profiler.count('kills', len(kills))
+        return len(kills)
+
+    def player_hit(self):
+        # un projectile ennemi dans la boite 5x5 du joueur
+        projectiles = self.state['projectiles']
+        player = self.state['player']
+        if self.backend == 'numba':
+            return kernels.player_hit(projectiles.x, projectiles.y, projectiles.label, projectiles.alive,
+                                      player.x, player.y)
+        indices = projectiles.indices()
+        if self.profiler is not None:
+            self.profiler.count('collision_checks', len(indices))
+        return bool(((projectiles.label[indices] == 1) & (np.abs(projectiles.x[indices] - player.x) <= PAD)
+                     & (np.abs(projectiles.y[indices] - player.y) <= PAD)).any())
+
+    def move_projectiles(self):
+        # déplacement d'une case; les projectiles adverses qui échangent leurs cases (tirs de face sur
+        # des cases voisines) s'annulent, ceux qui sortent de la grille disparaissent
+        pool = self.state['projectiles']
+        if self.backend == 'numba':
+            pool.remove_indices(kernels.move_projectiles(pool.x, pool.y, pool.direction, pool.label, pool.alive,
+                                                         self.max_x, self.max_y, self._cells))
+            return
+        indices = pool.indices()
+        if len(indices) == 0:
+            return
+        direction = pool.direction[indices]
+        x, y = pool.x[indices], pool.y[indices]
+        new_x, new_y = x + DX[direction], y + DY[direction]
+        pool.x[indices] = new_x
+        pool.y[indices] = new_y
+        gone = (new_x <= -1) | (new_x > self.max_x) | (new_y <= -1) | (new_y > self.max_y)
+        labels = pool.label[indices]
+        if labels.min() != labels.max():
+            if self.profiler is not None:
+                self.profiler.count('swap_checked', len(indices))
+            gone |= swap_cancellations(cell_keys(x, y, self.max_x, self.max_y),
+                                       cell_keys(new_x, new_y, self.max_x, self.max_y), labels)
+        pool.remove_indices(indices[gone])
+
+    def update_enemies(self, strategy=2):
+        # actions tirées en bloc, déplacements résolus dans l'ordre des slots (cf. enemy_ai.move_tanks)
+        enemies = self.state['enemies']
+        indices = enemies.indices()
+        if len(indices) == 0:
+            return
+        player = self.state['player']
+        x, y = enemies.x[indices], enemies.y[indices]
+        direction = enemies.direction[indices].astype(np.int64)
+        actions = enemy_actions(x, y, direction, player.x, player.y, self.np_random, strategy)
+        if self.backend == 'numba':
+            shooters = kernels.move_tanks(enemies.x, enemies.y, enemies.direction, indices, actions,
+                                          self.grid.tanks, self.max_x, self.max_y)
+            for i in shooters.tolist():
+                enemies.entities[i].shoot(self.state)
+            return
+        if len(indices) <= SCALAR_ENEMIES:
+            # peu d'ennemis: Tank.update un par un coûte moins cher que les appels numpy (même résultat)
+            bondaries = {'max_x': self.max_x, 'max_y': self.max_y}
+            for i, action in zip(indices.tolist(), actions.tolist()):
+                enemies.entities[i].update(action, self.state, self.grid, bondaries)
+            return
+        new_x, new_y, new_direction, moved = move_tanks(x, y, direction, actions, self.max_x, self.max_y,
+                                                        [player.x], [player.y], self.chunk_size)
+        if moved.any():
+            self.grid.move_tanks(x[moved], y[moved], new_x[moved], new_y[moved])
+            enemies.x[indices] = new_x
+            enemies.y[indices] = new_y
+        enemies.direction[indices] = new_direction
+        for i in np.flatnonzero(actions == 5).tolist():
+            enemies.entities[indices[i]].shoot(self.state)
+
+    def observe(self):
+        if self.obs_mode == 'state':
+            return self.state
+        observation = self.encoder.encode(self.state)
+        if self.obs_mode == 'packed':
+            return self.encoder.packed
+        return observation
+
+    ##################### snapshot #####################
+
+    def get_state(self):
+        # instantané compact (bytes) de l'épisode: joueur, ennemis et projectiles vivants, done,
+        # état du générateur aléatoire. set_state() le restaure: on peut reprendre, rejouer ou
+        # brancher un épisode depuis n'importe quel step
+        player = self.state['player']
+        rng = self.np_random.bit_generator.state
+        assert rng['bit_generator'] == 'PCG64'
+        header = SNAPSHOT_HEADER.pack(int(player.x), int(player.y), int(player.direction), self.done,
+                                      rng['state']['state'].to_bytes(16, 'little'),
+                                      rng['state']['inc'].to_bytes(16, 'little'),
+                                      bool(rng['has_uint32']), rng['uinteger'])
+        return b''.join((header, self.state['enemies'].snapshot(), self.state['projectiles'].snapshot()))
+
+    def set_state(self, snapshot):
+        x, y, direction, done, state, inc, has_uint32, uinteger = SNAPSHOT_HEADER.unpack_from(snapshot)
+        player = self.state['player']
+        player.x = x
+        player.y = y
+        player.direction = direction
+        self.done = done
+        bit_generator = self.np_random.bit_generator
+        if not isinstance(bit_generator, np.random.PCG64):
+            bit_generator = np.random.PCG64()
+            self.np_random = np.random.Generator(bit_generator)
+        bit_generator.state = {
+            'bit_generator': 'PCG64',
+            'state': {'state': int.from_bytes(state, 'little'), 'inc': int.from_bytes(inc, 'little')},
+            'has_uint32': int(has_uint32),
+            'uinteger': uinteger,
+        }
+        offset = self.state['enemies'].restore(snapshot, SNAPSHOT_HEADER.size)
+        self.state['projectiles'].restore(snapshot, offset)
+
+        # grille des tanks (les projectiles ne sont que dans les tableaux de leur pool)
+        enemies = self.state['enemies']
+        indices = enemies.indices()
+        self.grid.set_tanks(np.append(enemies.x[indices], x), np.append(enemies.y[indices], y))
+        return self.observe()
 
     def render(self, mode='human'):
-        # Créer une matrice M de taille max_x * max_y + un padding de 1 de chaque côté
-        rows = self.max_y + 2
-        cols = self.max_x + 2
-        M = np.ones((rows, cols, 3), dtype=np.uint8) * 240 # white background
-        # remplir la matrice avec les éléments de l'environnement
-        def fill_tank(tank, color):
-            # print(f"#### filling tank {tank.coord_and_dir} with color {color} ####")
-            x, y, dir, _ = tank.info()
-            x += 1 # because of the padding
-            y += 1 # because of the padding
-
-            M[y, x] = color 
-            if dir in [1, 2]:
-                M[y-1, x-1, :] = color
-            if dir in [0, 1, 3]:
-                M[y-1, x, :] = color
-            if  dir in [2, 3]:
-                M[y-1, x+1, :] = color
-            if dir in [0, 2, 3]:
-                M[y, x-1, :] = color
-            if dir in [0, 1, 2]:
-                M[y, x+1, :] = color
-            if dir in [0, 1]:
-                M[y+1, x-1, :] = color
-            if dir in [1, 2, 3]:
-                M[y+1, x, :] = color
-            if dir in [0, 3]:
-                M[y+1, x+1, :] = color
-        ## remplir avec le joueur
-        fill_tank(self.state['player'], [92, 184, 92])
-                
-        ## remplir avec les ennemis
-        for enemy in self.state['enemies']:
-            fill_tank(enemy, [240, 173, 78])
-
-        ## remplir avec les projectiles
-        for projectile in self.state['projectiles']:
-            x, y, dir, label = projectile.info()
-            if label == 0:
-                M[y+1, x+1, :] = [217, 100, 79]
-            else:
-                M[y+1, x+1, :] = [217, 83, 79]
-
-        # return frame
-        return M
+        # Matrice RGB de taille max_x * max_y + un padding de 1 de chaque côté
+        ## le renderer ne redessine que ce qui a changé depuis l'appel précédent;
+        ## la frame renvoyée est une vue en lecture seule, réécrite au prochain appel
+        ## (self.renderer.scaled(k) / self.renderer.blit(screen, k) pour une version agrandie)
+        return self.renderer.render(self.state)
     
     def plot_render(self):
         M = self.render()
@@ -0,0 +1,361 @@
+from envs.tank_env import TankEnv, array_observation_space
+from envs.game_elements import DX, DY
+from envs.enemy_ai import actions_from_draws
+from envs.projectiles import cell_keys, same_cell_cancellations, swap_cancellations
+
+from gym import spaces
+
+import numpy as np
+
+
+class VecTankEnv:
+    """N TankEnv avancés en un seul appel, état stocké en tableaux (struct-of-arrays).
+
+    Chaque environnement a son propre np.random.Generator et consomme ses tirages
+    dans le même ordre que TankEnv: l'environnement i donne le même épisode qu'un
+    TankEnv après env.seed(seeds[i]). Comme dans les EntityPool de TankEnv,
+    une nouvelle entité prend le premier slot libre et les entités sont traitées par slot.
+    Les environnements terminés sont remis à zéro automatiquement à la fin de step().
+
+    Observations: les champs de TankEnv(obs_mode='array') avec une dimension N devant
+    (vues en lecture seule sur l'état, comme ObservationEncoder), mais:
+    - enemies_mask / projectiles_mask sont des booléens (int32 dans single_observation_space);
+    - les lignes sont rangées par slot (trous compris) et non tassées au début: une ligne
+      n'est valide que si son masque est vrai, enemies_count / projectiles_count ne donnent
+      que leur nombre.
+    Les agents (agents/features.py, agents/tabular.py) n'utilisent que les masques.
+    """
+
+    # mêmes règles que TankEnv
+    initial_ennemies = TankEnv.initial_ennemies
+    probability_new_enemy = TankEnv.probability_new_enemy
+    reward_enemy_killed = TankEnv.reward_enemy_killed
+    reward_player_dead = TankEnv.reward_player_dead
+    reward_used_projectile = TankEnv.reward_used_projectile
+    reward_nothing = TankEnv.reward_nothing
+    timestep = TankEnv.timestep
+
+    def __init__(self, num_envs, max_x = 20, max_y = 20, max_enemies_on_screen = 5, total_ennemies_to_kill = 20, seeds=None):
+        # mêmes assertions que TankEnv
+        assert max_x > 0
+        assert max_y > 0
+        assert max_enemies_on_screen > 0
+        assert max_enemies_on_screen <= total_ennemies_to_kill
+        assert (max_enemies_on_screen + 1) * 9 * 2 <= max_x * max_y
+
+        self.num_envs = num_envs
+        self.max_x = max_x
+        self.max_y = max_y
+        self.max_enemies_on_screen = max_enemies_on_screen
+        self.max_projectiles = max_x * max_y
+        self.total_ennemies_to_kill = total_ennemies_to_kill
+
+        self.single_action_space = spaces.Discrete(6)
+        self.single_observation_space = array_observation_space(max_x, max_y, max_enemies_on_screen, self.max_projectiles)
+        self.action_space = spaces.MultiDiscrete([self.single_action_space.n] * num_envs)
+
+        N, E, P = num_envs, self.max_enemies_on_screen, self.max_projectiles
+
+        # l'état est stocké directement au format de l'observation, les champs sont des vues
+        # joueur: x, y, direction
+        self.player = np.zeros((N, 3), dtype=np.int32)
+        self.player_x, self.player_y, self.player_dir = self.player[:, 0], self.player[:, 1], self.player[:, 2]
+
+        # ennemis: un slot par ennemi
+        self.enemies = np.zeros((N, E, 3), dtype=np.int32)
+        self.enemy_x, self.enemy_y, self.enemy_dir = self.enemies[..., 0], self.enemies[..., 1], self.enemies[..., 2]
+        self.enemy_alive = np.zeros((N, E), dtype=bool)
+
+        # projectiles: x, y, direction, label (0 = joueur, 1 = ennemi)
+        self.projectiles = np.zeros((N, P, 4), dtype=np.int32)
+        self.proj_x, self.proj_y = self.projectiles[..., 0], self.projectiles[..., 1]
+        self.proj_dir, self.proj_label = self.projectiles[..., 2], self.projectiles[..., 3]
+        self.proj_alive = np.zeros((N, P), dtype=bool)
+        # les slots >= proj_high sont libres dans tous les environnements: les calculs s'arrêtent là
+        self.proj_high = 0
+
+        self.enemies_count = np.zeros((N, 1), dtype=np.int32)
+        self.projectiles_count = np.zeros((N, 1), dtype=np.int32)
+
+        # observation: vues en lecture seule sur l'état
+        self.observation = {
+            'player': self.player,
+            'enemies': self.enemies,
+            'enemies_mask': self.enemy_alive,
+            'enemies_count': self.enemies_count,
+            'projectiles': self.projectiles,
+            'projectiles_mask': self.proj_alive,
+            'projectiles_count': self.projectiles_count,
+        }
+        self.observation = {key: value.view() for key, value in self.observation.items()}
+        for view in self.observation.values():
+            view.flags.writeable = False
+
+        self.dones = np.zeros(N, dtype=bool)
+        self.episode_returns = np.zeros(N)
+        self.episode_lengths = np.zeros(N, dtype=np.int64)
+
+        self.seed(seeds)
+
+    def seed(self, seeds=None):
+        if seeds is None:
+            seeds = np.random.SeedSequence().generate_state(self.num_envs)
+        elif np.isscalar(seeds):
+            seeds = [seeds + i for i in range(self.num_envs)]
+        assert len(seeds) == self.num_envs
+        self.seeds = [int(s) for s in seeds]
+        self.rngs = [np.random.default_rng(s) for s in self.seeds]
+        return self.seeds
+
+    ##################### placement #####################
+
+    def _free_centers(self, n):
+        # centres libres (aucun centre de tank dans la boite 5x5), indices y * max_x + x comme
+        # OccupancyGrid.free_centers
+        alive = self.enemy_alive[n]
+        tx = np.append(self.enemy_x[n, alive], self.player_x[n])
+        ty = np.append(self.enemy_y[n, alive], self.player_y[n])
+        near_x = np.abs(np.arange(self.max_x)[:, None] - tx) <= 2 # (max_x, tanks)
+        near_y = np.abs(np.arange(self.max_y)[:, None] - ty) <= 2 # (max_y, tanks)
+        blocked = (near_y[:, None, :] & near_x[None, :, :]).any(axis=2)
+        return np.flatnonzero(~blocked)
+
+    def _spawn_enemy(self, n):
+        # même tirage que TankEnv.spawn_enemy; False s'il n'y a plus de place
+        rng = self.rngs[n]
+        free = self._free_centers(n)
+        if len(free) == 0:
+            return False
+        y, x = divmod(int(free[rng.integers(0, len(free))]), self.max_x)
+        slot = np.argmin(self.enemy_alive[n])
+        self.enemy_x[n, slot] = x
+        self.enemy_y[n, slot] = y
+        self.enemy_dir[n, slot] = rng.integers(0, 4)
+        self.enemy_alive[n, slot] = True
+        return True
+
+    def _reset_env(self, n):
+        rng = self.rngs[n]
+        self.enemy_alive[n] = False
+        self.proj_alive[n] = False
+        self.dones[n] = False
+        self.episode_returns[n] = 0
+        self.episode_lengths[n] = 0
+
+        self.player_x[n] = rng.integers(0, self.max_x)
+        self.player_y[n] = rng.integers(0, self.max_y)
+        self.player_dir[n] = rng.integers(0, 4)
+
+        for i in range(self.initial_ennemies):
+            if not self._spawn_enemy(n):
+                raise RuntimeError(f"no room left to place {self.initial_ennemies} enemies on a {self.max_x}x{self.max_y} grid")
+
+    def reset(self):
+        for n in range(self.num_envs):
+            self._reset_env(n)
+        return self._observe()
+
+    def reset_env(self, n):
+        # remise à zéro du seul environnement n (ex: limite de steps atteinte)
+        self._reset_env(n)
+        return self._observe()
+
+    ##################### step #####################
+
+    def _live_projectiles(self):
+        # vues limitées aux slots utilisés
+        h = self.proj_high
+        return self.proj_x[:, :h], self.proj_y[:, :h], self.proj_label[:, :h], self.proj_alive[:, :h]
+
+    def _cancel_projectiles(self):
+        # annulation des projectiles de labels différents sur la même case (même règle que TankEnv),
+        # cases de tous les environnements regroupées en une fois
+        n_idx, p_idx = np.nonzero(self.proj_alive[:, :self.proj_high])
+        if len(n_idx) < 2:
+            return
+        labels = self.proj_label[n_idx, p_idx]
+        keys = cell_keys(self.proj_x[n_idx, p_idx], self.proj_y[n_idx, p_idx], self.max_x, self.max_y, env=n_idx)
+        removed = same_cell_cancellations(keys, labels)
+        self.proj_alive[n_idx[removed], p_idx[removed]] = False
+
+    def _spawn_enemies(self):
+        counts = self.enemy_alive.sum(axis=1)
+        for n in range(self.num_envs):
+            if counts[n] < self.max_enemies_on_screen:
+                spawn = self.rngs[n].random() < self.probability_new_enemy or counts[n] == 0
+            else:
+                spawn = counts[n] == 0
+            if spawn:
+                self._spawn_enemy(n)
+
+    def _kill_enemies(self):
+        rows = np.arange(self.num_envs)
+        kills = np.zeros(self.num_envs, dtype=np.int64)
+        px, py, label, alive = self._live_projectiles()
+        player_shots = alive & (label == 0)
+        if not player_shots.any():
+            return kills
+        for slot in range(self.max_enemies_on_screen):
+            enemy_alive = self.enemy_alive[:, slot]
+            if not enemy_alive.any():
+                continue
+            ex = self.enemy_x[:, slot][:, None]
+            ey = self.enemy_y[:, slot][:, None]
+            hit = player_shots & (np.abs(px - ex) <= 2) & (np.abs(py - ey) <= 2)
+            hit &= enemy_alive[:, None]
+            killed = hit.any(axis=1)
+            if not killed.any():
+                continue
+            # premier projectile (par slot) qui touche l'ennemi
+            first = np.argmax(hit, axis=1)
+            self.enemy_alive[killed, slot] = False
+            self.proj_alive[rows[killed], first[killed]] = False
+            player_shots[rows[killed], first[killed]] = False
+            kills += killed
+        return kills
+
+    def _player_hit(self):
+        px, py, label, alive = self._live_projectiles()
+        hit = alive & (label == 1)
+        hit &= np.abs(px - self.player_x[:, None]) <= 2
+        hit &= np.abs(py - self.player_y[:, None]) <= 2
+        return hit.any(axis=1)
+
+    def _shoot(self, shooting, x, y, direction, label):
+        # ajoute un projectile dans le premier slot libre des environnements concernés
+        n = np.flatnonzero(shooting)
+        if len(n) == 0:
+            return
+        slot = np.argmin(self.proj_alive[n], axis=1)
+        assert not self.proj_alive[n, slot].any(), "too many projectiles"
+        d = direction[n]
+        self.proj_x[n, slot] = x[n] + 2 * DX[d]
+        self.proj_y[n, slot] = y[n] + 2 * DY[d]
+        self.proj_dir[n, slot] = d
+        self.proj_label[n, slot] = label
+        self.proj_alive[n, slot] = True
+        self.proj_high = max(self.proj_high, slot.max() + 1)
+
+    def _move_tanks(self, x, y, direction, action, blocked_by):
+        # équivalent vectorisé de Tank.update (sans le tir)
+        # blocked_by(nx, ny) -> masque des environnements où la boite 5x5 est occupée
+        turn = action < 4
+        forward = turn & (direction == action)
+        nx = x + DX[direction]
+        ny = y + DY[direction]
+        forward &= (nx >= 0) & (nx < self.max_x) & (ny >= 0) & (ny < self.max_y)
+        forward &= ~blocked_by(nx, ny)
+        rotate = turn & (direction != action)
+        return np.where(forward, nx, x), np.where(forward, ny, y), np.where(rotate, action, direction)
+
+    def _move_player(self, actions):
+        def blocked_by(nx, ny):
+            near = (np.abs(self.enemy_x - nx[:, None]) <= 2) & (np.abs(self.enemy_y - ny[:, None]) <= 2)
+            return (near & self.enemy_alive).any(axis=1)
+
+        self.player_x[:], self.player_y[:], self.player_dir[:] = self._move_tanks(
+            self.player_x, self.player_y, self.player_dir, actions, blocked_by)
+        self._shoot(actions == 5, self.player_x, self.player_y, self.player_dir, label=0)
+
+    def _enemy_actions(self):
+        # Tank.update_strategic(strategy=2): mêmes tirages en bloc, dans le même ordre, que TankEnv
+        # (un appel au générateur par environnement), actions calculées pour tous les environnements
+        draws = np.zeros((3,) + self.enemy_alive.shape)
+        counts = self.enemy_alive.sum(axis=1)
+        for n in np.flatnonzero(counts).tolist():
+            draws[:, n, self.enemy_alive[n]] = self.rngs[n].random((3, counts[n]))
+        actions = actions_from_draws(draws, self.enemy_x, self.enemy_y, self.enemy_dir,
+                                     self.player_x[:, None], self.player_y[:, None], strategy=2)
+        return np.where(self.enemy_alive, actions, 4)
+
+    def _move_enemies(self):
+        actions = self._enemy_actions()
+        for slot in range(self.max_enemies_on_screen):
+            alive = self.enemy_alive[:, slot]
+            if not alive.any():
+                continue
+
+            def blocked_by(nx, ny):
+                near = (np.abs(self.enemy_x - nx[:, None]) <= 2) & (np.abs(self.enemy_y - ny[:, None]) <= 2)
+                near &= self.enemy_alive
+                near[:, slot] = False  # le tank ne se bloque pas lui-même
+                player = (np.abs(self.player_x - nx) <= 2) & (np.abs(self.player_y - ny) <= 2)
+                return near.any(axis=1) | player
+
+            action = np.where(alive, actions[:, slot], 4)
+            x, y, d = self._move_tanks(self.enemy_x[:, slot], self.enemy_y[:, slot],
+                                       self.enemy_dir[:, slot], action, blocked_by)
+            self.enemy_x[:, slot] = x
+            self.enemy_y[:, slot] = y
+            self.enemy_dir[:, slot] = d
+            self._shoot(action == 5, x, y, d, label=1)
+
+    def _move_projectiles(self):
+        h = self.proj_high
+        x, y, alive = self.proj_x[:, :h], self.proj_y[:, :h], self.proj_alive[:, :h]
+        d = self.proj_dir[:, :h]
+        n_idx, p_idx = np.nonzero(alive)
+        old_keys = cell_keys(x[n_idx, p_idx], y[n_idx, p_idx], self.max_x, self.max_y, env=n_idx)
+        x += np.where(alive, DX[d], 0)
+        y += np.where(alive, DY[d], 0)
+        # tirs croisés: projectiles adverses qui échangent leurs cases
+        new_keys = cell_keys(x[n_idx, p_idx], y[n_idx, p_idx], self.max_x, self.max_y, env=n_idx)
+        swapped = swap_cancellations(old_keys, new_keys, self.proj_label[n_idx, p_idx])
+        alive[n_idx[swapped], p_idx[swapped]] = False
+        alive &= (x > -1) & (x <= self.max_x) & (y > -1) & (y <= self.max_y)
+        # on rabaisse la limite des slots utilisés
+        used = np.flatnonzero(alive.any(axis=0))
+        self.proj_high = used[-1] + 1 if len(used) else 0
+
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=np.int64)
+        assert actions.shape == (self.num_envs,)
+        rewards = np.full(self.num_envs, self.timestep)
+
+        self._cancel_projectiles()
+        self._spawn_enemies()
+        rewards += self.reward_enemy_killed * self._kill_enemies()
+
+        dead = self._player_hit()
+        rewards += np.where(dead, self.reward_player_dead, 0)
+        self.dones |= dead
+
+        ##################### update #####################
+        self._move_player(actions)
+        rewards += np.where(actions == 4, self.reward_nothing, 0)
+        rewards += np.where(actions == 5, self.reward_used_projectile, 0)
+        self._move_enemies()
+        self._move_projectiles()
+        ##################### update done #####################
+
+        self.episode_returns += rewards
+        self.episode_lengths += 1
+        dones = self.dones.copy()
+        infos = {}
+        if dones.any():
+            # remise à zéro automatique, l'observation finale reste disponible dans infos
+            infos['final_observation'] = self._observe(copy=True)
+            infos['episode_returns'] = np.where(dones, self.episode_returns, 0)
+            infos['episode_lengths'] = np.where(dones, self.episode_lengths, 0)
+            for n in np.flatnonzero(dones):
+                self._reset_env(n)
+        return self._observe(), rewards, dones, infos
+
+    ##################### observation #####################
+
+    def _observe(self, copy=False):
+        # vues sur l'état (pas de copie), sauf si copy=True
+        self.enemy_alive.sum(axis=1, out=self.enemies_count[:, 0])
+        self.proj_alive.sum(axis=1, out=self.projectiles_count[:, 0])
+        if copy:
+            return {key: value.copy() for key, value in self.observation.items()}
+        # new dict (cheap), same read-only views
+        return dict(self.observation)
+
+    def get_env_state(self, n):
+        # (joueur, ennemis, projectiles) de l'environnement n, au format de Tank.info()/Projectile.info()
+        player = (self.player_x[n], self.player_y[n], self.player_dir[n], 0)
+        enemies = [(self.enemy_x[n, i], self.enemy_y[n, i], self.enemy_dir[n, i], 1)
+                   for i in np.flatnonzero(self.enemy_alive[n])]
+        projectiles = [tuple(self.projectiles[n, i]) for i in np.flatnonzero(self.proj_alive[n])]
+        return player, enemies, projectiles
@@ -1,5 +1,4 @@
 import pygame
-import numpy as np
 
 from envs import *
 
@@ -40,10 +39,8 @@ while running:
         env.reset()
 
     # Render the game state
-    frame = env.render()
-    frame = np.repeat(np.repeat(frame, 18, axis=0), 18, axis=1)  # Scale up the frame for visibility
-    surface = pygame.surfarray.make_surface(frame)
-    screen.blit(surface, (0, 0))
+    env.render()
+    env.renderer.blit(screen, 18)  # Scale up the frame for visibility
     pygame.display.flip()
 
     # Cap the frame rate
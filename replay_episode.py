@@ -0,0 +1,84 @@
+"""Inspect, check and export the episodes of a run recorded with EpisodeRecorder.
+
+    python replay_episode.py runs/run.tankrec                        # list the episodes
+    python replay_episode.py runs/run.tankrec --episode 3 --check    # deterministic replay?
+    python replay_episode.py runs/run.tankrec --episode 3 --step 1200  # state after 1200 steps
+    python replay_episode.py runs/run.tankrec --episode 3 --frames ep3.npy --scale 8
+    python replay_episode.py runs/run.tankrec --episode 3 --video ep3.mp4 --fps 30  # needs ffmpeg
+
+Record a run with:
+    recorder = EpisodeRecorder('runs/run.tankrec')
+    env = TankEnv(..., recorder=recorder)
+    ...
+    recorder.close()
+"""
+import argparse
+import subprocess
+import time
+
+from utils.episode_recorder import EpisodeReplayer, entities_of
+
+
+def list_episodes(replayer):
+    print(f"{len(replayer)} episodes, TankEnv {replayer.env_config}, keyframe every "
+          f"{replayer.keyframe_interval} steps, entities: {replayer.has_entities}")
+    for i, episode in enumerate(replayer.episodes):
+        end = {True: 'done', False: 'cut', None: '?'}[episode['done']] # None: run not closed
+        print(f"{i:6d}  steps {episode['steps']:7d}  reward {episode['reward']:9.2f}  {end}  seed {episode['seed']}")
+
+
+def write_video(replayer, episode, path, scale, fps, start, stop):
+    # frames piped as raw RGB to ffmpeg
+    env = replayer.make_env()
+    height, width = env.renderer.rows * scale, env.renderer.cols * scale
+    command = ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}',
+               '-r', str(fps), '-i', '-', '-pix_fmt', 'yuv420p', path]
+    with subprocess.Popen(command, stdin=subprocess.PIPE) as ffmpeg:
+        for frame in replayer.frames(episode, scale, start, stop, env):
+            ffmpeg.stdin.write(frame.tobytes())
+        ffmpeg.stdin.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path')
+    parser.add_argument('--episode', type=int)
+    parser.add_argument('--check', action='store_true', help="replay and compare with the recorded rewards and keyframes")
+    parser.add_argument('--step', type=int, help="print the state after this many steps")
+    parser.add_argument('--frames', help=".npy file of the rendered frames")
+    parser.add_argument('--video', help="video file (ffmpeg)")
+    parser.add_argument('--scale', type=int, default=8)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--start', type=int, default=0, help="first state exported")
+    parser.add_argument('--stop', type=int, help="last state exported (default: end of the episode)")
+    args = parser.parse_args()
+
+    replayer = EpisodeReplayer(args.path)
+    if args.episode is None:
+        list_episodes(replayer)
+        return
+
+    if args.check:
+        step = replayer.check(args.episode)
+        if step is None:
+            print(f"episode {args.episode}: replay identical to the recording")
+        else:
+            print(f"episode {args.episode}: replay differs from the recording at step {step}")
+    if args.step is not None:
+        start = time.perf_counter()
+        env = replayer.seek(args.episode, args.step)
+        print(f"state after {args.step} steps (seek {1000 * (time.perf_counter() - start):.1f} ms):")
+        player, enemies, projectiles = entities_of(env)
+        print(f"  player (x, y, direction) {player.tolist()}")
+        print(f"  enemies {enemies.tolist()}")
+        print(f"  projectiles (x, y, direction, label) {projectiles.tolist()}")
+    if args.frames:
+        shape = replayer.export_frames(args.episode, args.frames, args.scale, args.start, args.stop)
+        print(f"{shape[0]} frames {shape[1]}x{shape[2]} -> {args.frames}")
+    if args.video:
+        write_video(replayer, args.episode, args.video, args.scale, args.fps, args.start, args.stop)
+        print(f"video -> {args.video}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+"""Actor-learner training of a tabular Q agent over shared memory.
+
+Actor processes play TankEnv games (a VecTankEnv of --envs-per-actor games
+each, same rules step for step, features computed in batches) with a frozen
+copy of the Q-table and stream their transitions, in chunks, through one
+shared-memory ring each
+(utils/shared_ring.py: no pickling per transition). The learner (main
+process) drains the rings, applies batched TD updates (agents/tabular.py)
+and publishes the Q-table every --broadcast-every updates; actors pick the
+new version up every --sync-every steps. A full ring blocks its actor
+(backpressure), so the learner never falls behind by more than the ring
+capacity. Every --log-interval seconds the learner prints throughput,
+ring fill, actor stall time, learner idle time and policy lag.
+
+Actor i explores with epsilon ** (1 + 7 * i / (actors - 1)) (fixed per actor,
+as in Ape-X), so the actors together cover greedy and exploratory play.
+
+    python train_actor_learner.py --actors 4 --steps 2000000
+    python train_actor_learner.py --actors 3 --features rich --output q_rich.npz
+"""
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+
+from envs import TankEnv, VecTankEnv
+from agents.tabular import (Discretizer, TabularQ, incoming_projectile, nearest_aligned, nearest_bearing,
+                            nearest_distance, nearest_heading, wall_distance)
+from utils.shared_ring import VERSION, BLOCKED_NS, STALLS, SharedRing, SharedTable
+
+TRANSITION = {
+    'state': (np.int64, ()),
+    'action': (np.int8, ()),
+    'reward': (np.float32, ()),
+    'next_state': (np.int64, ()),
+    'done': (bool, ()), # terminal: no bootstrap
+    'last': (bool, ()), # last step of an episode (terminal or cut by max_steps)
+    'env': (np.int16, ()), # game of the actor's VecTankEnv (rows of its games are interleaved)
+}
+
+
+def make_discretizer(features, env_config):
+    max_x, max_y = env_config['max_x'], env_config['max_y']
+    basic = [nearest_distance(max_x + max_y), nearest_aligned()] # the state of QTable
+    if features == 'basic':
+        return Discretizer(basic)
+    return Discretizer(basic + [nearest_bearing(), nearest_heading(), incoming_projectile(4),
+                                wall_distance(max_x, max_y, 4)])
+
+
+def actor_epsilon(index, actors, epsilon):
+    return epsilon ** (1 + 7 * index / max(actors - 1, 1))
+
+
+def run_actor(index, ring_spec, table_spec, config):
+    # steps a VecTankEnv (TankEnv games, several per actor so that the features are
+    # computed in batches) with the last Q-table fetched, writes the transitions chunk by chunk
+    ring = SharedRing.attach(ring_spec)
+    table = SharedTable.attach(table_spec)
+    num_envs = config['envs_per_actor']
+    seeds = np.random.SeedSequence([config['seed'], index]).generate_state(num_envs + 1)
+    rng = np.random.default_rng(seeds[-1])
+    env = VecTankEnv(num_envs, **config['env'], seeds=seeds[:-1].tolist())
+    discretizer = make_discretizer(config['features'], config['env'])
+    epsilon = actor_epsilon(index, config['actors'], config['epsilon'])
+
+    q_table = np.zeros(table.shape, dtype=table.dtype)
+    version = -1
+    chunk = config['chunk_steps'] * num_envs
+    buffers = {key: np.zeros(chunk, dtype=dtype) for key, (dtype, _) in TRANSITION.items()}
+    n = 0
+    states = discretizer.encode_batch(env.reset())
+    steps = 0
+    try:
+        while not table.stopped:
+            if steps % config['sync_every'] == 0:
+                fetched = table.fetch(version, out=q_table)
+                if fetched is not None:
+                    version = fetched[1]
+                    ring.header[VERSION] = version
+            actions = np.argmax(q_table[states], axis=1)
+            explore = rng.random(num_envs) < epsilon
+            actions[explore] = rng.integers(0, q_table.shape[1], size=int(explore.sum()))
+            lengths = env.episode_lengths + 1 # before the automatic resets
+            observation, rewards, dones, infos = env.step(actions)
+            new_states = discretizer.encode_batch(observation) # finished games are already reset
+            next_states = new_states.copy()
+            if dones.any():
+                # the next state of a finished game is its final observation, not the new game
+                next_states[dones] = discretizer.encode_batch(infos['final_observation'])[dones]
+            cut = ~dones & (lengths >= config['max_steps'])
+            steps += 1
+
+            rows = slice(n, n + num_envs)
+            buffers['state'][rows] = states
+            buffers['action'][rows] = actions
+            buffers['reward'][rows] = rewards
+            buffers['next_state'][rows] = next_states
+            buffers['done'][rows] = dones
+            buffers['last'][rows] = dones | cut
+            buffers['env'][rows] = np.arange(num_envs)
+            n += num_envs
+            if n == chunk:
+                # backpressure: wait for the learner, but give up if it stops
+                while not ring.put(buffers, timeout=0.1):
+                    if table.stopped:
+                        return
+                n = 0
+
+            if cut.any():
+                # games over max_steps: new games (the observation arrays are views on the state)
+                for i in np.flatnonzero(cut).tolist():
+                    env.reset_env(i)
+                new_states = discretizer.encode_batch(observation)
+            states = new_states
+    finally:
+        ring.close_writer()
+        ring.close()
+        table.close()
+
+
+class Metrics:
+    # throughput and pipeline health, printed by the learner
+    def __init__(self, rings, envs_per_actor):
+        self.rings = rings
+        self.start = self.last_log = time.perf_counter()
+        self.consumed = self.updates = 0
+        self.idle = 0.0
+        self.returns = [] # returns of the finished episodes
+        self._running = np.zeros((len(rings), envs_per_actor)) # return of the current episode of each game
+        self._last_consumed = 0
+
+    def record(self, actor, batch):
+        self.consumed += len(batch['reward'])
+        self.updates += 1
+        running = self._running[actor]
+        rewards, envs = batch['reward'], batch['env']
+        previous = 0
+        for end in np.flatnonzero(batch['last']).tolist():
+            np.add.at(running, envs[previous:end + 1], rewards[previous:end + 1])
+            game = envs[end]
+            self.returns.append(running[game])
+            running[game] = 0
+            previous = end + 1
+        np.add.at(running, envs[previous:], rewards[previous:])
+
+    def snapshot(self, version):
+        now = time.perf_counter()
+        elapsed = now - self.start
+        return {
+            'elapsed': elapsed,
+            'transitions': self.consumed,
+            'transitions_per_second': self.consumed / elapsed,
+            'updates': self.updates,
+            'learner_idle': self.idle / elapsed,
+            'episodes': len(self.returns),
+            'mean_return_last_100': float(np.mean(self.returns[-100:])) if self.returns else 0.0,
+            'ring_fill': [len(ring) / ring.capacity for ring in self.rings],
+            'actor_stalls': [int(ring.header[STALLS]) for ring in self.rings],
+            'actor_blocked': [ring.header[BLOCKED_NS] / 1e9 / elapsed for ring in self.rings],
+            'policy_lag': [version - int(ring.header[VERSION]) for ring in self.rings],
+        }
+
+    def log(self, version):
+        now = time.perf_counter()
+        rate = (self.consumed - self._last_consumed) / (now - self.last_log)
+        self.last_log, self._last_consumed = now, self.consumed
+        s = self.snapshot(version)
+        fill = ' '.join(f'{100 * f:3.0f}' for f in s['ring_fill'])
+        blocked = ' '.join(f'{100 * b:3.0f}' for b in s['actor_blocked'])
+        lag = ' '.join(str(l) for l in s['policy_lag'])
+        print(f"{s['elapsed']:7.1f}s  {s['transitions']:9d} transitions  {rate:8.0f}/s  "
+              f"learner idle {100 * s['learner_idle']:3.0f}%  ring fill % [{fill}]  actor blocked % [{blocked}]  "
+              f"policy v{version} lag [{lag}]  episodes {s['episodes']}  return(100) {s['mean_return_last_100']:.2f}")
+
+
+def train(config, steps):
+    discretizer = make_discretizer(config['features'], config['env'])
+    num_actions = TankEnv(**config['env'], verbose=False).action_space.n
+    agent = TabularQ(discretizer, num_actions, storage='dense', seed=config['seed'])
+    values = agent.storage.values
+
+    table = SharedTable(values.shape, values.dtype)
+    rings = [SharedRing(config['ring_capacity'], TRANSITION) for _ in range(config['actors'])]
+    version = table.publish(values)
+    actors = [multiprocessing.Process(target=run_actor, args=(i, ring.spec, table.spec, config), daemon=True)
+              for i, ring in enumerate(rings)]
+    for actor in actors:
+        actor.start()
+
+    metrics = Metrics(rings, config['envs_per_actor'])
+    try:
+        while metrics.consumed < steps:
+            got = False
+            for i, ring in enumerate(rings):
+                batch = ring.get(config['batch_size'])
+                if batch is None:
+                    continue
+                got = True
+                agent.update_batch(batch['state'], batch['action'], config['learning_rate'], batch['reward'],
+                                   config['discount_factor'], batch['next_state'], dones=batch['done'])
+                metrics.record(i, batch)
+                if metrics.updates % config['broadcast_every'] == 0:
+                    version = table.publish(values)
+            if not got:
+                if not any(actor.is_alive() for actor in actors):
+                    raise RuntimeError("all the actors stopped")
+                start = time.perf_counter()
+                time.sleep(1e-4)
+                metrics.idle += time.perf_counter() - start
+            if time.perf_counter() - metrics.last_log >= config['log_interval']:
+                metrics.log(version)
+    finally:
+        table.stop()
+        for actor in actors:
+            actor.join(timeout=5)
+            if actor.is_alive():
+                actor.terminate()
+        metrics.log(version)
+        result = metrics.snapshot(version)
+        for ring in rings:
+            ring.close()
+        table.close()
+    return agent, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--steps', type=int, default=1000000, help="transitions consumed by the learner")
+    parser.add_argument('--actors', type=int, default=max(1, multiprocessing.cpu_count() - 1))
+    parser.add_argument('--features', choices=['basic', 'rich'], default='basic')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-x', type=int, default=20)
+    parser.add_argument('--max-y', type=int, default=20)
+    parser.add_argument('--max-enemies', type=int, default=5, help="max_enemies_on_screen of TankEnv")
+    parser.add_argument('--max-steps', type=int, default=2000, help="step limit per episode")
+    parser.add_argument('--learning-rate', type=float, default=0.01)
+    parser.add_argument('--discount-factor', type=float, default=0.99)
+    parser.add_argument('--epsilon', type=float, default=0.4, help="base of the per-actor epsilons")
+    parser.add_argument('--envs-per-actor', type=int, default=8)
+    parser.add_argument('--chunk-steps', type=int, default=8, help="actor steps per ring write")
+    parser.add_argument('--ring-capacity', type=int, default=16384, help="transitions per actor ring")
+    parser.add_argument('--batch-size', type=int, default=1024, help="max transitions per learner update")
+    parser.add_argument('--broadcast-every', type=int, default=20, help="learner updates between Q-table broadcasts")
+    parser.add_argument('--sync-every', type=int, default=500, help="actor steps (all its games at once) between checks for a new Q-table")
+    parser.add_argument('--log-interval', type=float, default=5.0, help="seconds")
+    parser.add_argument('--output', default='q_tabular.npz', help="where to save the Q-table (TabularQ.save)")
+    args = parser.parse_args()
+
+    config = {
+        'env': {'max_x': args.max_x, 'max_y': args.max_y, 'max_enemies_on_screen': args.max_enemies},
+        'features': args.features,
+        'seed': args.seed,
+        'actors': args.actors,
+        'max_steps': args.max_steps,
+        'learning_rate': args.learning_rate,
+        'discount_factor': args.discount_factor,
+        'epsilon': args.epsilon,
+        'envs_per_actor': args.envs_per_actor,
+        'chunk_steps': args.chunk_steps,
+        'ring_capacity': args.ring_capacity,
+        'batch_size': args.batch_size,
+        'broadcast_every': args.broadcast_every,
+        'sync_every': args.sync_every,
+        'log_interval': args.log_interval,
+    }
+    assert args.chunk_steps * args.envs_per_actor <= args.ring_capacity
+    agent, _ = train(config, args.steps)
+    agent.save(args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""Headless training of the Q-table agent over a pool of worker processes.
+
+Training runs in rounds: every worker gets a copy of the current Q-table, plays
+its share of episodes with it (Q-learning on its local copy) and sends back the
+change it made to the table. The deltas are merged into the shared table
+(averaged, or summed) before the next round. Each worker seeds its TankEnv and
+the global numpy RNG (used by QTable) from (seed, round, worker), so a run is
+reproducible for a given number of workers.
+
+    python train_q_table.py --episodes 10000 --workers 4
+    python train_q_table.py --episodes 2000 --workers 4 --render-every 5
+"""
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+
+from envs import TankEnv
+from agents.Q_table_agent import QTable, grab_distance_and_kronecker
+
+
+def worker_seed(seed, round_index, worker_index):
+    return int(np.random.SeedSequence([seed, round_index, worker_index]).generate_state(1)[0])
+
+
+def epsilon_at(episode, config):
+    return max(config['epsilon_min'], config['epsilon'] * config['epsilon_decay'] ** episode)
+
+
+def observe(state, config):
+    # (distance, orientation) of the Q-table, distances past the table in its last row
+    distance, orientation = grab_distance_and_kronecker(state)
+    return min(distance, config['num_distances_manhattan'] - 1), orientation
+
+
+def run_episode(env, agent, epsilon, config):
+    env.reset()
+    distance, orientation = observe(env.state, config)
+    total_reward = 0
+    for _ in range(config['max_steps']):
+        action = agent.choose_action(distance, orientation, epsilon)
+        state, reward, done, _ = env.step(action)
+        next_distance, next_orientation = observe(state, config)
+        agent.update_q_value(distance, orientation, action, config['learning_rate'], reward,
+                             config['discount_factor'], next_distance, next_orientation)
+        total_reward += reward
+        distance, orientation = next_distance, next_orientation
+        if done:
+            break
+    return total_reward
+
+
+def run_worker(task):
+    # plays a block of episodes on a local copy of the Q-table, returns (delta, rewards)
+    q_table, first_episode, num_episodes, seed, config = task
+    np.random.seed(seed)
+    env = TankEnv(**config['env'], verbose=False)
+    env.seed(seed)
+    agent = QTable(config['num_distances_manhattan'], env.action_space.n, num_orientations_kronecker=2)
+    agent.set_q_table(q_table.copy())
+    rewards = np.zeros(num_episodes)
+    for i in range(num_episodes):
+        rewards[i] = run_episode(env, agent, epsilon_at(first_episode + i, config), config)
+    return agent.q_table - q_table, rewards
+
+
+def render_episode(agent, config, scale=18, fps=30):
+    # greedy episode in a pygame window, only used when --render-every is set
+    import pygame
+
+    env = TankEnv(**config['env'], verbose=False)
+    env.reset()
+    screen = pygame.display.set_mode((env.renderer.rows * scale, env.renderer.cols * scale))
+    clock = pygame.time.Clock()
+    distance, orientation = observe(env.state, config)
+    for _ in range(config['max_steps']):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return
+        action = agent.choose_action(distance, orientation, 0)
+        state, _, done, _ = env.step(action)
+        distance, orientation = observe(state, config)
+        env.render()
+        env.renderer.blit(screen, scale)
+        pygame.display.flip()
+        clock.tick(fps)
+        if done:
+            return
+
+
+def train(config, episodes, workers=1, episodes_per_round=50, merge='mean', seed=0, render_every=0, log_every=1):
+    action_space_size = TankEnv(**config['env'], verbose=False).action_space.n
+    agent = QTable(config['num_distances_manhattan'], action_space_size, num_orientations_kronecker=2)
+    rewards = np.zeros(episodes)
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    if render_every:
+        import pygame
+        pygame.init()
+
+    start = time.perf_counter()
+    episode, round_index = 0, 0
+    try:
+        while episode < episodes:
+            # split the episodes of this round between the workers
+            round_episodes = min(episodes_per_round * workers, episodes - episode)
+            counts = [round_episodes // workers + (i < round_episodes % workers) for i in range(workers)]
+            tasks, first = [], episode
+            for i, count in enumerate(counts):
+                if count:
+                    tasks.append((agent.q_table, first, count, worker_seed(seed, round_index, i), config))
+                    first += count
+            results = pool.map(run_worker, tasks) if pool else [run_worker(task) for task in tasks]
+
+            deltas = [delta for delta, _ in results]
+            if merge == 'mean':
+                agent.q_table = agent.q_table + np.mean(deltas, axis=0)
+            else:
+                agent.q_table = agent.q_table + np.sum(deltas, axis=0)
+            rewards[episode:episode + round_episodes] = np.concatenate([r for _, r in results])
+            episode += round_episodes
+            round_index += 1
+
+            if log_every and round_index % log_every == 0:
+                elapsed = time.perf_counter() - start
+                recent = rewards[max(0, episode - 100):episode].mean()
+                print(f"round {round_index:4d}  episodes {episode:6d}  "
+                      f"{episode / elapsed:7.1f} episodes/s  mean reward (last 100) {recent:8.3f}")
+            if render_every and round_index % render_every == 0:
+                render_episode(agent, config)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    elapsed = time.perf_counter() - start
+    print(f"{episodes} episodes in {elapsed:.1f} s ({episodes / elapsed:.1f} episodes/s, {workers} workers)")
+    return agent, rewards
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--episodes', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--episodes-per-round', type=int, default=50, help="episodes per worker between two merges")
+    parser.add_argument('--merge', choices=['mean', 'sum'], default='mean', help="how worker deltas are combined")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-x', type=int, default=20)
+    parser.add_argument('--max-y', type=int, default=20)
+    parser.add_argument('--max-enemies', type=int, default=5, help="max_enemies_on_screen of TankEnv")
+    parser.add_argument('--max-steps', type=int, default=2000, help="step limit per episode")
+    parser.add_argument('--learning-rate', type=float, default=0.001)
+    parser.add_argument('--discount-factor', type=float, default=0.99)
+    parser.add_argument('--epsilon', type=float, default=1)
+    parser.add_argument('--epsilon-decay', type=float, default=0.997)
+    parser.add_argument('--epsilon-min', type=float, default=0.01)
+    parser.add_argument('--num-distances', type=int, default=None,
+                        help="rows of the Q-table (default: max_x + max_y - 1, every Manhattan distance of the grid)")
+    parser.add_argument('--render-every', type=int, default=0, help="play a rendered greedy episode every N rounds (0: never)")
+    parser.add_argument('--output', default='q_table.npy', help="where to save the Q-table")
+    parser.add_argument('--rewards-output', default=None, help="where to save the reward of each episode")
+    args = parser.parse_args()
+
+    config = {
+        'env': {'max_x': args.max_x, 'max_y': args.max_y, 'max_enemies_on_screen': args.max_enemies},
+        'max_steps': args.max_steps,
+        'learning_rate': args.learning_rate,
+        'discount_factor': args.discount_factor,
+        'epsilon': args.epsilon,
+        'epsilon_decay': args.epsilon_decay,
+        'epsilon_min': args.epsilon_min,
+        'num_distances_manhattan': args.num_distances or args.max_x + args.max_y - 1,
+    }
+    agent, rewards = train(config, args.episodes, workers=args.workers, episodes_per_round=args.episodes_per_round,
+                           merge=args.merge, seed=args.seed, render_every=args.render_every)
+    np.save(args.output, agent.q_table)
+    if args.rewards_output:
+        np.save(args.rewards_output, rewards)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from utils.replay_buffer import ReplayBuffer
+
+try:
+    import fcntl
+except ImportError: # Windows: pas de verrou, un seul écrivain par convention
+    fcntl = None
+
+HEADER = 'header.json'
+LOCK = 'writer.lock'
+VERSION = 1
+
+
+def tank_env_config(env):
+    # configuration of a TankEnv, recorded in the header of a store
+    config = {
+        'max_x': env.max_x,
+        'max_y': env.max_y,
+        'max_enemies_on_screen': env.max_enemies_on_screen,
+        'total_ennemies_to_kill': env.total_ennemies_to_kill,
+        'obs_mode': env.obs_mode,
+    }
+    if env.chunk_size is not None: # LargeTankEnv
+        config.update(window_radius=env.window_radius, chunk_size=env.chunk_size)
+    return config
+
+
+class DiskReplayBuffer(ReplayBuffer):
+    # ReplayBuffer whose fields are memory-mapped .npy files in a directory, next to a small
+    # JSON header (capacity, shapes, dtypes, TankEnv config, write position):
+    #   store/header.json  store/obs.npy  store/next_obs.npy  store/actions.npy ...
+    # The files are allocated once at full capacity (sparse on most file systems) and only the
+    # pages actually read are loaded, so reopening a store of any size is immediate.
+    #
+    # mode='w' creates (or overwrites) a store, mode='a' reopens one to append to it (created if
+    # missing), mode='r' opens it read-only. Only one process can write (lock file), any number
+    # can read at the same time: readers see the transitions published in the header, which the
+    # writer rewrites (atomic rename) every flush_every transitions and on flush()/close().
+    # The header also reserves the slots the writer is about to overwrite once the ring is full:
+    # readers never sample them, and check after reading a batch (header read again, like a
+    # seqlock) that the writer did not get to them in the meantime, otherwise they draw again.
+    #
+    # sample() draws uniformly among the readable transitions and reads them in file order
+    # (sorted indices) to help the page cache and read-ahead. No prioritized mode: priorities
+    # would be per learner anyway, use a ReplayBuffer for that.
+    # n-step windows are kept in memory by the writer, unfinished ones are lost on close().
+    def __init__(self, path, mode='r', capacity=None, obs_shape=(), obs_dtype=np.int32, n_step=1,
+                 discount_factor=0.99, env_config=None, flush_every=1024, seed=None):
+        assert mode in ('r', 'a', 'w')
+        self.path = Path(path)
+        self.mode = mode
+        self.flush_every = flush_every
+        self._lock = None
+
+        create = mode == 'w' or (mode == 'a' and not (self.path / HEADER).exists())
+        if create:
+            if capacity is None:
+                raise ValueError(f"capacity is needed to create a replay store in {self.path}")
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._acquire_lock()
+            header = {
+                'version': VERSION,
+                'capacity': capacity,
+                'obs_shape': list(obs_shape),
+                'obs_dtype': np.dtype(obs_dtype).str,
+                'n_step': n_step,
+                'discount_factor': discount_factor,
+                'env_config': env_config,
+                'position': 0,
+                'size': 0,
+                'total': 0,
+                'reserve': 0,
+            }
+            self._file_mode = 'w+'
+        else:
+            header = self._read_header()
+            if header['version'] != VERSION:
+                raise ValueError(f"unsupported replay store version {header['version']} in {self.path}")
+            if env_config is not None and header['env_config'] != env_config:
+                raise ValueError(f"replay store {self.path} was recorded with {header['env_config']}, not {env_config}")
+            if mode == 'a':
+                self._acquire_lock()
+            self._file_mode = 'r+' if mode == 'a' else 'r'
+
+        self.env_config = header['env_config']
+        super().__init__(header['capacity'], obs_shape=header['obs_shape'], obs_dtype=np.dtype(header['obs_dtype']),
+                         n_step=header['n_step'], discount_factor=header['discount_factor'], seed=seed)
+        self.position = header['position']
+        self.size = header['size']
+        self.total = header['total'] # transitions written since the creation of the store
+        self.reserve = header['reserve'] if mode == 'r' else 0
+        # transitions written since the last header, slots reserved by it
+        self._written = 0
+        self._reserved = 0
+        if create:
+            self._write_header()
+
+    def _allocate(self, name, shape, dtype):
+        return np.lib.format.open_memmap(self.path / f'{name}.npy', mode=self._file_mode, dtype=dtype, shape=shape)
+
+    ##################### header and lock #####################
+
+    def _acquire_lock(self):
+        self._lock = open(self.path / LOCK, 'w')
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock.close()
+                self._lock = None
+                raise RuntimeError(f"replay store {self.path} is already opened by a writer")
+
+    def _read_header(self):
+        with open(self.path / HEADER) as f:
+            return json.load(f)
+
+    def _write_header(self, reserve=0):
+        header = {
+            'version': VERSION,
+            'capacity': self.capacity,
+            'obs_shape': list(self.obs_shape),
+            'obs_dtype': self.obs.dtype.str,
+            'n_step': self.n_step,
+            'discount_factor': self.discount_factor,
+            'env_config': self.env_config,
+            'position': self.position,
+            'size': self.size,
+            'total': self.total,
+            'reserve': reserve,
+        }
+        # written aside then renamed: a reader always gets a complete header
+        tmp = self.path / (HEADER + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(header, f)
+        os.replace(tmp, self.path / HEADER)
+        self._written = 0
+        self._reserved = reserve
+
+    def refresh(self):
+        # reader: picks up what the writer published since the last call
+        header = self._read_header()
+        self.position = header['position']
+        self.size = header['size']
+        self.total = header['total']
+        self.reserve = header['reserve']
+
+    def flush(self):
+        # data to disk, then a header pointing to it
+        if self.mode == 'r':
+            return
+        for array in (self.obs, self.next_obs, self.actions, self.rewards, self.dones, self.discounts):
+            array.flush()
+        self._write_header()
+
+    def close(self):
+        if self.mode != 'r':
+            self.flush()
+        if self._lock is not None:
+            self._lock.close() # releases the lock
+            self._lock = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    ##################### insertion #####################
+
+    def _store(self, obs, actions, rewards, next_obs, dones, discounts):
+        if self.mode == 'r':
+            raise ValueError(f"replay store {self.path} is opened read-only")
+        k = min(len(actions), self.capacity)
+        if self._written + k > self._reserved:
+            # publish what is written so far and reserve the next slots before touching them
+            self._write_header(reserve=min(max(self.flush_every, k), self.capacity))
+        indices = super()._store(obs, actions, rewards, next_obs, dones, discounts)
+        self._written += k
+        self.total += k
+        return indices
+
+    ##################### sampling #####################
+
+    def readable(self):
+        # number of transitions that can be sampled: the most recent ones before position,
+        # without the slots reserved by the writer
+        if self.mode == 'r':
+            self.refresh()
+        return min(self.size, self.capacity - self.reserve)
+
+    def sample(self, batch_size):
+        while True:
+            readable = self.readable()
+            assert readable > 0, "empty replay store"
+            position, total = self.position, self.total
+            offsets = self.rng.integers(0, readable, size=batch_size)
+            indices = np.sort((position - 1 - offsets) % self.capacity)
+            batch = self._gather(indices)
+            if self.mode != 'r':
+                return batch
+            # slots the writer may have written since the header used: from the old position
+            # up to the end of what the current header reserves
+            self.refresh()
+            overwritten = self.total + self.reserve - total
+            if overwritten < self.capacity and ((indices - position) % self.capacity >= overwritten).all():
+                return batch
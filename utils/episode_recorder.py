@@ -0,0 +1,350 @@
+import json
+import struct
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from envs import LargeTankEnv, TankEnv
+from utils.disk_replay_buffer import tank_env_config
+
+# Episode log of a run, one file:
+#   MAGIC, header (u32 length + JSON: version, TankEnv config, keyframe_interval, entities)
+#   chunks: CHUNK header (kind, episode, first step, count, payload size) + zlib payload
+#       ACTIONS   count steps from `first`: actions (int8), then rewards (float32)
+#       KEYFRAME  TankEnv.get_state() after `first` steps (step 0 = right after reset)
+#       ENTITIES  count steps from `first`: entities after each step, see _pack_entities
+#       INDEX     JSON list of the episodes (written by close())
+#   footer: offset of the INDEX chunk (u64), MAGIC
+# Chunks are appended as the episodes go, so a run that crashed before close() is still
+# readable: without a valid footer, EpisodeReplayer rebuilds the index by scanning the chunks
+# (the last unfinished chunk, if any, is dropped).
+MAGIC = b'TANKREC1'
+VERSION = 1
+CHUNK = struct.Struct('<BIIII')
+FOOTER = struct.Struct('<Q8s')
+ACTIONS, KEYFRAME, ENTITIES, INDEX = range(4)
+
+
+def _pack_entities(records):
+    # records: per step (player (3,), enemies (n, 3), projectiles (m, 4)) int32 arrays, x y direction [label]
+    # -> counts (steps, 2), players (steps, 3), all enemies, all projectiles, one after the other
+    counts = np.array([(len(e), len(p)) for _, e, p in records], dtype=np.int32).reshape(-1, 2)
+    players = np.array([player for player, _, _ in records], dtype=np.int32).reshape(-1, 3)
+    enemies = np.concatenate([e for _, e, _ in records]).astype(np.int32).reshape(-1, 3)
+    projectiles = np.concatenate([p for _, _, p in records]).astype(np.int32).reshape(-1, 4)
+    return b''.join(array.tobytes() for array in (counts, players, enemies, projectiles))
+
+
+def _unpack_entities(payload, steps):
+    counts = np.frombuffer(payload, dtype=np.int32, count=2 * steps).reshape(steps, 2)
+    offset = counts.nbytes
+    players = np.frombuffer(payload, dtype=np.int32, count=3 * steps, offset=offset).reshape(steps, 3)
+    offset += players.nbytes
+    total = counts.sum(axis=0)
+    enemies = np.frombuffer(payload, dtype=np.int32, count=3 * total[0], offset=offset).reshape(-1, 3)
+    offset += enemies.nbytes
+    projectiles = np.frombuffer(payload, dtype=np.int32, count=4 * total[1], offset=offset).reshape(-1, 4)
+    e_ends, p_ends = np.cumsum(counts[:, 0]), np.cumsum(counts[:, 1])
+    return [(players[i], enemies[e_ends[i] - counts[i, 0]:e_ends[i]], projectiles[p_ends[i] - counts[i, 1]:p_ends[i]])
+            for i in range(steps)]
+
+
+def entities_of(env):
+    # live entities of a TankEnv, in slot order: player (x, y, direction), enemies (n, 3),
+    # projectiles (m, 4) with the label
+    player = env.state['player']
+    enemies, projectiles = env.state['enemies'], env.state['projectiles']
+    e, p = enemies.indices(), projectiles.indices()
+    return (np.array([player.x, player.y, player.direction], dtype=np.int32),
+            np.stack([enemies.x[e], enemies.y[e], enemies.direction[e]], axis=1).astype(np.int32),
+            np.stack([projectiles.x[p], projectiles.y[p], projectiles.direction[p], projectiles.label[p]],
+                     axis=1).astype(np.int32))
+
+
+class EpisodeRecorder:
+    # records the episodes of a TankEnv into one file per run (format above):
+    #   recorder = EpisodeRecorder('runs/run.tankrec')
+    #   env = TankEnv(..., recorder=recorder) # or env.recorder = recorder
+    #   ... reset() / step() as usual ...
+    #   recorder.close()
+    # Per step: action and reward. Every keyframe_interval steps (and right after reset): a
+    # get_state() snapshot, so that a replay can start close to any step. entities=True also
+    # keeps the live entities after every step (readable without simulating).
+    # Steps are buffered and written chunk_steps at a time, zlib level `level`.
+    def __init__(self, path, keyframe_interval=100, entities=False, chunk_steps=1024, level=6):
+        assert keyframe_interval > 0 and chunk_steps > 0
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.keyframe_interval = keyframe_interval
+        self.entities = entities
+        self.chunk_steps = chunk_steps
+        self.level = level
+        self.file = open(self.path, 'wb')
+        self.file.write(MAGIC)
+        self.config = None # header written at the first episode (TankEnv config)
+        self.episodes = [] # index: one dict per episode
+        self._episode = None
+        self._actions, self._rewards, self._entities = [], [], []
+        self._first = 0 # first step of the buffered steps
+
+    def _write_header(self, config):
+        self.config = config
+        header = json.dumps({'version': VERSION, 'env_config': self.config,
+                             'keyframe_interval': self.keyframe_interval, 'entities': self.entities}).encode()
+        self.file.write(struct.pack('<I', len(header)) + header)
+
+    def _write_chunk(self, kind, first, count, data):
+        payload = zlib.compress(data, self.level)
+        offset = self.file.tell()
+        episode = len(self.episodes) - 1 if kind != INDEX else 0
+        self.file.write(CHUNK.pack(kind, episode, first, count, len(payload)))
+        self.file.write(payload)
+        if kind != INDEX:
+            self._episode['chunks'].append([kind, first, count, offset])
+        return offset
+
+    def _flush_steps(self):
+        count = len(self._actions)
+        if count == 0:
+            return
+        data = np.array(self._actions, dtype=np.int8).tobytes() + np.array(self._rewards, dtype=np.float32).tobytes()
+        self._write_chunk(ACTIONS, self._first, count, data)
+        if self.entities:
+            self._write_chunk(ENTITIES, self._first, count, _pack_entities(self._entities))
+        self._first += count
+        self._actions, self._rewards, self._entities = [], [], []
+
+    def _end_episode(self):
+        if self._episode is not None:
+            self._flush_steps()
+            self._episode = None
+
+    ##################### called by TankEnv #####################
+
+    def start_episode(self, env, seed=None):
+        if self.config is None:
+            self._write_header(tank_env_config(env))
+        elif tank_env_config(env) != self.config:
+            raise ValueError("an EpisodeRecorder records the episodes of a single TankEnv configuration")
+        self._end_episode()
+        self._episode = {'seed': seed, 'offset': self.file.tell(), 'steps': 0, 'done': False,
+                         'reward': 0.0, 'chunks': []}
+        self.episodes.append(self._episode)
+        self._first = 0
+        self._write_chunk(KEYFRAME, 0, 0, env.get_state())
+
+    def record_step(self, env, action, reward, done):
+        episode = self._episode
+        if episode is None:
+            return # step() without reset(): nothing to replay from
+        self._actions.append(action)
+        self._rewards.append(reward)
+        if self.entities:
+            self._entities.append(entities_of(env))
+        episode['steps'] += 1
+        episode['reward'] += float(reward)
+        episode['done'] = bool(done)
+        if len(self._actions) >= self.chunk_steps:
+            self._flush_steps()
+        if episode['steps'] % self.keyframe_interval == 0 and not done:
+            self._flush_steps() # chunks of an episode stay in step order
+            self._write_chunk(KEYFRAME, episode['steps'], 0, env.get_state())
+
+    ##################### end of the run #####################
+
+    def flush(self):
+        # buffered steps to the file (readable by a replayer, the index is rebuilt by scanning)
+        if self._episode is not None:
+            self._flush_steps()
+        self.file.flush()
+
+    def close(self):
+        if self.file.closed:
+            return
+        self._end_episode()
+        if self.config is None: # no episode: empty run
+            self._write_header({})
+        offset = self._write_chunk(INDEX, 0, len(self.episodes), json.dumps(self.episodes).encode())
+        self.file.write(FOOTER.pack(offset, MAGIC))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EpisodeReplayer:
+    # reads a file of EpisodeRecorder and replays its episodes on a TankEnv of the recorded config:
+    #   replayer = EpisodeReplayer('runs/run.tankrec')
+    #   env = replayer.seek(3, 1200) # episode 3 after 1200 steps, from the closest keyframe
+    #   for step, observation, reward, done in replayer.replay(3): ...
+    #   replayer.export_frames(3, 'episode3.npy', scale=8) # (steps + 1, H, W, 3) uint8 for a video
+    # Replays are deterministic: a keyframe holds the full state, RNG included.
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as file:
+            self.data = file.read()
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path} is not an episode recording")
+        (size,) = struct.unpack_from('<I', self.data, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(self.data[start:start + size])
+        if header['version'] != VERSION:
+            raise ValueError(f"unsupported episode recording version {header['version']} in {self.path}")
+        self.env_config = header['env_config']
+        self.keyframe_interval = header['keyframe_interval']
+        self.has_entities = header['entities']
+        self._chunks_start = start + size
+        self.episodes = self._read_index()
+        self._cache = (None, None) # episode, decoded steps
+
+    def _read_index(self):
+        if len(self.data) >= FOOTER.size:
+            offset, magic = FOOTER.unpack_from(self.data, len(self.data) - FOOTER.size)
+            if magic == MAGIC and offset < len(self.data):
+                kind, _, _, _, _ = CHUNK.unpack_from(self.data, offset)
+                if kind == INDEX:
+                    return json.loads(self._payload(offset))
+        return self._scan()
+
+    def _scan(self):
+        # index of a run not closed: walks the chunks, stops at the first incomplete one
+        episodes = []
+        offset = self._chunks_start
+        while offset + CHUNK.size <= len(self.data):
+            kind, episode, first, count, size = CHUNK.unpack_from(self.data, offset)
+            end = offset + CHUNK.size + size
+            if end > len(self.data) or kind == INDEX:
+                break
+            if kind == KEYFRAME and first == 0:
+                # seed and end of the episode are only in the index
+                episodes.append({'seed': None, 'offset': offset, 'steps': 0, 'done': None, 'reward': 0.0, 'chunks': []})
+            entry = episodes[episode]
+            entry['chunks'].append([kind, first, count, offset])
+            if kind == ACTIONS:
+                entry['steps'] = first + count
+                rewards = np.frombuffer(self._payload(offset), dtype=np.float32, offset=count)
+                entry['reward'] += float(rewards.sum())
+            offset = end
+        return episodes
+
+    def _payload(self, offset):
+        _, _, _, _, size = CHUNK.unpack_from(self.data, offset)
+        start = offset + CHUNK.size
+        return zlib.decompress(self.data[start:start + size])
+
+    def __len__(self):
+        return len(self.episodes)
+
+    def make_env(self, **kwargs):
+        environment = LargeTankEnv if 'chunk_size' in self.env_config else TankEnv
+        return environment(**{**self.env_config, 'verbose': False, **kwargs})
+
+    ##################### recorded data #####################
+
+    def _steps(self, episode):
+        # (actions, rewards) of an episode, cached for the last episode read
+        if self._cache[0] != episode:
+            actions, rewards = [], []
+            for kind, _, count, offset in self.episodes[episode]['chunks']:
+                if kind == ACTIONS:
+                    payload = self._payload(offset)
+                    actions.append(np.frombuffer(payload, dtype=np.int8, count=count))
+                    rewards.append(np.frombuffer(payload, dtype=np.float32, count=count, offset=count))
+            self._cache = (episode, (np.concatenate(actions) if actions else np.zeros(0, np.int8),
+                                     np.concatenate(rewards) if rewards else np.zeros(0, np.float32)))
+        return self._cache[1]
+
+    def actions(self, episode):
+        return self._steps(episode)[0]
+
+    def rewards(self, episode):
+        return self._steps(episode)[1]
+
+    def keyframes(self, episode):
+        # steps with a keyframe
+        return [first for kind, first, _, _ in self.episodes[episode]['chunks'] if kind == KEYFRAME]
+
+    def entities(self, episode, start=0, stop=None):
+        # recorded entities after steps start+1 .. stop (entities=True), list of (player, enemies, projectiles)
+        if not self.has_entities:
+            raise ValueError(f"{self.path} was recorded without entities (EpisodeRecorder(entities=True))")
+        stop = self.episodes[episode]['steps'] if stop is None else stop
+        records = []
+        for kind, first, count, offset in self.episodes[episode]['chunks']:
+            if kind == ENTITIES and first < stop and first + count > start:
+                chunk = _unpack_entities(self._payload(offset), count)
+                records.extend(chunk[max(start - first, 0):stop - first])
+        return records
+
+    ##################### replay #####################
+
+    def seek(self, episode, step, env=None):
+        # env (created if None) in the state of the episode after `step` steps: restores the last
+        # keyframe before it and replays the actions from there
+        entry = self.episodes[episode]
+        if not 0 <= step <= entry['steps']:
+            raise IndexError(f"episode {episode} has {entry['steps']} steps, cannot seek to step {step}")
+        env = self.make_env() if env is None else env
+        keyframe = None
+        for kind, first, _, offset in entry['chunks']:
+            if kind == KEYFRAME and first <= step:
+                keyframe = (first, offset)
+        first, offset = keyframe
+        env.set_state(self._payload(offset))
+        for action in self.actions(episode)[first:step].tolist():
+            env.step(action)
+        return env
+
+    def replay(self, episode, start=0, stop=None, env=None):
+        # yields (step, observation, reward, done) for the steps start+1 .. stop of the episode,
+        # the environment (env.state, env.render()) is in the state after `step` steps
+        stop = self.episodes[episode]['steps'] if stop is None else stop
+        env = self.seek(episode, start, env)
+        for step, action in enumerate(self.actions(episode)[start:stop].tolist(), start + 1):
+            observation, reward, done, _ = env.step(action)
+            yield step, observation, reward, done
+
+    def check(self, episode, env=None):
+        # replays the episode and compares the rewards and the keyframes with the recorded ones;
+        # returns the first step that differs, None if the replay is exact
+        rewards = self.rewards(episode)
+        keyframes = {first: offset for kind, first, _, offset in self.episodes[episode]['chunks'] if kind == KEYFRAME}
+        env = self.seek(episode, 0, env)
+        for step, action in enumerate(self.actions(episode).tolist(), 1):
+            _, reward, _, _ = env.step(action)
+            if np.float32(reward) != rewards[step - 1]:
+                return step
+            if step in keyframes and env.get_state() != self._payload(keyframes[step]):
+                return step
+        return None
+
+    ##################### frames #####################
+
+    def frames(self, episode, scale=1, start=0, stop=None, env=None):
+        # rendered frames (TankRenderer, upscaled by scale) of the states start .. stop (state k:
+        # after k steps). The frames are read-only views rewritten at the next one: copy to keep.
+        stop = self.episodes[episode]['steps'] if stop is None else stop
+        env = self.seek(episode, start, env)
+        env.render()
+        yield env.renderer.scaled(scale)
+        for action in self.actions(episode)[start:stop].tolist():
+            env.step(action)
+            env.render()
+            yield env.renderer.scaled(scale)
+
+    def export_frames(self, episode, path, scale=8, start=0, stop=None):
+        # frames start .. stop into a .npy file (memory-mapped while written), shape
+        # (frames, rows * scale, cols * scale, 3) uint8, e.g. for imageio / ffmpeg
+        stop = self.episodes[episode]['steps'] if stop is None else stop
+        env = self.make_env()
+        shape = (stop - start + 1, env.renderer.rows * scale, env.renderer.cols * scale, 3)
+        output = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=shape)
+        for i, frame in enumerate(self.frames(episode, scale, start, stop, env)):
+            output[i] = frame
+        output.flush()
+        del output
+        return shape
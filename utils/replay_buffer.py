@@ -1,6 +1,198 @@
-import random
 import numpy as np
 
-class ReplayBuffer:
+
+class SumTree:
+    # binary tree stored in one array: leaves [size, 2 * size) hold the priorities,
+    # every inner node i holds tree[2i] + tree[2i+1], the root (index 1) the total.
+    # updates and prefix-sum searches work on whole batches, one numpy call per level: O(log N)
     def __init__(self, capacity):
-        pass
\ No newline at end of file
+        self.depth = max(1, int(np.ceil(np.log2(capacity))))
+        self.size = 2 ** self.depth
+        self.tree = np.zeros(2 * self.size)
+
+    @property
+    def total(self):
+        return self.tree[1]
+
+    def update(self, indices, priorities):
+        nodes = np.asarray(indices) + self.size
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def get(self, indices):
+        return self.tree[np.asarray(indices) + self.size]
+
+    def find(self, values):
+        # index of the leaf where each cumulative value falls
+        values = np.array(values, dtype=float)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            right = values >= left_sum
+            values -= np.where(right, left_sum, 0)
+            nodes = left + right
+        return nodes - self.size
+
+
+class ReplayBuffer:
+    # fixed-capacity circular buffer, one contiguous array per field, allocated once:
+    # memory is capacity * (2 * obs + action + reward + done + discount) bytes whatever the use.
+    #
+    # n_step > 1: transitions are stored once n steps are known, with the discounted sum of the
+    # n rewards, the observation n steps later and discounts = discount_factor ** (steps summed),
+    # so the target is reward + discounts * (1 - done) * max Q(next_obs). Episodes ending early
+    # are flushed with shorter sums. Several environments can feed the buffer, one n-step window
+    # per stream.
+    #
+    # prioritized=True: proportional prioritized replay (priority ** alpha) on a SumTree;
+    # new transitions get the highest priority seen so far, sample() also returns the indices
+    # (for update_priorities) and the importance-sampling weights (normalized by the batch max).
+    def __init__(self, capacity, obs_shape=(), obs_dtype=np.int32, n_step=1, discount_factor=0.99,
+                 prioritized=False, alpha=0.6, beta=0.4, priority_eps=1e-6, seed=None):
+        assert capacity > 0 and n_step >= 1
+        self.capacity = capacity
+        self.obs_shape = tuple(obs_shape)
+        self.n_step = n_step
+        self.discount_factor = discount_factor
+
+        self.obs = self._allocate('obs', (capacity,) + self.obs_shape, obs_dtype)
+        self.next_obs = self._allocate('next_obs', (capacity,) + self.obs_shape, obs_dtype)
+        self.actions = self._allocate('actions', (capacity,), np.int32)
+        self.rewards = self._allocate('rewards', (capacity,), np.float32)
+        self.dones = self._allocate('dones', (capacity,), bool)
+        self.discounts = self._allocate('discounts', (capacity,), np.float32)
+
+        self.position = 0 # next slot to write
+        self.size = 0
+        self.rng = np.random.default_rng(seed)
+
+        # n-step windows by stream: list of (obs, action, reward, next_obs, done)
+        self._windows = {}
+
+        self.prioritized = prioritized
+        if prioritized:
+            self.alpha = alpha
+            self.beta = beta
+            self.priority_eps = priority_eps
+            self.tree = SumTree(capacity)
+            self.max_priority = 1.0
+
+    def _allocate(self, name, shape, dtype):
+        return np.zeros(shape, dtype=dtype)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        arrays = [self.obs, self.next_obs, self.actions, self.rewards, self.dones, self.discounts]
+        if self.prioritized:
+            arrays.append(self.tree.tree)
+        return sum(a.nbytes for a in arrays)
+
+    ##################### insertion #####################
+
+    def _store(self, obs, actions, rewards, next_obs, dones, discounts):
+        # writes k transitions at the current position, O(k), as (at most) two contiguous slices
+        k = len(actions)
+        fields = (obs, actions, rewards, next_obs, dones, discounts)
+        if k > self.capacity:
+            # only the last capacity transitions would survive
+            fields = tuple(a[-self.capacity:] for a in fields)
+            k = self.capacity
+        arrays = (self.obs, self.actions, self.rewards, self.next_obs, self.dones, self.discounts)
+        start = 0
+        while start < k:
+            position = (self.position + start) % self.capacity
+            end = min(k, start + self.capacity - position)
+            for array, values in zip(arrays, fields):
+                array[position:position + end - start] = values[start:end]
+            start = end
+        indices = (self.position + np.arange(k)) % self.capacity
+        if self.prioritized:
+            self.tree.update(indices, np.full(k, self.max_priority ** self.alpha))
+        self.position = (self.position + k) % self.capacity
+        self.size = min(self.size + k, self.capacity)
+        return indices
+
+    def _flush(self, window, count):
+        # stores the first `count` transitions of an n-step window
+        gamma = self.discount_factor
+        obs, actions, rewards, next_obs, dones, discounts = [], [], [], [], [], []
+        for start in range(count):
+            reward, discount = 0.0, 1.0
+            for o, a, r, n, d in window[start:]:
+                reward += discount * r
+                discount *= gamma
+                if d:
+                    break
+            obs.append(window[start][0])
+            actions.append(window[start][1])
+            rewards.append(reward)
+            next_obs.append(n)
+            dones.append(d)
+            discounts.append(discount)
+        self._store(np.array(obs), np.array(actions), np.array(rewards), np.array(next_obs),
+                    np.array(dones), np.array(discounts))
+        del window[:count]
+
+    def add(self, obs, action, reward, next_obs, done, stream=0):
+        if self.n_step == 1:
+            self._store(np.asarray(obs)[None], np.array([action]), np.array([reward]), np.asarray(next_obs)[None],
+                        np.array([done]), np.array([self.discount_factor]))
+            return
+        window = self._windows.setdefault(stream, [])
+        # observations can be read-only views rewritten by the environment: keep copies
+        window.append((np.array(obs), action, reward, np.array(next_obs), done))
+        if done:
+            self._flush(window, len(window))
+        elif len(window) == self.n_step:
+            self._flush(window, 1)
+
+    def add_batch(self, obs, actions, rewards, next_obs, dones):
+        # one transition per environment (row i = environment i, used as n-step stream)
+        if self.n_step == 1:
+            k = len(actions)
+            self._store(obs, actions, rewards, next_obs, dones, np.full(k, self.discount_factor))
+            return
+        for i in range(len(actions)):
+            self.add(obs[i], actions[i], rewards[i], next_obs[i], dones[i], stream=i)
+
+    ##################### sampling #####################
+
+    def sample(self, batch_size):
+        assert self.size > 0, "empty replay buffer"
+        if self.prioritized:
+            # one value per segment of the total priority (stratified sampling)
+            total = self.tree.total
+            values = (np.arange(batch_size) + self.rng.random(batch_size)) * (total / batch_size)
+            indices = np.minimum(self.tree.find(np.minimum(values, total * (1 - 1e-12))), self.size - 1)
+            probabilities = self.tree.get(indices) / total
+            weights = (self.size * probabilities) ** -self.beta
+            weights /= weights.max()
+        else:
+            indices = self.rng.integers(0, self.size, size=batch_size)
+        batch = self._gather(indices)
+        if self.prioritized:
+            batch['indices'] = indices
+            batch['weights'] = weights.astype(np.float32)
+        return batch
+
+    def _gather(self, indices):
+        return {
+            'obs': self.obs[indices],
+            'actions': self.actions[indices],
+            'rewards': self.rewards[indices],
+            'next_obs': self.next_obs[indices],
+            'dones': self.dones[indices],
+            'discounts': self.discounts[indices],
+        }
+
+    def update_priorities(self, indices, priorities):
+        # priorities: e.g. absolute TD errors of the sampled transitions
+        priorities = np.abs(priorities) + self.priority_eps
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.tree.update(indices, priorities ** self.alpha)
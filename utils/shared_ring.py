@@ -0,0 +1,187 @@
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Transport between processes through multiprocessing.shared_memory, without pickling:
+#   SharedRing   one producer -> one consumer ring of fixed-size records (transitions)
+#   SharedTable  one writer -> many readers array (Q-table broadcast), versioned like a seqlock
+# The creator (create=True) owns the block and unlinks it; the other processes attach to it
+# from its spec (plain tuple, cheap to send to a multiprocessing.Process).
+
+ALIGN = 64 # each array starts on its own cache line
+
+# SharedRing header (int64): positions are counters that only grow, slot = position % capacity
+WRITE, READ, CLOSED, STALLS, BLOCKED_NS, VERSION = range(6)
+HEADER_SIZE = 8
+
+
+def _layout(capacity, fields):
+    # offsets of the header and of one array per field in the block, and its total size
+    offsets = {}
+    size = HEADER_SIZE * 8
+    for name, (dtype, shape) in fields.items():
+        size = -(-size // ALIGN) * ALIGN
+        offsets[name] = size
+        size += capacity * int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize
+    return offsets, max(size, 1)
+
+
+class SharedRing:
+    # fields: {name: (dtype, shape of one record)}, e.g. {'state': (np.int64, ()), 'reward': (np.float32, ())}
+    # The producer writes the records, then publishes the new write position; the consumer reads
+    # up to it, then publishes its read position: no lock, one producer and one consumer only.
+    # Backpressure: put() waits while the ring is full (counted in stalls / blocked_ns).
+    # Spare header slots: VERSION (e.g. version of the policy used by the producer).
+    def __init__(self, capacity, fields, name=None, create=True):
+        self.capacity = capacity
+        self.fields = {key: (np.dtype(dtype), tuple(shape)) for key, (dtype, shape) in fields.items()}
+        offsets, size = _layout(capacity, self.fields)
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        self.owner = create
+        self.header = np.ndarray(HEADER_SIZE, dtype=np.int64, buffer=self.shm.buf)
+        if create:
+            self.header[:] = 0
+        self.arrays = {key: np.ndarray((capacity,) + shape, dtype=dtype, buffer=self.shm.buf, offset=offsets[key])
+                       for key, (dtype, shape) in self.fields.items()}
+
+    @property
+    def spec(self):
+        return (self.shm.name, self.capacity, {key: (dtype.str, shape) for key, (dtype, shape) in self.fields.items()})
+
+    @classmethod
+    def attach(cls, spec):
+        name, capacity, fields = spec
+        return cls(capacity, fields, name=name, create=False)
+
+    def __len__(self):
+        return int(self.header[WRITE] - self.header[READ])
+
+    @property
+    def closed(self):
+        return bool(self.header[CLOSED])
+
+    def close_writer(self):
+        # no more records: the consumer drains what is left
+        self.header[CLOSED] = 1
+
+    ##################### producer #####################
+
+    def put(self, records, timeout=None, poll=1e-4):
+        # writes a batch of records (dict of arrays of equal length <= capacity), waiting for room;
+        # returns False on timeout
+        n = len(next(iter(records.values())))
+        assert n <= self.capacity
+        write = int(self.header[WRITE])
+        if write + n - self.header[READ] > self.capacity:
+            start = time.perf_counter()
+            self.header[STALLS] += 1
+            while write + n - self.header[READ] > self.capacity:
+                if timeout is not None and time.perf_counter() - start > timeout:
+                    self.header[BLOCKED_NS] += int(1e9 * (time.perf_counter() - start))
+                    return False
+                time.sleep(poll)
+            self.header[BLOCKED_NS] += int(1e9 * (time.perf_counter() - start))
+        # at most two contiguous slices
+        done = 0
+        while done < n:
+            slot = (write + done) % self.capacity
+            end = min(n, done + self.capacity - slot)
+            for key, array in self.arrays.items():
+                array[slot:slot + end - done] = records[key][done:end]
+            done = end
+        self.header[WRITE] = write + n # published once the records are written
+        return True
+
+    ##################### consumer #####################
+
+    def get(self, max_items):
+        # up to max_items records (copies), None if the ring is empty
+        read = int(self.header[READ])
+        n = min(int(self.header[WRITE]) - read, max_items)
+        if n <= 0:
+            return None
+        slot = read % self.capacity
+        if slot + n <= self.capacity:
+            batch = {key: array[slot:slot + n].copy() for key, array in self.arrays.items()}
+        else:
+            order = (read + np.arange(n)) % self.capacity
+            batch = {key: array[order] for key, array in self.arrays.items()}
+        self.header[READ] = read + n # the slots can be overwritten
+        return batch
+
+    ##################### cleanup #####################
+
+    def close(self):
+        # drop the numpy views before closing the mapping
+        self.header = None
+        self.arrays = {}
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SharedTable:
+    # array published by one process, read by others: the version is odd while the writer copies,
+    # readers copy then check the version did not move (otherwise they retry)
+    def __init__(self, shape, dtype=np.float64, name=None, create=True):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        size = ALIGN + int(np.prod(self.shape, dtype=np.int64)) * self.dtype.itemsize
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        self.owner = create
+        # version, stop flag
+        self.header = np.ndarray(2, dtype=np.int64, buffer=self.shm.buf)
+        if create:
+            self.header[:] = 0
+        self.values = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf, offset=ALIGN)
+
+    @property
+    def spec(self):
+        return (self.shm.name, self.shape, self.dtype.str)
+
+    @classmethod
+    def attach(cls, spec):
+        name, shape, dtype = spec
+        return cls(shape, dtype, name=name, create=False)
+
+    @property
+    def version(self):
+        return int(self.header[0]) // 2
+
+    @property
+    def stopped(self):
+        return bool(self.header[1])
+
+    def stop(self):
+        self.header[1] = 1
+
+    def publish(self, values):
+        self.header[0] += 1
+        self.values[...] = values
+        self.header[0] += 1
+        return self.version
+
+    def fetch(self, known_version=-1, out=None):
+        # (copy of the values, version) if a newer version than known_version was published, else None
+        while True:
+            version = int(self.header[0])
+            if version // 2 == known_version or version == 0:
+                return None
+            if version % 2:
+                time.sleep(0)
+                continue
+            if out is None:
+                values = self.values.copy()
+            else:
+                np.copyto(out, self.values)
+                values = out
+            if int(self.header[0]) == version:
+                return values, version // 2
+
+    def close(self):
+        self.header = None
+        self.values = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()